@@ -7,6 +7,23 @@ Enable or disable debug mode
 
 PORT = 5005
 
+WORKERS = 1
+"""
+Number of worker processes. With more than one, supervisor starts workers
+sharing the port with SO_REUSEPORT, each of them has its own client pool,
+channel pool and broker connection. Overridden by `--workers`.
+"""
+
+WORKER_HEALTH_INTERVAL = 5
+"""
+Seconds between worker health reports to supervisor
+"""
+
+WORKER_HEALTH_TIMEOUT = 30
+"""
+Worker silent for longer than this is killed and restarted
+"""
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': True,
@@ -43,9 +60,17 @@ SECURE_PROXY_SSL_HEADER = ('X-Forwarded-Proto', 'https')
 CHANNELS = {
     'ping': {
         'driver': 'adsocket.core.channels.Channel',
-        'on_startup': False,
+        'create_on_startup': False,
     },
 }
+"""
+Channel types. Options other than `driver` and `create_on_startup` are passed
+to the channel, e.g. `history_size` and `history_max_bytes` to keep recent
+messages for clients subscribing with `since_seq`, or `conflate_key` and
+`conflate_interval` to send only the newest message per key every interval.
+With `patterns` set to True channels of the type can be subscribed by id
+prefix, e.g. `order:eu-*`
+"""
 
 WEBSOCKET_ACTIONS = (
     ('authenticate', 'adsocket.ws.actions.AuthenticateAction'),
@@ -62,9 +87,207 @@ BROKER = {
     'driver': 'adsocket.core.broker.redis.RedisBroker',
     'host': REDIS_HOST,
     'db': REDIS_DB,
-    'channels': ['adsocket']
+    'channels': ['adsocket'],
+    'subscription': 'static',
+    'prefix': '',
+    'codec': 'json',
+}
+"""
+With `subscription` set to `channel` (or `type`) redis broker subscribes to
+`<prefix><type>:<id>` channel (or `<prefix><type>:*` pattern) only while there
+is such channel on this node, so the node receives only messages its clients
+are interested in. Redis channels in `channels` are subscribed always.
+
+Messages published by clients are written to `<prefix><type>:<id>` redis
+channel, or with `static` subscription to `write_channel` (the first of
+`channels` by default). Writes made during one loop iteration are sent in
+single pipeline over connection opened by the broker just for writes, the
+subscribing connection can not publish.
+Redis streams broker adds them to `write_stream` (the first of `streams`).
+
+Single node deployments may use `adsocket.core.broker.local.LocalBroker`
+instead, which needs no redis. Options: `socket_path` (UNIX socket to accept
+length prefixed frames on), `socket_mode`, `max_frame_size` and `codec`.
+"""
+
+NODE_ID = None
+"""
+Identifies this node in messages it writes to broker, so it can skip them
+when broker delivers them back. Random id is generated if None. Process id
+is appended, so every worker gets its own origin id.
+"""
+
+BROKER_INGESTION = {
+    'workers': 4,
+    'queue_size': 10000,
+    'batch_size': 100,
+    'overflow': 'block',
 }
+"""
+Broker reader only decodes and queues messages, `workers` tasks ventilate them
+in batches of up to `batch_size`. Messages of the same adsocket channel are
+handled by the same worker so their order is kept. When queue of `queue_size`
+is full the reader either waits (`block`) or the message is dropped (`drop`).
+"""
+
+WEBSOCKET_COMPRESSION = {
+    'enabled': True,
+    'no_context_takeover': True,
+    'level': 6,
+    'threshold': 256,
+}
+"""
+permessage-deflate. With `no_context_takeover` every message is compressed
+on its own, so the compressed frame is built once and shared by all clients
+which negotiated the same window size. Payloads smaller than `threshold`
+bytes are sent uncompressed. Without `no_context_takeover` each socket
+compresses on its own.
+"""
+
+JSON_CODEC = 'auto'
+"""
+JSON implementation: `auto` uses orjson when it's installed, `json` standard
+library, `orjson`
+"""
+
+WEBSOCKET_SUBPROTOCOLS = {
+    'adsocket.json': 'json',
+    'adsocket.msgpack': 'msgpack',
+}
+"""
+Websocket subprotocols offered to clients and codec each of them selects.
+Subprotocols whose codec is not installed are not offered.
+"""
+
+PERMISSION_CACHE = {
+    'max_size': 100000,
+    'ttl': 30,
+}
+"""
+Join decisions of permissions marked as `cacheable` are cached by channel,
+client identity and permission class. Use
+`adsocket.core.permissions.permission_cache.invalidate()` when they change.
+"""
+
+SUBSCRIBE = {
+    'concurrency': 10,
+    'max_channels': 100,
+}
+"""
+Channels of one subscribe message are joined `concurrency` at once, message
+with more than `max_channels` channels is refused
+"""
 
 AUTHENTICATION_CLASSES = []
 
+AUTHENTICATION_CACHE = {
+    'enabled': False,
+    'ttl': 300,
+    'negative_ttl': 5,
+    'max_size': 100000,
+}
+"""
+When `enabled` authentication results are cached by `cache_key()` of the
+authenticators (all of authenticate message data by default), successful
+ones for `ttl` seconds, failed ones for `negative_ttl`. Enable it only for
+authenticators whose result depends on nothing but their cache key.
+"""
+
 DISCONNECT_UNAUTHENTICATED = False
+"""
+Seconds given to client to authenticate, unauthenticated client is kicked
+out afterwards. `False` keeps unauthenticated clients connected.
+"""
+
+HEARTBEAT_INTERVAL = 5.0
+"""
+Clients are pinged every this many seconds, client which does not answer
+until the next ping is disconnected. `None` turns heartbeat off.
+"""
+
+BROADCAST = {
+    'channel': '_system:broadcast',
+    'chunk_size': 1000,
+    'concurrency': 1,
+}
+"""
+Message published by broker to reserved `channel` is delivered to every
+client connected to the node. Clients are visited `chunk_size` at a time and
+the loop is free to do other work between chunks. At most `concurrency`
+broadcasts are delivered at once.
+"""
+
+DRAIN = {
+    'timeout': 30,
+    'concurrency': 500,
+    'report_interval': 1.0,
+}
+"""
+On shutdown (or `POST /_admin/drain`) node stops accepting connections,
+flushes send queues of connected clients and closes them, `concurrency` at
+once, giving up after `timeout` seconds. Progress is logged every
+`report_interval` seconds.
+"""
+
+CHANNEL_REMOVAL_DELAY = 12
+"""
+Seconds empty channel is kept around before it's removed, so client
+reconnecting right away finds it (and its history) still there
+"""
+
+TIMER_WHEEL = {
+    'resolution': 1.0,
+    'slots': 512,
+}
+"""
+Deadlines above (and other coarse timeouts) are kept in hashed timing wheel
+moving by one of `slots` buckets every `resolution` seconds. They fire up to
+`resolution` late.
+"""
+
+SLOW_COMMAND_THRESHOLD = 0.1
+"""
+Commands running longer than this many seconds are logged as slow and
+counted in `adsocket_slow_commands_total`. `None` turns it off.
+"""
+
+ADMIN_TOKEN = None
+"""
+Token expected in `Authorization: Bearer <token>` header by admin endpoints
+(`/_admin/profiler`, `/_admin/drain`). Admin endpoints are not available
+without it.
+"""
+
+RATE_LIMIT = {
+    'enabled': False,
+    'messages': {'rate': 100, 'burst': 200},
+    'bytes': {'rate': 256 * 1024, 'burst': 1024 * 1024},
+    'commands': {
+        'authenticate': {'rate': 1, 'burst': 5},
+        'subscribe': {'rate': 20, 'burst': 100},
+        'publish': {'rate': 50, 'burst': 100},
+    },
+    'max_message_size': 4 * 1024 * 1024,
+    'max_violations': 20,
+}
+"""
+Token buckets limiting inbound messages of every connection: `messages` per
+second, `bytes` per second and separately every command listed in `commands`.
+`burst` is how much can be sent at once after being idle. Client over the
+limit is not read from until it's within the limit again. Once `max_violations`
+messages in a row were throttled the connection is closed with 1008 (policy
+violation). Frames bigger than `max_message_size` bytes close the connection
+with 1009 (message too big) even if rate limiting is not `enabled`. Rate
+limiting is off and `max_message_size` is aiohttp's default by default, the
+budgets above are a starting point once it's enabled.
+"""
+
+CLIENT_SEND_QUEUE = {
+    'size': 1000,
+    'policy': 'drop_oldest',
+}
+"""
+Every client has bounded queue of outgoing frames. Once `size` frames are
+waiting one of the policies applies: `drop_oldest`, `drop_newest` or
+`disconnect`
+"""
@@ -1,14 +1,22 @@
 import asyncio
+import os
+import uuid
+
 from aiohttp import web
-import aioredis
 
 from .logging_setup import setup_logging
 from adsocket.ws import ws_handler, http_handler
-from adsocket.http_handlers import ping_handler
+from adsocket.http_handlers import ping_handler, metrics_handler, \
+    profiler_handler, drain_handler
 from adsocket import conf, banner
 from .broker import load_broker
 from .auth import initialize_authentication
 from .channels import initialize_channels
+from .codecs import codecs
+from .permissions import permission_cache
+from .ratelimit import RateLimitPolicy
+from .timers import TimerWheel
+from .utils import import_module
 from ..ws.client import ClientPool
 from .commands import commander
 
@@ -21,6 +29,8 @@ async def _initialize_redis(app):
     :param aiohttp.web.Application app: Application instance
     :return aiohttp.web.Application: Application instance
     """
+    import aioredis
+
     settings = app['settings']
     pool = await aioredis.create_pool(
         settings.REDIS_HOST,
@@ -33,14 +43,18 @@ async def _initialize_redis(app):
 
 async def _on_shutdown(app):
     """
+    Clients are drained first, broker goes last so messages keep flowing
+    to clients until they are disconnected
 
     :param aiohttp.web.Application app: aiohttp Application instance
     :return:
     """
-    await app['broker'].close(app)
     await app['client_pool'].shutdown(app)
-    app['redis'].close()
-    await app['redis'].wait_closed()
+    await app['broker'].close(app)
+    if 'redis' in app:
+        app['redis'].close()
+        await app['redis'].wait_closed()
+    app['timers'].close()
 
 
 def factory(loop):
@@ -54,17 +68,29 @@ def factory(loop):
 
     app['settings'] = settings
     app['loop'] = loop
+    app['draining'] = False
+    # workers share settings, but each must recognize only its own messages
+    app['node_id'] = f"{settings.NODE_ID or uuid.uuid4().hex}:{os.getpid()}"
+    codecs.configure(settings.JSON_CODEC, settings.WEBSOCKET_SUBPROTOCOLS)
+    permission_cache.configure(**settings.PERMISSION_CACHE)
+    app['rate_limit'] = RateLimitPolicy(**settings.RATE_LIMIT)
     # Backward compatibility only
     app.router.add_get('/ws', ws_handler)
     # This is intended
     app.router.add_get('/', ws_handler)
     app.router.add_get('/_ping', ping_handler)
+    app.router.add_get('/_metrics', metrics_handler)
+    if settings.ADMIN_TOKEN:
+        app.router.add_route('*', '/_admin/profiler', profiler_handler)
+        app.router.add_post('/_admin/drain', drain_handler)
     setup_logging(app['settings'].LOGGING)
+    app['timers'] = TimerWheel(loop, **settings.TIMER_WHEEL)
     app['client_pool'] = ClientPool(app)
     asyncio.ensure_future(load_broker(app))
     asyncio.ensure_future(initialize_channels(app))
     asyncio.ensure_future(initialize_authentication(app))
-    loop.run_until_complete(_initialize_redis(app))
+    if import_module(settings.BROKER['driver']).requires_redis:
+        loop.run_until_complete(_initialize_redis(app))
     app.on_shutdown.append(_on_shutdown)
     # we also need commander to have control over the commands
     commander.set_app(app)
@@ -1,6 +1,6 @@
+import json
 import logging
 from abc import ABC, abstractmethod
-from aioredis import RedisError
 
 from adsocket.core.exceptions import AuthenticationException
 from adsocket.core.message import Message
@@ -28,6 +28,31 @@ class AbstractAuth(ABC):
         :return:
         """
 
+    def cache_key(self, message):
+        """
+        What the result of authentication depends on, authentication cache
+        (`AUTHENTICATION_CACHE`) reuses results only for messages with equal
+        key. All of message data by default, authenticator may narrow it
+        (e.g. just the token) or return None to never be cached.
+
+        :param Message message: authenticate message
+        :return str: cache key or None
+        """
+        if not isinstance(message.data, dict):
+            return None
+        return json.dumps(message.data, sort_keys=True, default=str)
+
+    async def restore(self, client, data):
+        """
+        Called instead of :meth:`authenticate` when result comes from
+        authentication cache. Profile and items set on the client by
+        :meth:`authenticate` are restored already, authenticator may
+        restore anything else here.
+
+        :param client: client being authenticated
+        :param data: profile data returned by :meth:`authenticate`
+        """
+
 
 class UsernamePasswordAuth(AbstractAuth):
 
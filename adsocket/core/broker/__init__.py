@@ -4,6 +4,8 @@ import asyncio
 from adsocket.core.utils import import_module
 from adsocket.core.message import Message
 from adsocket.core.exceptions import InvalidChannelException, ChannelNotFoundException
+from adsocket.core.signals import new_broker_message
+from .ventilator import Ventilator
 
 _logger = logging.getLogger(__name__)
 
@@ -11,8 +13,97 @@ _logger = logging.getLogger(__name__)
 class Broker(ABC):
 
     _app = None
+    _ventilator = None
+    codec = None
+    requires_redis = False
+    """
+    Application opens shared redis pool (`app['redis']`) only for brokers
+    which need redis anyway
+    """
+
+    def decode(self, payload, key=None) -> Message:
+        """
+        Turn broker payload into message using broker's codec
+
+        :param bytes payload: raw payload
+        :param key: where the payload came from (e.g. redis channel)
+        :return Message:
+        """
+        return Message.from_json(self.codec.decode(payload))
+
+    def encode(self, message: Message):
+        """
+        Turn message published by client into broker payload. Payload
+        carries id of this node, so the node can skip the message once
+        broker delivers it back.
+
+        :param Message message: message to write
+        :return bytes|str:
+        """
+        return self.codec.encode({
+            'type': message.type,
+            'data': message.data,
+            'channel': message.channel,
+            'origin': self.node_id,
+        })
+
+    @property
+    def node_id(self):
+        return self.app['node_id']
+
+    def start_ingestion(self, **options):
+        """
+        Start ventilator workers, see :class:`Ventilator` for options
+        """
+        self._ventilator = Ventilator(self, **options)
+        self._ventilator.start()
+
+    def stop_ingestion(self):
+        if self._ventilator is not None:
+            self._ventilator.stop()
+
+    async def feed(self, key, payload, done=None):
+        """
+        Hand over payload read from broker. Returns as soon as the payload is
+        queued unless the queue is full and overflow policy is to block.
+
+        :param key: where the payload came from (e.g. redis channel)
+        :param payload: raw payload
+        :param callable done: called without arguments once the payload is
+            handled - dispatched, found undecodable or dropped
+        :return bool: False if payload was dropped
+        """
+        if self._ventilator is not None:
+            return await self._ventilator.put(key, payload, done)
+        try:
+            await self.dispatch(self.decode(payload, key))
+        finally:
+            if done is not None:
+                done()
+        return True
+
+    async def dispatch(self, message: Message):
+        if message.kwargs.get('origin') == self.node_id:
+            # published by client of this node, delivered already
+            return
+        await self.ventilate(message)
+        if new_broker_message.has_receivers():
+            self.app.loop.create_task(
+                new_broker_message.send(message=message))
+
+    @property
+    def broadcast_channel(self):
+        """
+        Reserved channel uid, messages published there are delivered to all
+        clients of the node
+        """
+        return self.app['settings'].BROADCAST['channel']
 
     async def ventilate(self, message: Message):
+        if message.channel == self.broadcast_channel:
+            # may take a while on big node, ventilation must go on
+            asyncio.ensure_future(self.app['client_pool'].broadcast(message))
+            return
         try:
             await self.app['channels'].publish(message)
         except InvalidChannelException as e:
@@ -22,13 +113,37 @@ class Broker(ABC):
         except ChannelNotFoundException:
             pass
 
+    async def channel_created(self, channel):
+        """
+        Called by channel pool once new channel is created on this node.
+        Brokers able to subscribe by interest start receiving messages
+        for the channel here.
+
+        :param adsocket.core.channels.Channel channel: channel instance
+        :return void:
+        """
+
+    async def channel_removed(self, channel):
+        """
+        Called by channel pool once channel is removed from this node
+
+        :param adsocket.core.channels.Channel channel: channel instance
+        :return void:
+        """
+
     @abstractmethod
     def read(self):
         pass
 
     @abstractmethod
     def write(self, msg: Message):
-        pass
+        """
+        Publish message to other nodes. Message is already delivered
+        to local clients.
+
+        :param Message msg: message published by client
+        :return void:
+        """
 
     @abstractmethod
     async def close(self, app):
@@ -44,6 +159,7 @@ async def load_broker(app):
     params['loop'] = app['loop']
     params['app'] = app
     broker = broker_class(**params)
+    broker.start_ingestion(**app['settings'].BROKER_INGESTION)
     # await broker.read()
     app['broker'] = broker
     app.loop.create_task(app['broker'].read())
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+import stat
+import struct
+
+from . import Broker
+from adsocket.core.codecs import codecs
+from adsocket.core.message import Message
+
+_logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('!I')
+
+
+def frame(payload: bytes) -> bytes:
+    """
+    Build frame for the socket ingest: 4 bytes big-endian payload length
+    followed by the payload encoded with broker's codec
+
+    :param bytes payload: encoded message
+    :return bytes:
+    """
+    return _HEADER.pack(len(payload)) + payload
+
+
+class LocalBroker(Broker):
+    """
+    Broker for single node deployments, no redis needed.
+
+    Code running in the same process publishes with :meth:`publish`, message
+    objects go straight to ventilation queues and are never encoded or
+    decoded. With `socket_path` broker listens on UNIX domain socket too,
+    application on the same box writes length prefixed frames there (see
+    :func:`frame`). Ingest does not read from connection while ventilation
+    queue is full, so a fast producer is slowed down instead of flooding
+    the node.
+    """
+
+    loop = None
+    app = None
+
+    def __init__(self, loop, app, socket_path=None, socket_mode=0o660,
+                 max_frame_size=1024 * 1024, codec='json'):
+        self.loop = loop
+        self.app = app
+        self.codec = codecs.get(codec)
+        self._socket_path = socket_path
+        self._socket_mode = socket_mode
+        self._max_frame_size = max_frame_size
+        self._server = None
+        self._connections = 0
+
+    async def publish(self, message):
+        """
+        Publish message from within the process
+
+        :param Message|dict message: message or dict as sent by broker
+        :return bool: False if message was dropped by ingestion overflow
+        """
+        if not isinstance(message, Message):
+            message = Message.from_json(dict(message))
+        return await self.feed(message.channel, message)
+
+    def decode(self, payload, key=None) -> Message:
+        if isinstance(payload, Message):
+            return payload
+        return super().decode(payload, key)
+
+    async def read(self):
+        if not self._socket_path:
+            return
+        self._remove_socket()
+        self._server = await asyncio.start_unix_server(
+            self._handle_connection, path=self._socket_path)
+        os.chmod(self._socket_path, self._socket_mode)
+        _logger.info(f"Waiting for messages on {self._socket_path}")
+
+    async def _handle_connection(self, reader, writer):
+        # messages of one channel go to the same ventilator worker, so what
+        # single producer writes into a channel is ventilated in its order,
+        # connection number only tells where the payload came from
+        self._connections += 1
+        key = self._connections
+        try:
+            while True:
+                header = await reader.readexactly(_HEADER.size)
+                size, = _HEADER.unpack(header)
+                if size > self._max_frame_size:
+                    _logger.error(f"Frame of {size} bytes exceeds "
+                                  f"{self._max_frame_size}, closing ingest "
+                                  f"connection")
+                    break
+                await self.feed(key, await reader.readexactly(size))
+        except asyncio.IncompleteReadError:
+            pass
+        except ConnectionError as e:
+            _logger.error(f"Ingest connection failed: {e}")
+        finally:
+            writer.close()
+
+    def _remove_socket(self):
+        """
+        Remove socket file left behind by previous process
+        """
+        try:
+            if stat.S_ISSOCK(os.stat(self._socket_path).st_mode):
+                os.unlink(self._socket_path)
+        except FileNotFoundError:
+            pass
+
+    async def write(self, message):
+        # single node, message was delivered to local clients already
+        pass
+
+    async def close(self, app):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            self._remove_socket()
+        self.stop_ingestion()
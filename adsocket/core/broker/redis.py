@@ -1,32 +1,47 @@
 import asyncio
-import json
 import logging
 
 from aioredis.pubsub import Receiver
 import aioredis
 
-from adsocket.core.signals import new_broker_message
 from . import Broker
+from .writer import BatchWriter
+from adsocket.core.codecs import codecs
+from adsocket.core.exceptions import InvalidChannelException
 from adsocket.core.message import Message
 
 _logger = logging.getLogger(__name__)
 
+STATIC = 'static'
+"""
+Subscribe only to redis channels listed in `channels`
+"""
+CHANNEL = 'channel'
+"""
+Subscribe to `<prefix><type>:<id>` redis channel for every local channel,
+pattern channels are subscribed with `<prefix><type>:<id prefix>*` pattern
+"""
+TYPE = 'type'
+"""
+Subscribe to `<prefix><type>:*` pattern for every channel type having
+at least one local channel
+"""
 
-class RedisBroker(Broker):
+SUBSCRIPTION_MODES = (STATIC, CHANNEL, TYPE)
+
+
+class RedisConnection:
+    """
+    Connections of redis brokers: one for reading, which is busy subscribing
+    or blocked in XREAD, and another one for writes. Broker sets `_host` and
+    `_db`.
+    """
 
     _redis = None
+    _publisher = None
+    _host = None
     _db = None
-    _subscribe = None
-    loop = None
-    _channels = None
-    app = None
-
-    def __init__(self, host, db, loop, app, channels):
-        self._host = host
-        self._db = db
-        self.loop = loop
-        self.app = app
-        self._channels = channels
+    requires_redis = True
 
     @property
     async def redis(self):
@@ -39,37 +54,203 @@ class RedisBroker(Broker):
             _logger.info("Connection to redis seems to be solid")
         return self._redis
 
+    @property
+    async def publisher(self):
+        """
+        Connection for writes
+        """
+        if not self._publisher:
+            redis = await aioredis.create_redis(self._host)
+            await redis.select(self._db)
+            self._publisher = redis
+        return self._publisher
+
+    def _drop_connection(self):
+        if self._redis is not None:
+            self._redis.close()
+            self._redis = None
+
+    def _drop_publisher(self):
+        if self._publisher is not None:
+            self._publisher.close()
+            self._publisher = None
+
+
+class RedisBroker(RedisConnection, Broker):
+
+    _subscribe = None
+    loop = None
+    _channels = None
+    app = None
+
+    def __init__(self, host, db, loop, app, channels=(),
+                 subscription=STATIC, prefix='', codec='json',
+                 write_channel=None):
+        if subscription not in SUBSCRIPTION_MODES:
+            raise RuntimeError(f"Unknown subscription mode {subscription}. "
+                               f"Choose one of {SUBSCRIPTION_MODES}")
+        self._host = host
+        self._db = db
+        self.loop = loop
+        self.app = app
+        self._channels = channels
+        self._subscription = subscription
+        self._prefix = prefix
+        self._type_refs = {}
+        self.codec = codecs.get(codec)
+        self._lock = asyncio.Lock()
+        self._write_channel = write_channel or \
+            (channels[0] if channels else None)
+        self._writer = BatchWriter(self._flush)
+
     @property
     async def subscribe(self):
-        if not self._subscribe:
-            redis = await self.redis
-            # self._subscribe = await redis.subscribe('ws')
-            r = Receiver(loop=self.loop)
-            for ch in self._channels:
-                await redis.subscribe(r.channel(ch))
-            self._subscribe = r
+        async with self._lock:
+            if not self._subscribe:
+                redis = await self.redis
+                # receiver must keep going even if there is no
+                # subscription left, channels come and go
+                r = Receiver(loop=self.loop, on_close=self._on_close)
+                for ch in self._channels:
+                    await redis.subscribe(r.channel(ch))
+                if self._subscription != STATIC:
+                    # broadcasts reach every node no matter its channels
+                    name = f"{self._prefix}{self.broadcast_channel}"
+                    await redis.subscribe(r.channel(name))
+                self._subscribe = r
         return self._subscribe
 
+    def _on_close(self, channel, exc=None):
+        pass
+
+    async def channel_created(self, channel):
+        if self._subscription == STATIC:
+            return
+        receiver = await self.subscribe
+        redis = await self.redis
+        if self._subscription == CHANNEL:
+            name = f"{self._prefix}{channel.uid}"
+            if channel.is_pattern:
+                await redis.psubscribe(receiver.pattern(name))
+            else:
+                await redis.subscribe(receiver.channel(name))
+            _logger.debug(f"Subscribed to {name}")
+            return
+
+        refs = self._type_refs.get(channel.type, 0)
+        self._type_refs[channel.type] = refs + 1
+        if not refs:
+            pattern = f"{self._prefix}{channel.type}:*"
+            await redis.psubscribe(receiver.pattern(pattern))
+            _logger.debug(f"Subscribed to pattern {pattern}")
+
+    async def channel_removed(self, channel):
+        if self._subscription == STATIC:
+            return
+        redis = await self.redis
+        if self._subscription == CHANNEL:
+            name = f"{self._prefix}{channel.uid}"
+            if channel.is_pattern:
+                await redis.punsubscribe(name)
+            else:
+                await redis.unsubscribe(name)
+            _logger.debug(f"Unsubscribed from {name}")
+            return
+
+        refs = self._type_refs.get(channel.type, 0) - 1
+        if refs > 0:
+            self._type_refs[channel.type] = refs
+            return
+        self._type_refs.pop(channel.type, None)
+        pattern = f"{self._prefix}{channel.type}:*"
+        await redis.punsubscribe(pattern)
+        _logger.debug(f"Unsubscribed from pattern {pattern}")
+
     async def read(self):
         _logger.info("Waiting for messages")
         sub = await self.subscribe
         async for channel, msg in sub.iter():
-            _logger.info("New message")
-            msg = json.loads(msg)
-            msg = Message.from_json(msg)
-            await self.ventilate(msg)
-            self.app.loop.create_task(new_broker_message.send(message=msg))
-            # asyncio.ensure_future(new_broker_message.send(message=msg))
+            if channel.is_pattern:
+                pattern = channel.name
+                channel, msg = msg
+                if not self._accept_pattern_message(pattern, channel):
+                    continue
+            else:
+                channel = channel.name
+            await self.feed(channel, msg)
         _logger.info("No longer receiving messages from redis")
 
+    def _accept_pattern_message(self, pattern, name):
+        """
+        Redis delivers one publish once for every subscription matching it,
+        but channel pool already hands message to the channel and all its
+        local patterns. Only the copy for the longest matching pattern is
+        taken, unless the channel itself is subscribed.
+
+        :param bytes pattern: redis pattern the message came through
+        :param bytes name: redis channel name
+        :return bool:
+        """
+        if self._subscription != CHANNEL:
+            return True
+        uid = self._channel_from_name(name)
+        pool = self.app['channels']
+        if uid is None or pool.has_uid(uid):
+            return False
+        try:
+            patterns = pool.match_patterns(uid)
+        except InvalidChannelException:
+            return False
+        return bool(patterns) and \
+            pattern.decode() == f"{self._prefix}{patterns[-1].uid}"
+
+    def decode(self, payload, key=None):
+        msg = self.codec.decode(payload)
+        if 'channel' not in msg:
+            msg['channel'] = self._channel_from_name(key)
+        return Message.from_json(msg)
+
+    def _channel_from_name(self, name):
+        """
+        With interest based subscriptions redis channel name already tells
+        which adsocket channel the message belongs to
+
+        :param bytes name: redis channel name
+        :return str: channel uid or None
+        """
+        name = name.decode()
+        if self._subscription == STATIC or name in self._channels:
+            return None
+        return name[len(self._prefix):]
+
     async def get_authentication_credentials(self, key):
         redis = await self.redis
         return redis.get(key)
 
     async def write(self, message):
-        pass
+        if self._subscription == STATIC:
+            if self._write_channel is None:
+                raise RuntimeError("Redis broker has no channel to write to")
+            name = self._write_channel
+        else:
+            name = f"{self._prefix}{message.channel}"
+        self._writer.write((name, self.encode(message)))
+
+    async def _flush(self, batch):
+        redis = await self.publisher
+        pipe = redis.pipeline()
+        for name, payload in batch:
+            pipe.publish(name, payload)
+        try:
+            await pipe.execute()
+        except (aioredis.RedisError, OSError):
+            self._drop_publisher()
+            raise
 
     async def close(self, app):
+        self.stop_ingestion()
+        await self._writer.close()
+        self._drop_publisher()
         redis = await self.redis
         redis.close()
         await redis.wait_closed()
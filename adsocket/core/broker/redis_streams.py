@@ -0,0 +1,186 @@
+import asyncio
+import collections
+import functools
+import logging
+
+import aioredis
+
+from . import Broker
+from .redis import RedisConnection
+from .writer import BatchWriter
+from adsocket.core.codecs import codecs
+
+_logger = logging.getLogger(__name__)
+
+LATEST = '$'
+
+
+class RedisStreamsBroker(RedisConnection, Broker):
+    """
+    Broker reading messages from redis streams.
+
+    Unlike pub/sub nothing is lost while the connection is down. Broker
+    remembers ID of the last entry of every stream read and after reconnect
+    continues right after it. Offset of a stream moves only once all its
+    entries up to the offset were dispatched, with `offset_key` the offsets
+    are stored in redis hash, so a restarted process reads again whatever
+    was still waiting for ventilation.
+    """
+
+    loop = None
+    app = None
+
+    def __init__(self, host, db, loop, app, streams=('adsocket',),
+                 count=100, block=1000, field='message', start_id=LATEST,
+                 offset_key=None, reconnect_delay=0.5,
+                 max_reconnect_delay=30.0, codec='json', write_stream=None,
+                 write_max_len=None):
+        self._host = host
+        self._db = db
+        self.loop = loop
+        self.app = app
+        # last entry of every stream dispatched with all entries before it
+        self._offsets = {stream: start_id for stream in streams}
+        # last entry of every stream read
+        self._positions = None
+        # entries read but not dispatched yet, in stream order
+        self._pending = {stream: collections.OrderedDict()
+                         for stream in streams}
+        self._committed = {}
+        self._count = count
+        self._block = block
+        self._field = field.encode()
+        self._offset_key = offset_key
+        self._reconnect_delay = reconnect_delay
+        self._max_reconnect_delay = max_reconnect_delay
+        self._closing = False
+        self._restored = False
+        self.codec = codecs.get(codec)
+        self._write_stream = write_stream or streams[0]
+        self._write_max_len = write_max_len
+        self._writer = BatchWriter(self._flush)
+
+    async def _restore_offsets(self, redis):
+        """
+        Load offsets stored by previous process and pin '$' to the actual
+        last entry, otherwise entries added between two reads would be lost
+        """
+        if self._offset_key and not self._restored:
+            stored = await redis.hgetall(self._offset_key, encoding='utf-8')
+            for stream, offset in stored.items():
+                if stream in self._offsets:
+                    self._offsets[stream] = offset
+        self._restored = True
+
+        for stream, offset in self._offsets.items():
+            if offset != LATEST:
+                continue
+            last = await redis.xrevrange(stream, count=1)
+            self._offsets[stream] = last[0][0].decode() if last else '0-0'
+        if self._positions is None:
+            # after reconnect reading continues where it stopped, entries
+            # read before are still waiting in ventilation queues
+            self._positions = dict(self._offsets)
+        _logger.info(f"Reading streams from {self._positions}")
+
+    async def _store_offsets(self, redis, offsets):
+        pairs = []
+        for stream, offset in offsets.items():
+            pairs.extend((stream, offset))
+        await redis.hmset(self._offset_key, *pairs)
+
+    async def _consume(self, redis):
+        streams = list(self._offsets)
+        while not self._closing:
+            batch = await redis.xread(
+                streams,
+                timeout=self._block,
+                count=self._count,
+                latest_ids=[self._positions[s] for s in streams])
+            for stream, entry_id, fields in batch:
+                stream = stream.decode()
+                entry_id = entry_id.decode()
+                self._positions[stream] = entry_id
+                self._pending[stream][entry_id] = False
+                done = functools.partial(self._dispatched, stream, entry_id)
+                try:
+                    payload = fields[self._field]
+                except KeyError:
+                    _logger.error(f"Skipping stream entry {entry_id} "
+                                  f"without {self._field} field")
+                    done()
+                else:
+                    await self.feed(stream, payload, done)
+            await self._commit(redis)
+
+    def _dispatched(self, stream, entry_id):
+        """
+        Entry was dispatched, offset moves over all dispatched entries
+        at the beginning of the stream's pending entries
+        """
+        pending = self._pending[stream]
+        pending[entry_id] = True
+        offset = None
+        while pending:
+            entry_id, dispatched = next(iter(pending.items()))
+            if not dispatched:
+                break
+            pending.popitem(last=False)
+            offset = entry_id
+        if offset is not None:
+            self._offsets[stream] = self._committed[stream] = offset
+
+    async def _commit(self, redis):
+        """
+        Store offsets which moved since the last time
+        """
+        if not self._offset_key or not self._committed:
+            return
+        committed, self._committed = self._committed, {}
+        await self._store_offsets(redis, committed)
+
+    async def read(self):
+        _logger.info("Waiting for messages")
+        delay = self._reconnect_delay
+        while not self._closing:
+            try:
+                redis = await self.redis
+                await self._restore_offsets(redis)
+                delay = self._reconnect_delay
+                await self._consume(redis)
+            except (aioredis.RedisError, OSError) as e:
+                if self._closing:
+                    break
+                _logger.error(f"Lost connection to redis: {e}. "
+                              f"Reconnecting in {delay}s")
+                self._drop_connection()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self._max_reconnect_delay)
+        _logger.info("No longer receiving messages from redis")
+
+    async def write(self, message):
+        self._writer.write(self.encode(message))
+
+    async def _flush(self, batch):
+        redis = await self.publisher
+        pipe = redis.pipeline()
+        for payload in batch:
+            pipe.xadd(self._write_stream, {self._field: payload},
+                      max_len=self._write_max_len)
+        try:
+            await pipe.execute()
+        except (aioredis.RedisError, OSError):
+            self._drop_publisher()
+            raise
+
+    async def close(self, app):
+        self._closing = True
+        self.stop_ingestion()
+        await self._writer.close()
+        self._drop_publisher()
+        if self._redis is not None:
+            try:
+                await self._commit(self._redis)
+            except (aioredis.RedisError, OSError) as e:
+                _logger.error(f"Could not store stream offsets: {e}")
+        self._drop_connection()
@@ -0,0 +1,121 @@
+import asyncio
+import logging
+import time
+
+from adsocket.core.metrics import registry
+
+_logger = logging.getLogger(__name__)
+
+BLOCK = 'block'
+DROP = 'drop'
+
+OVERFLOW_POLICIES = (BLOCK, DROP)
+
+_depth = registry.gauge(
+    'adsocket_broker_queue_depth',
+    "Broker payloads waiting for ventilation")
+_overflow = registry.counter(
+    'adsocket_broker_queue_overflow_total',
+    "Broker payloads which found ventilation queue full",
+    ('policy',))
+_ventilated = registry.counter(
+    'adsocket_broker_messages_total',
+    "Broker messages ventilated to channels")
+_errors = registry.counter(
+    'adsocket_broker_errors_total',
+    "Broker payloads which could not be decoded or ventilated")
+_lag = registry.histogram(
+    'adsocket_broker_lag_seconds',
+    "Time broker payloads spent waiting for ventilation").labels()
+
+
+class Ventilator:
+    """
+    Decouples reading from broker and ventilating to channels.
+
+    Broker reader only decodes payloads and puts them into bounded queues.
+    Pool of worker tasks takes them in batches and dispatches them to
+    channels. Messages of the same adsocket channel always go to the same
+    worker, so their order is preserved.
+    """
+
+    def __init__(self, broker, workers=4, queue_size=10000, batch_size=100,
+                 overflow=BLOCK):
+        if overflow not in OVERFLOW_POLICIES:
+            raise RuntimeError(f"Unknown overflow policy {overflow}. "
+                               f"Choose one of {OVERFLOW_POLICIES}")
+        self._broker = broker
+        self._queues = [asyncio.Queue(maxsize=queue_size)
+                        for _ in range(workers)]
+        self._batch_size = batch_size
+        self._overflow = overflow
+        self._overflow_count = _overflow.labels(overflow)
+        self._tasks = []
+        _depth.set_function(self.depth)
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def start(self):
+        self._tasks = [asyncio.ensure_future(self._work(queue))
+                       for queue in self._queues]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def put(self, key, payload, done=None):
+        """
+        Decode payload read from broker and enqueue it. Messages of the same
+        adsocket channel go to the same worker, so they keep their order
+        while messages of different channels are spread over all workers,
+        even if they all came through single broker channel.
+
+        :param key: where the payload came from (e.g. redis channel)
+        :param payload: raw payload as received from broker
+        :param callable done: called once the payload is dispatched, found
+            undecodable or dropped
+        :return bool: False if payload was dropped
+        """
+        try:
+            msg = self._broker.decode(payload, key)
+        except Exception as e:
+            _errors.inc()
+            _logger.error(f"Could not decode broker payload: {e}")
+            if done is not None:
+                done()
+            return False
+        queue = self._queues[hash(msg.channel) % len(self._queues)]
+        item = (msg, time.monotonic(), done)
+        if not queue.full():
+            queue.put_nowait(item)
+            return True
+
+        self._overflow_count.inc()
+        if self._overflow == DROP:
+            if done is not None:
+                done()
+            return False
+        await queue.put(item)
+        return True
+
+    async def _work(self, queue):
+        broker = self._broker
+        batch_size = self._batch_size
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+
+            now = time.monotonic()
+            for msg, enqueued, done in batch:
+                _lag.observe(now - enqueued)
+                try:
+                    await broker.dispatch(msg)
+                except Exception as e:
+                    _errors.inc()
+                    _logger.exception(e)
+                if done is not None:
+                    done()
+            _ventilated.inc(len(batch))
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+
+from adsocket.core.metrics import registry
+
+_logger = logging.getLogger(__name__)
+
+_writes = registry.counter(
+    'adsocket_broker_writes_total',
+    "Messages written to broker by result",
+    ('result',))
+_batch_size = registry.histogram(
+    'adsocket_broker_write_batch_size',
+    "Messages written to broker in one round-trip",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)).labels()
+
+
+class BatchWriter:
+    """
+    Collects messages written during one loop iteration and hands them over
+    to `flush` coroutine at once, so broker can send them in single
+    round-trip (e.g. redis pipeline). While a flush is in progress new
+    messages wait for the next one, so there is never more than one
+    round-trip in flight.
+    """
+
+    def __init__(self, flush):
+        self._flush = flush
+        self._pending = []
+        self._task = None
+        self._written = _writes.labels('ok')
+        self._failed = _writes.labels('error')
+
+    def write(self, item):
+        """
+        Queue item for the next flush, never blocks
+
+        :param item: whatever `flush` coroutine understands
+        """
+        self._pending.append(item)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def _run(self):
+        try:
+            while self._pending:
+                batch, self._pending = self._pending, []
+                _batch_size.observe(len(batch))
+                try:
+                    await self._flush(batch)
+                except Exception as e:
+                    self._failed.inc(len(batch))
+                    _logger.error(f"Writing {len(batch)} messages to broker "
+                                  f"failed: {e}")
+                else:
+                    self._written.inc(len(batch))
+        finally:
+            self._task = None
+
+    async def close(self):
+        """
+        Wait until everything written so far is flushed
+        """
+        if self._task is not None:
+            await self._task
@@ -0,0 +1,75 @@
+import collections
+import time
+
+__all__ = [
+    'MISSING',
+    'TTLCache',
+]
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded cache whose entries expire. When full, the least recently used
+    entry is evicted.
+    """
+
+    def __init__(self, max_size=10000, ttl=60.0):
+        self._data = collections.OrderedDict()
+        self.max_size = max_size
+        self.ttl = ttl
+
+    def get(self, key, default=MISSING):
+        """
+        :param key: cache key
+        :param default: returned when key is missing or expired
+        :return: cached value
+        """
+        item = self._data.get(key)
+        if item is None:
+            return default
+        value, expires = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl=None):
+        """
+        :param key: cache key
+        :param value: value to cache
+        :param float ttl: seconds to keep the value, cache default if None
+        """
+        if ttl is None:
+            ttl = self.ttl
+        data = self._data
+        data[key] = (value, time.monotonic() + ttl)
+        data.move_to_end(key)
+        while len(data) > self.max_size:
+            data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def delete_matching(self, predicate):
+        """
+        Delete every entry whose key matches the predicate
+
+        :param callable predicate: called with key
+        :return int: number of deleted entries
+        """
+        keys = [key for key in self._data if predicate(key)]
+        for key in keys:
+            del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key) is not MISSING
@@ -1,64 +1,323 @@
 import asyncio
-import weakref
+import collections
+import inspect
+import time
 import logging
+import uuid
 
 from adsocket.core.exceptions import InvalidChannelException, \
     ChannelNotFoundException, PermissionDeniedException
 from .message import Message
-from .permissions import DummyPermission
+from .metrics import registry
+from .permissions import DummyPermission, Permission, permission_cache
 from .signals import new_broker_message
+from .trie import PrefixTrie
 from .utils import import_module
 from adsocket.ws.client import Client
 
 _logger = logging.getLogger(__name__)
 
+WILDCARD = '*'
+"""
+Channel id ending with wildcard is a pattern, e.g. `order:eu-*`
+"""
+
+# cacheable permissions decide by channel and identity only, one instance
+# of each class is shared by all channels
+_permission_instances = {}
+
+
+
+def _permission(permission):
+    """
+    Shared instance of cacheable permission class, new instance otherwise
+    """
+    if not permission.cacheable:
+        return permission()
+    instance = _permission_instances.get(permission)
+    if instance is None:
+        instance = _permission_instances[permission] = permission()
+    return instance
+
+
+_conflated = registry.counter(
+    'adsocket_conflated_messages_total',
+    "Messages replaced by newer message with the same conflation key")
+_messages_in = registry.counter(
+    'adsocket_messages_in_total',
+    "Messages published into channels by channel type",
+    ('channel_type',))
+_messages_out = registry.counter(
+    'adsocket_messages_out_total',
+    "Messages enqueued to channel members by channel type",
+    ('channel_type',))
+_fanout = registry.histogram(
+    'adsocket_fanout_seconds',
+    "Time of enqueueing one message to all members of a channel").labels()
+_channels = registry.gauge(
+    'adsocket_channels',
+    "Channels on this node")
+_members = registry.gauge(
+    'adsocket_channel_members',
+    "Channel memberships on this node")
+
 
 class Channel:
     """
     Represent single client or multiple client group.
     Before client can join the group all permissions are being check.
+
+    With `history_size` channel keeps the last published messages (together
+    with their encoded frames) and numbers them, so reconnecting client can
+    ask for everything it missed since given sequence number. Numbers are
+    valid only within one `epoch` - channel instance - so client must send
+    back the epoch it got its numbers from. History is capped by number of
+    messages and optionally by `history_max_bytes`, which counts frames
+    built for members at publish time. Frames built later for replays are
+    not counted, so the byte limit is approximate.
+
+    With `conflate_key` messages are not sent right away. They are collected
+    for `conflate_interval` seconds and only the newest message for every
+    value of `conflate_key` field of message data is sent.
+
+    Members are held strongly, client pool makes sure disconnected client
+    leaves all its channels.
+
+    Channel with id ending with `*` is a pattern channel. Its members get
+    messages of every channel of the same type whose id starts with the
+    pattern. Permissions are checked the same way, with the pattern channel
+    as the channel being joined.
     """
-    _clients = None
 
-    permissions = []
-    _channel_id = None
-    _channel_type = None
+    __slots__ = ('_clients', '_channel_id', '_channel_type', '_seq', '_epoch',
+                 '_history', '_history_bytes', '_history_max_bytes',
+                 '_conflate_key', '_conflate_interval', '_pending',
+                 '_flush_handle', '_messages_in', '_messages_out')
+
+    permissions = ()
 
-    def __init__(self, channel_type, channel_id=None):
-        self._clients = weakref.WeakSet()
-        if channel_id:
-            self._channel_id = channel_id
+    def __init__(self, channel_type, channel_id=None, history_size=0,
+                 history_max_bytes=None, conflate_key=None,
+                 conflate_interval=0.1):
+        self._clients = set()
+        self._channel_id = channel_id or None
         self._channel_type = channel_type
+        self._seq = 0
+        self._epoch = None
+        self._history = None
+        self._history_bytes = 0
+        self._history_max_bytes = history_max_bytes
+        if history_size:
+            self._history = collections.deque(maxlen=history_size)
+            self._epoch = uuid.uuid4().hex[:16]
+        self._conflate_key = conflate_key
+        self._conflate_interval = conflate_interval
+        self._pending = {} if conflate_key is not None else None
+        self._flush_handle = None
+        self._messages_in = _messages_in.labels(channel_type)
+        self._messages_out = _messages_out.labels(channel_type)
 
     def get_permissions(self, client=None):
-        permissions = []
-        for permission in self.permissions:
-            permissions.append(permission())
-        return permissions
+        return [_permission(permission) for permission in self.permissions]
 
-    async def _check_permissions(self, client, message) -> bool:
+    async def _check_permissions(self, client, message,
+                                 decided=None) -> bool:
+        """
+        All permissions must agree. They are independent on each other so
+        they are asked concurrently. Permissions found in `decided` (by
+        their class) are not asked again.
+        """
         permissions = self.get_permissions(client)
-
-        for permission in permissions:
-            result = await permission.can_join(self, client, message)
-            if not result:
+        if decided:
+            if not all(decided.get(p.__class__, True) for p in permissions):
                 return False
-        return True
+            permissions = [p for p in permissions
+                           if p.__class__ not in decided]
+        if not permissions:
+            return True
+        if len(permissions) == 1:
+            return await permission_cache.can_join(
+                permissions[0], self, client, message)
+
+        results = await asyncio.gather(
+            *[permission_cache.can_join(permission, self, client, message)
+              for permission in permissions])
+        return all(results)
+
+    async def can_write(self, client, message) -> bool:
+        """
+        All permissions must allow client to publish. Channel without
+        permissions is read only for clients.
+
+        :param Client client: client publishing
+        :param Message message: publish message
+        :return bool:
+        """
+        permissions = self.get_permissions(client)
+        if not permissions:
+            return False
+        results = await asyncio.gather(
+            *[permission.can_write(self, client, message)
+              for permission in permissions])
+        return all(results)
 
     async def publish(self, msg: Message):
-        return await asyncio.gather(
-            *[client.message(msg) for client in self.clients])
+        """
+        Enqueue message to every member of the channel. Nothing is awaited
+        here, each client's writer takes care of the network.
+
+        :param Message msg: message instance
+        :return void:
+        """
+        self._messages_in.inc()
+        if self._conflate_key is not None:
+            self._conflate(msg)
+        else:
+            self._deliver(msg)
+
+    def _conflate(self, msg: Message):
+        key = None
+        if isinstance(msg.data, dict):
+            key = msg.data.get(self._conflate_key)
+        if key is None or not isinstance(key, (str, int, float)):
+            # message without usable key can not replace anything
+            key = object()
+        elif key in self._pending:
+            _conflated.inc()
+        self._pending[key] = msg
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_event_loop().call_later(
+                self._conflate_interval, self._flush)
+
+    def _flush(self):
+        pending, self._pending = self._pending, {}
+        self._flush_handle = None
+        for msg in pending.values():
+            self._deliver(msg)
+
+    def publish_to(self, msg: Message, clients):
+        """
+        Enqueue message to given members only, without history and
+        conflation. Channel pool uses it to deliver messages matching
+        pattern channels.
+
+        :param Message msg: message instance
+        :param set clients: members to deliver the message to
+        :return void:
+        """
+        self._messages_in.inc()
+        self._fan_out(msg, clients)
+
+    def _deliver(self, msg: Message):
+        if self._history is None:
+            self._fan_out(msg, self.clients)
+            return
+        self._seq += 1
+        msg.set_seq(self._seq)
+        self._fan_out(msg, self.clients)
+        # frames are built during fan-out, that's what history holds
+        self._remember(self._seq, msg)
+
+    def _fan_out(self, msg: Message, clients):
+        started = time.perf_counter()
+        for client in clients:
+            client.deliver(msg)
+        self._messages_out.inc(len(clients))
+        _fanout.observe(time.perf_counter() - started)
+
+    def _remember(self, seq, msg):
+        history = self._history
+        size = msg.encoded_size()
+        if len(history) == history.maxlen:
+            self._history_bytes -= history[0][2]
+        history.append((seq, msg, size))
+        self._history_bytes += size
+        if self._history_max_bytes is None:
+            return
+        while self._history_bytes > self._history_max_bytes and history:
+            self._history_bytes -= history.popleft()[2]
+
+    def replay(self, client: Client, since_seq: int, epoch=None) -> dict:
+        """
+        Send client messages published after `since_seq` which are still
+        in the history. Numbers from another (or unknown) epoch, e.g. channel
+        was removed and created again or lives on another node, mean nothing
+        here, whole history is sent then and it's never complete.
+
+        :param Client client: client to send messages to
+        :param int since_seq: last sequence number client has seen
+        :param str epoch: epoch the sequence number comes from
+        :return dict: current sequence and epoch, number of replayed
+            messages and whether nothing is missing
+        """
+        known = since_seq <= self._seq and epoch == self._epoch
+        if not known:
+            since_seq = 0
+        replayed = 0
+        history = self._history or ()
+        for seq, msg, _ in history:
+            if seq > since_seq:
+                client.deliver(msg)
+                replayed += 1
+        oldest = history[0][0] if history else self._seq + 1
+        return {
+            'seq': self._seq,
+            'epoch': self._epoch,
+            'replayed': replayed,
+            'complete': known and since_seq >= oldest - 1,
+        }
+
+    @property
+    def seq(self):
+        return self._seq
+
+    @property
+    def epoch(self):
+        return self._epoch
+
+    async def join(self, client: Client, message: Message, since_seq=None,
+                   decided=None, epoch=None):
+        """
+        Add client to the channel if permissions allow it. With `since_seq`
+        missed messages are replayed before any new one can be delivered.
+
+        :param Client client: client joining
+        :param Message message: subscribe message
+        :param int since_seq: last sequence number client has seen
+        :param dict decided: decisions made in advance by permission class
+        :param str epoch: epoch `since_seq` comes from
+        :return dict: replay result if `since_seq` was given, current
+            sequence and epoch if channel keeps history
+        """
+        await self.authorize(client, message, decided)
+        return self.admit(client, since_seq, epoch)
 
-    async def join(self, client: Client, message: Message) -> None:
-        access = await self._check_permissions(client, message)
+    async def authorize(self, client: Client, message: Message,
+                        decided=None):
+        """
+        Raise PermissionDeniedException unless permissions let client join
+
+        :param Client client: client joining
+        :param Message message: subscribe message
+        :param dict decided: decisions made in advance by permission class
+        """
+        access = await self._check_permissions(client, message, decided)
         if not access:
             msg = "You don't have enough permission to join this channel"
             raise PermissionDeniedException(msg)
+
+    def admit(self, client: Client, since_seq=None, epoch=None):
+        """
+        Add client whose permissions were already checked, see :meth:`join`
+        """
         self._clients.add(client)
+        if since_seq is not None:
+            return self.replay(client, since_seq, epoch)
+        if self._history is not None:
+            return {'seq': self._seq, 'epoch': self._epoch}
 
     async def leave(self, client):
-        if client in self._clients:
-            self._clients.remove(client)
+        self._clients.discard(client)
 
     @property
     def channel_id(self):
@@ -68,6 +327,10 @@ class Channel:
     def type(self):
         return self._channel_type
 
+    @property
+    def is_pattern(self):
+        return bool(self._channel_id) and self._channel_id.endswith(WILDCARD)
+
     @property
     def uid(self):
         return f"{self._channel_type}:{self._channel_id}"
@@ -106,15 +369,34 @@ class ChannelPool:
 
     def __init__(self, *args, **kwargs):
         self._types = kwargs.pop('channel_types', {})
+        self._type_options = kwargs.pop('channel_options', {})
+        self._pattern_types = set(kwargs.pop('pattern_types', ()))
         permanent_channels = kwargs.pop('permanent_channels', {})
         self._channels = {}
         self._permanent_channels = {}
+        # channel type -> trie of pattern channels by id prefix
+        self._patterns = {}
         self._app = kwargs.get('app', None)
+        # channel uid -> timer removing empty channel
+        self._removals = {}
+        self._removal_delay = self._app['settings'].CHANNEL_REMOVAL_DELAY
 
+        for name, options in self._type_options.items():
+            self._check_options(name, options)
         if len(permanent_channels):
             for name, ch in permanent_channels.items():
                 self._create_permanent(name, ch)
-        self._app.loop.create_task(self._report())
+        _channels.set_function(
+            lambda: len(self._channels) + len(self._permanent_channels))
+        _members.set_function(self._count_members)
+
+    def __len__(self):
+        return len(self._channels)
+
+    def _count_members(self):
+        return sum(len(channel.clients) for channels in
+                   (self._channels, self._permanent_channels)
+                   for channel in channels.values())
 
     def has_type(self, channel):
         """
@@ -125,6 +407,18 @@ class ChannelPool:
         """
         return channel in self._types
 
+    def _check_options(self, channel_type, options):
+        """
+        Options are passed to the channel only once it's created, wrong ones
+        must not wait for the first client
+        """
+        try:
+            inspect.signature(self._types[channel_type]).bind(
+                channel_type, None, **options)
+        except TypeError as e:
+            raise RuntimeError(f"Invalid options of channel type "
+                               f"{channel_type}: {e}")
+
     def _create_permanent(self, name, ch):
         channel_id = getattr(ch, 'channel_id', None)
         if not channel_id:
@@ -134,28 +428,46 @@ class ChannelPool:
         self._types[name] = ch.__class__
         _logger.info(f"Permanent channel {uid} initialized")
 
-    def _initialize_channel(self, channel_type, channel_id):
+    def _build_channel(self, channel_type, channel_id):
         """
-        Initialize new instance of channel type with given ID
+        Initialize new instance of channel type with given ID, the pool
+        does not know about it until it's registered
 
         :param str channel_type:
         :param str channel_id:
         :return:
         """
         channel_klazz = self._types[channel_type]
-        channel_instance = channel_klazz(channel_type, channel_id)
-        uid = f"{channel_type}:{channel_id}"
-        self._channels[uid] = channel_instance
-        _logger.info(f"New channel {uid} initialized")
-        return channel_instance
-
-    async def _report(self):
-        while True:
-            a = len(self._channels)
-            b = len(self._permanent_channels)
-            msg = f"Channel pool size: {a} | Permanent channel pool size: {b}"
-            _logger.info(msg)
-            await asyncio.sleep(10)
+        options = self._type_options.get(channel_type, {})
+        if channel_id.endswith(WILDCARD):
+            # pattern only forwards messages of matching channels
+            options = {key: value for key, value in options.items()
+                       if not key.startswith(('history_', 'conflate_'))}
+        return channel_klazz(channel_type, channel_id, **options)
+
+    async def _register(self, channel: Channel):
+        """
+        Add new channel to the pool and let broker know about it. Channel
+        registered by another client meanwhile wins.
+
+        :param Channel channel: channel built by :meth:`_build_channel`
+        :return Channel: channel of the pool
+        """
+        existing = self._channels.get(channel.uid)
+        if existing is not None:
+            removal = self._removals.pop(existing.uid, None)
+            if removal is not None:
+                removal.cancel()
+            return existing
+        self._channels[channel.uid] = channel
+        if channel.is_pattern:
+            trie = self._patterns.get(channel.type)
+            if trie is None:
+                trie = self._patterns[channel.type] = PrefixTrie()
+            trie.add(channel.channel_id[:-1], channel)
+        _logger.info(f"New channel {channel.uid} initialized")
+        await self._broker.channel_created(channel)
+        return channel
 
     def _get_type_and_id(self, channel):
         """
@@ -169,26 +481,62 @@ class ChannelPool:
             raise InvalidChannelException(msg)
         return parts[0], parts[1]
 
+    def _check_pattern(self, channel_type, channel_id):
+        if WILDCARD not in channel_id:
+            return
+        if channel_type not in self._pattern_types:
+            raise InvalidChannelException(
+                f"Channel type {channel_type} does not allow patterns")
+        if channel_id.index(WILDCARD) != len(channel_id) - 1:
+            raise InvalidChannelException(
+                "Wildcard is allowed only at the end of channel id")
+
     async def client_disconnected(self, client: Client):
         _logger.debug(f"{client} removed. Let's cleanup channels if possible")
-        for name, channel in self._channels.items():
-            if channel.has_client(client):
-                asyncio.ensure_future(self._schedule_removal(channel))
+        await self.leave_channels(client)
 
-    async def join_channel(self, channel, client: Client, message: Message):
+    async def join_channel(self, channel, client: Client, message: Message,
+                           since_seq=None, decided=None, epoch=None):
         _logger.info(f"Client {client} joining channel {channel}")
         channel_type, channel_id = self._get_type_and_id(channel)
         if not self.has_type(channel_type):
             raise InvalidChannelException("Invalid channel type")
+        self._check_pattern(channel_type, channel_id)
 
         if self.has_channel(channel_type, channel_id):
             channel = self._get_channel(channel_type, channel_id)
+            removal = self._removals.pop(channel.uid, None)
+            if removal is not None:
+                removal.cancel()
+            try:
+                replay = await channel.join(client, message,
+                                            since_seq=since_seq,
+                                            decided=decided, epoch=epoch)
+            except Exception:
+                if channel.is_empty():
+                    self._schedule_removal(channel)
+                raise
         else:
-            channel = self._initialize_channel(channel_type, channel_id)
-
-        await channel.join(client, message)
+            # client which may not join must not make broker subscribe,
+            # channel is registered only once permissions agree
+            channel = self._build_channel(channel_type, channel_id)
+            await channel.authorize(client, message, decided)
+            channel = await self._register(channel)
+            replay = channel.admit(client, since_seq, epoch)
+        ws = client.ws
+        if ws is None or ws.closed:
+            # disconnected while permissions were checked, client pool has
+            # already cleaned up its channels and would never see this one
+            await channel.leave(client)
+            if channel.is_empty():
+                self._schedule_removal(channel)
+            _logger.info(f"Client {client} disconnected while joining "
+                         f"{channel}")
+            return False
         _logger.info(f"Client {client} has successfully joined {channel}")
         await client.channel_joined(channel)
+        if replay is not None:
+            return replay
         return True
 
     def has_channel(self, channel_type, channel_id):
@@ -201,6 +549,15 @@ class ChannelPool:
         """
         return f"{channel_type}:{channel_id}" in self._channels
 
+    def has_uid(self, uid):
+        """
+        Return True if channel with given uid exists in the pool
+
+        :param str uid: channel uid
+        :return bool:
+        """
+        return uid in self._channels or uid in self._permanent_channels
+
     def _get_channel(self, channel_type, channel_id):
         uid = f"{channel_type}:{channel_id}"
         try:
@@ -212,31 +569,175 @@ class ChannelPool:
                 pass
             raise ChannelNotFoundException(f"Channel {uid} was not found")
 
-    def leave_channel(self, channel, client: Client):
-        pass
+    async def can_write(self, channel, client: Client, message: Message):
+        """
+        Ask permissions of the channel whether client may publish into it.
+        Channel does not need to exist on this node, other nodes may have
+        subscribers, so temporary instance is asked in such case.
+
+        :param str channel: channel uid
+        :param Client client: client publishing
+        :param Message message: publish message
+        :return bool:
+        """
+        channel_type, channel_id = self._get_type_and_id(channel)
+        if not self.has_type(channel_type):
+            raise InvalidChannelException("Invalid channel type")
+        if WILDCARD in channel_id:
+            raise InvalidChannelException("Can not publish to pattern")
+        instance = self._existing_or_temporary(channel_type, channel_id)
+        return await instance.can_write(client, message)
+
+    async def decide_joins(self, channels, client: Client, message: Message):
+        """
+        Ask permissions implementing `can_join_many` about all channels at
+        once, every permission is asked concurrently with the others.
+        Decisions are meant for :meth:`join_channel`, permissions which did
+        not decide are asked on join as usual.
+
+        :param list channels: channel uids of known types
+        :param Client client: client joining the channels
+        :param Message message: subscribe message
+        :return dict: channel uid -> {permission class: bool}
+        """
+        asked = {}
+        for uid in channels:
+            channel_type, channel_id = self._get_type_and_id(uid)
+            for permission in self._types[channel_type].permissions:
+                if permission.can_join_many is not Permission.can_join_many:
+                    asked.setdefault(permission, []).append(
+                        (channel_type, channel_id))
+        asked = [(permission, targets) for permission, targets
+                 in asked.items() if len(targets) > 1]
+        if not asked:
+            return {}
+
+        instances = {}
+        for permission, keys in asked:
+            for key in keys:
+                if key not in instances:
+                    instances[key] = self._existing_or_temporary(*key)
+        asked = [(permission, [instances[key] for key in keys])
+                 for permission, keys in asked]
+        results = await asyncio.gather(
+            *[permission_cache.can_join_many(
+                _permission(permission), targets, client, message)
+              for permission, targets in asked])
+        decisions = {}
+        for (permission, targets), result in zip(asked, results):
+            for channel, decision in zip(targets, result):
+                if decision is not None:
+                    decisions.setdefault(channel.uid, {})[
+                        permission] = decision
+        return decisions
+
+    def _existing_or_temporary(self, channel_type, channel_id):
+        """
+        Channel from the pool or temporary instance of its type, good
+        enough to ask permissions about. Constructor of the type is not
+        called for temporary instance, channel types may connect signals
+        or allocate history there.
+        """
+        try:
+            return self._get_channel(channel_type, channel_id)
+        except ChannelNotFoundException:
+            klazz = self._types[channel_type]
+            channel = klazz.__new__(klazz)
+            Channel.__init__(channel, channel_type, channel_id)
+            return channel
+
+    async def leave_channel(self, channel: Channel, client: Client):
+        """
+        Remove client from single channel
+
+        :param Channel channel: channel instance
+        :param Client client: client leaving the channel
+        :return void:
+        """
+        await self._leave(channel, client)
 
     async def leave_channels(self, client: Client):
-        for channel in self._channels:
-            if channel.has_client(client):
-                await channel.leave(client)
-                if len(channel.clients) == 0:
-                    asyncio.ensure_future(self._schedule_removal(channel))
-
-    async def _schedule_removal(self, channel: Channel):
-        await asyncio.sleep(12)
+        """
+        Remove client from all channels it's member of. Only channels of
+        the client are visited.
+
+        :param Client client: client leaving the channels
+        :return void:
+        """
+        for channel in list(client.channels):
+            await self._leave(channel, client)
+
+    async def _leave(self, channel: Channel, client: Client):
+        await channel.leave(client)
+        client.leave_channel(channel)
+        if channel.is_empty():
+            self._schedule_removal(channel)
+
+    def channels_of(self, client: Client):
+        """
+        Return channels client is member of
+
+        :param Client client:
+        :return frozenset:
+        """
+        return frozenset(client.channels)
+
+    def _schedule_removal(self, channel: Channel):
+        """
+        Remove channel after a while unless somebody joins it meanwhile
+        """
+        if channel.uid in self._removals:
+            return
+        self._removals[channel.uid] = self._app['timers'].schedule(
+            self._removal_delay, self._remove_if_empty, channel)
+
+    def _remove_if_empty(self, channel: Channel):
+        self._removals.pop(channel.uid, None)
         if channel.is_empty():
-            await self.remove_channel(channel)
+            return self.remove_channel(channel)
 
     async def remove_channel(self, channel: Channel):
+        removal = self._removals.pop(channel.uid, None)
+        if removal is not None:
+            removal.cancel()
         if channel.uid in self._channels:
             del self._channels[channel.uid]
+            if channel.is_pattern:
+                self._remove_pattern(channel)
+            await self._broker.channel_removed(channel)
 
             _logger.info(f"Channel {channel} have been removed")
             return
 
+    def _remove_pattern(self, channel: Channel):
+        trie = self._patterns[channel.type]
+        trie.remove(channel.channel_id[:-1])
+        if not len(trie):
+            del self._patterns[channel.type]
+
+    def match_patterns(self, channel):
+        """
+        Return pattern channels matching channel uid, shortest pattern first
+
+        :param str channel: channel uid
+        :return list:
+        """
+        channel_type, channel_id = self._get_type_and_id(channel)
+        trie = self._patterns.get(channel_type)
+        if trie is None:
+            return []
+        return trie.match(channel_id)
+
+    @property
+    def _broker(self):
+        return self._app['broker']
+
     async def publish(self, message):
         """
-        This how messages are being ventilated from broker to channel
+        This how messages are being ventilated from broker to channel.
+        Message goes to the channel itself and to all pattern channels
+        matching it, client being member of several of them gets
+        the message only once.
 
         :param Message message: message instance
         :return void:
@@ -245,8 +746,38 @@ class ChannelPool:
         channel_type, channel_id = self._get_type_and_id(channel)
         if not self.has_type(channel_type):
             raise InvalidChannelException("Invalid channel type")
-        channel = self._get_channel(channel_type, channel_id)
-        await channel.publish(message)
+        trie = self._patterns.get(channel_type)
+        if trie is None:
+            channel = self._get_channel(channel_type, channel_id)
+            await channel.publish(message)
+            return
+
+        patterns = trie.match(channel_id)
+        try:
+            channel = self._get_channel(channel_type, channel_id)
+        except ChannelNotFoundException:
+            if not patterns:
+                raise
+            channel = None
+        if channel is not None:
+            if channel.is_pattern:
+                # message published right into pattern channel
+                patterns = [p for p in patterns if p is not channel]
+            await channel.publish(message)
+            if not patterns:
+                return
+            reached = set(channel.clients)
+        elif len(patterns) == 1:
+            patterns[0].publish_to(message, patterns[0].clients)
+            return
+        else:
+            reached = set()
+
+        for pattern in patterns:
+            clients = pattern.clients - reached
+            if clients:
+                pattern.publish_to(message, clients)
+                reached |= clients
 
 
 async def initialize_channels(app):
@@ -264,19 +795,26 @@ async def initialize_channels(app):
     if not len(app['settings'].CHANNELS):
         _logger.warning("Without channels there is not much to do :(")
     types = {}
+    channel_options = {}
     permanent_channels = {}
+    pattern_types = set()
     for name, options in app['settings'].CHANNELS.items():
         driver = options.pop('driver', None)
         if not driver:
             raise RuntimeError(f'Driver option is missing for channel {name}')
         klazz = import_module(driver)
         create_on_startup = options.pop('create_on_startup', False)
+        if options.pop('patterns', False):
+            pattern_types.add(name)
         if create_on_startup:
             options['channel_type'] = name
             permanent_channels[name] = klazz(**options)
         else:
             types[name] = klazz
+            channel_options[name] = options
 
     app['channels'] = ChannelPool(channel_types=types,
+                                  channel_options=channel_options,
                                   permanent_channels=permanent_channels,
+                                  pattern_types=pattern_types,
                                   app=app)
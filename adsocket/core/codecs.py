@@ -0,0 +1,219 @@
+"""
+Codecs turn messages into websocket frames (and broker payloads) and back.
+
+JSON is always available and uses `orjson` when it's installed. Binary
+MessagePack frames are used by clients which ask for `adsocket.msgpack`
+websocket subprotocol, provided `msgpack` is installed.
+"""
+import abc
+import json
+import logging
+import time
+
+from .metrics import registry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+__all__ = [
+    'Codec',
+    'JsonCodec',
+    'OrjsonCodec',
+    'MsgpackCodec',
+    'CodecRegistry',
+    'codecs',
+]
+
+_logger = logging.getLogger(__name__)
+
+_frames = registry.counter(
+    'adsocket_codec_frames_total',
+    "Frames encoded and decoded by codec",
+    ('codec', 'op'))
+_seconds = registry.counter(
+    'adsocket_codec_seconds_total',
+    "Time spent encoding and decoding by codec",
+    ('codec', 'op'))
+
+
+class Codec(abc.ABC):
+    """
+    Base codec. Subclasses implement :meth:`dumps` and :meth:`loads`,
+    everybody else calls :meth:`encode` and :meth:`decode` which also
+    account the work in metrics.
+    """
+
+    name = None
+    binary = False
+    """
+    Binary codecs produce bytes sent as binary websocket frames
+    """
+
+    def __init__(self):
+        self._encoded = _frames.labels(self.name, 'encode')
+        self._encode_time = _seconds.labels(self.name, 'encode')
+        self._decoded = _frames.labels(self.name, 'decode')
+        self._decode_time = _seconds.labels(self.name, 'decode')
+
+    @abc.abstractmethod
+    def dumps(self, data):
+        pass
+
+    @abc.abstractmethod
+    def loads(self, payload):
+        pass
+
+    def encode(self, data):
+        started = time.perf_counter()
+        result = self.dumps(data)
+        self._encode_time.inc(time.perf_counter() - started)
+        self._encoded.inc()
+        return result
+
+    def decode(self, payload):
+        started = time.perf_counter()
+        result = self.loads(payload)
+        self._decode_time.inc(time.perf_counter() - started)
+        self._decoded.inc()
+        return result
+
+    def __str__(self):
+        return self.name
+
+
+class JsonCodec(Codec):
+
+    name = 'json'
+
+    def dumps(self, data):
+        return json.dumps(data)
+
+    def loads(self, payload):
+        return json.loads(payload)
+
+
+class OrjsonCodec(Codec):
+    """
+    JSON codec backed by orjson. Still produces text frames.
+    """
+
+    name = 'orjson'
+
+    def __init__(self):
+        if orjson is None:
+            raise RuntimeError("orjson is not installed")
+        super().__init__()
+
+    def dumps(self, data):
+        return orjson.dumps(data).decode()
+
+    def loads(self, payload):
+        return orjson.loads(payload)
+
+
+class MsgpackCodec(Codec):
+
+    name = 'msgpack'
+    binary = True
+
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError("msgpack is not installed")
+        super().__init__()
+
+    def dumps(self, data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    def loads(self, payload):
+        return msgpack.unpackb(payload, raw=False)
+
+
+class CodecRegistry:
+    """
+    Knows available codecs and which websocket subprotocol selects which
+    codec
+    """
+
+    def __init__(self):
+        self._codecs = {}
+        self._subprotocols = {}
+        self._json = None
+
+    def register(self, name, klazz):
+        try:
+            self._codecs[name] = klazz()
+        except RuntimeError as e:
+            _logger.info(f"Codec {name} not available: {e}")
+
+    def configure(self, json_codec='auto', subprotocols=None):
+        """
+        :param str json_codec: `auto` (orjson if installed), `json` for
+            standard library or `orjson`
+        :param dict subprotocols: websocket subprotocol -> codec name
+        """
+        if json_codec == 'auto':
+            json_codec = 'orjson' if 'orjson' in self._codecs else 'json'
+        try:
+            self._json = self._codecs[json_codec]
+        except KeyError:
+            raise RuntimeError(f"Unknown or unavailable codec {json_codec}")
+        _logger.info(f"Using {self._json} codec for JSON")
+
+        self._subprotocols = {}
+        for protocol, name in (subprotocols or {}).items():
+            if name not in self._codecs:
+                _logger.warning(f"Subprotocol {protocol} disabled, codec "
+                                f"{name} is not available")
+                continue
+            self._subprotocols[protocol] = name
+
+    def get(self, name):
+        """
+        :param str name: codec name, `json` is the configured JSON codec
+        :return Codec:
+        """
+        if name == 'json':
+            return self.json
+        try:
+            return self._codecs[name]
+        except KeyError:
+            raise RuntimeError(f"Unknown or unavailable codec {name}")
+
+    @property
+    def json(self) -> Codec:
+        if self._json is None:
+            self.configure()
+        return self._json
+
+    @property
+    def subprotocols(self):
+        """
+        Subprotocols offered to websocket clients
+        """
+        return tuple(self._subprotocols)
+
+    def for_subprotocol(self, protocol) -> Codec:
+        """
+        Codec negotiated by the websocket subprotocol. JSON if client did not
+        ask for any.
+
+        :param str protocol: negotiated subprotocol or None
+        :return Codec:
+        """
+        if protocol is None:
+            return self.json
+        return self.get(self._subprotocols[protocol])
+
+
+codecs = CodecRegistry()
+
+codecs.register('json', JsonCodec)
+codecs.register('orjson', OrjsonCodec)
+codecs.register('msgpack', MsgpackCodec)
@@ -1,15 +1,24 @@
 import abc
+import asyncio
+import hashlib
 import logging
 
 from adsocket.core.exceptions import InvalidChannelException, \
-    PermissionDeniedException
+    PermissionDeniedException, ChannelNotFoundException
+from adsocket.core.cache import MISSING, TTLCache
 from adsocket.core.message import Message
+from adsocket.core.metrics import registry
 from adsocket.core.utils import parse_channel
 from adsocket.ws import Client
 
 
 _logger = logging.getLogger(__name__)
 
+_auth_cache = registry.counter(
+    'adsocket_auth_cache_total',
+    "Authentication cache lookups by result",
+    ('result',))
+
 
 class AbstractCommand(abc.ABC):
 
@@ -28,12 +37,58 @@ class AbstractCommand(abc.ABC):
 
 
 class PublishCommand(AbstractCommand):
+    """
+    Publish message data into channel. Local members get the message right
+    away, other nodes through the broker.
+    """
 
     async def execute(self, client: Client, message: Message):
-        pass
+        """
+        :param client.Client client: Client instance
+        :param core.Message message: Message instance
+        :return void:
+        """
+        chpool = self._app['channels']
+        broker = self._app['broker']
+        channel = message.channel
+        try:
+            if not isinstance(channel, str) or not parse_channel(channel):
+                raise InvalidChannelException("Invalid channel format")
+            if channel == broker.broadcast_channel:
+                raise InvalidChannelException(
+                    "Can not publish to broadcast channel")
+            allowed = await chpool.can_write(channel, client, message)
+        except InvalidChannelException as e:
+            result = str(e)
+        else:
+            result = True if allowed else "Permission denied"
+
+        if result is True:
+            outgoing = Message('message', message.data, channel=channel)
+            try:
+                await chpool.publish(outgoing)
+            except ChannelNotFoundException:
+                # nobody listens on this node
+                pass
+            await broker.write(outgoing)
+
+        if message.can_respond():
+            message.set_response({'result': result})
+            await client.message(message)
 
 
 class SubscribeCommand(AbstractCommand):
+    """
+    Channels of one message are joined concurrently, at most `concurrency`
+    of them at once (`SUBSCRIBE` setting). Permissions implementing
+    `can_join_many` are asked about all channels in single call before.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        options = app['settings'].SUBSCRIBE
+        self._concurrency = options['concurrency']
+        self._max_channels = options['max_channels']
 
     async def execute(self, client: Client, message: Message):
         """
@@ -49,34 +104,101 @@ class SubscribeCommand(AbstractCommand):
         if channels and not isinstance(channels, list):
             channels = [channels]
 
-        if not channels:
+        if not channels or \
+                not all(isinstance(channel, str) for channel in channels):
             raise InvalidChannelException("Invalid channel format")
+        if len(channels) > self._max_channels:
+            raise InvalidChannelException(
+                f"Too many channels, at most {self._max_channels} "
+                f"can be joined at once")
 
+        # results keep the order channels were asked for
         results = {}
+        joining = []
         for channel in channels:
-            orig_channel = channel
-            channel = parse_channel(channel)
-            channel_type, channel_id = channel
-            if not chpool.has_type(channel_type):
-                results[orig_channel] = "Channel not found"
-                break
-                # raise ChannelNotFoundException("Channel type not found")
-            try:
-                result = await chpool.join_channel(orig_channel, client,
-                                                   message)
-            except PermissionDeniedException:
-                results[orig_channel] = "Permission denied"
-            except Exception as e:
-                _logger.exception(e)
-                results[orig_channel] = "Internal server error"
+            if channel in results:
+                continue
+            parsed = parse_channel(channel)
+            if not parsed:
+                results[channel] = "Invalid channel format"
+            elif not chpool.has_type(parsed[0]):
+                results[channel] = "Channel not found"
             else:
-                results[orig_channel] = result
+                results[channel] = None
+                joining.append(channel)
+
+        try:
+            decisions = await chpool.decide_joins(joining, client, message)
+        except Exception as e:
+            # every channel is still checked on join one by one
+            _logger.exception(e)
+            decisions = {}
+        pending = iter(joining)
+
+        async def join():
+            # workers share the iterator, every channel is taken once
+            for channel in pending:
+                try:
+                    result = await chpool.join_channel(
+                        channel, client, message,
+                        since_seq=self._since_seq(message, channel),
+                        epoch=self._epoch(message, channel),
+                        decided=decisions.get(channel))
+                except PermissionDeniedException:
+                    results[channel] = "Permission denied"
+                except InvalidChannelException as e:
+                    results[channel] = str(e)
+                except Exception as e:
+                    _logger.exception(e)
+                    results[channel] = "Internal server error"
+                else:
+                    results[channel] = result
+
+        workers = min(self._concurrency, len(joining))
+        if workers == 1:
+            await join()
+        elif workers:
+            await asyncio.gather(*[join() for _ in range(workers)])
 
         if message.can_respond():
             response = {'result': results}
             message.set_response(response)
             return await client.message(message)
 
+    def _since_seq(self, message: Message, channel):
+        """
+        Client may ask for messages it missed with `since_seq` - either
+        single number or object with number per channel
+
+        :param Message message: subscribe message
+        :param str channel: channel uid
+        :return int: last sequence number seen by client or None
+        """
+        if not isinstance(message.data, dict):
+            return None
+        since_seq = message.data.get('since_seq')
+        if isinstance(since_seq, dict):
+            since_seq = since_seq.get(channel)
+        if isinstance(since_seq, int) and not isinstance(since_seq, bool):
+            return since_seq
+        return None
+
+    def _epoch(self, message: Message, channel):
+        """
+        Epoch of channel history `since_seq` comes from, given the same way
+        as `since_seq`
+
+        :param Message message: subscribe message
+        :param str channel: channel uid
+        :return str: epoch or None
+        """
+        if not isinstance(message.data, dict):
+            return None
+        epoch = message.data.get('epoch')
+        if isinstance(epoch, dict):
+            epoch = epoch.get(channel)
+        return epoch if isinstance(epoch, str) else None
+
 
 class UnsubscribeCommand(AbstractCommand):
 
@@ -89,6 +211,22 @@ class UnsubscribeCommand(AbstractCommand):
 
 
 class AuthenticateCommand(AbstractCommand):
+    """
+    With `AUTHENTICATION_CACHE` enabled successful results are cached by
+    cache keys of authenticators for a while, failures for a shorter while,
+    and concurrent verifications of the same credentials are collapsed into
+    one call of authenticators. Items the authenticator set on the client
+    are set on every client authenticated from the cache as well.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        options = app['settings'].AUTHENTICATION_CACHE
+        self._enabled = options['enabled']
+        self._negative_ttl = options['negative_ttl']
+        self._cache = TTLCache(max_size=options['max_size'],
+                               ttl=options['ttl'])
+        self._in_flight = {}
 
     async def execute(self, client: Client, message: Message):
         """
@@ -99,18 +237,83 @@ class AuthenticateCommand(AbstractCommand):
         :param Message message:
         :return:
         """
-        authenticators = self._app['authenticators']
-        for auth in authenticators:
-            result, data = await auth.authenticate(client, message)
-            if result:
-                client.profile = data
-                await client.set_authenticated()
-                await self._send_response(client, message, True)
-                return True, auth
+        key = self._cache_key(message)
+        if key is None:
+            auth, data, _ = await self._authenticate(client, message)
+        else:
+            auth, data = await self._cached_authenticate(key, client, message)
+
+        if auth is not None:
+            client.profile = dict(data) if isinstance(data, dict) else data
+            await client.set_authenticated()
+            await self._send_response(client, message, True)
+            return True, auth
         if message.can_respond():
             await self._send_response(client, message, False)
         return False,
 
+    def _cache_key(self, message: Message):
+        authenticators = self._app.get('authenticators', ())
+        if not self._enabled or not authenticators:
+            return None
+        keys = []
+        for auth in authenticators:
+            key = auth.cache_key(message)
+            if key is None:
+                return None
+            keys.append(key)
+        # do not keep credentials in memory longer than necessary
+        return hashlib.sha256(repr(keys).encode()).digest()
+
+    async def _cached_authenticate(self, key, client, message):
+        cached = self._cache.get(key)
+        if cached is not MISSING:
+            _auth_cache.labels('hit' if cached[0] else 'negative_hit').inc()
+            return await self._restore(client, cached)
+
+        in_flight = self._in_flight.get(key)
+        if in_flight is not None:
+            _auth_cache.labels('coalesced').inc()
+            return await self._restore(client, await asyncio.shield(in_flight))
+
+        _auth_cache.labels('miss').inc()
+        in_flight = asyncio.ensure_future(
+            self._authenticate(client, message))
+        self._in_flight[key] = in_flight
+        try:
+            result = await asyncio.shield(in_flight)
+        finally:
+            del self._in_flight[key]
+        ttl = None if result[0] is not None else self._negative_ttl
+        self._cache.set(key, result, ttl)
+        return result[:2]
+
+    async def _restore(self, client, result):
+        """
+        Give client authenticated from cache what the authenticator gave
+        the client it actually authenticated
+        """
+        auth, data, items = result
+        if auth is not None:
+            for name, value in items.items():
+                client[name] = value
+            await auth.restore(client, data)
+        return auth, data
+
+    async def _authenticate(self, client, message):
+        """
+        :return tuple: authenticator which succeeded (None if none did),
+            profile data and items it set on the client
+        """
+        before = {name: client[name] for name in client}
+        for auth in self._app.get('authenticators', ()):
+            result, data = await auth.authenticate(client, message)
+            if result:
+                items = {name: client[name] for name in client
+                         if before.get(name, MISSING) is not client[name]}
+                return auth, data, items
+        return None, None, None
+
     async def _send_response(self, client, message, result):
         """
         Send result of authentication to client if possible
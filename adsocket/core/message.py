@@ -1,19 +1,15 @@
-import json
 import logging
 
+from .codecs import codecs
+
 _logger = logging.getLogger(__name__)
 
 
 class Message:
 
-    type = None
-    channel = None
-    channel_id = None
-    data = None
-    kwargs = None
-    request_id = None
-    _response_data = None
-    _response_id = None
+    __slots__ = ('type', 'channel', 'channel_id', 'data', 'kwargs',
+                 'request_id', 'seq', '_response_data', '_response_id',
+                 '_encoded')
 
     def __init__(self, type, data, request_id=None,
                  channel=None, **kwargs):
@@ -21,7 +17,12 @@ class Message:
         self.data = data
         self.request_id = request_id
         self.channel = channel
+        self.channel_id = None
         self.kwargs = kwargs
+        self.seq = None
+        self._response_data = None
+        self._response_id = None
+        self._encoded = None
 
     def validate(self, data):
         pass
@@ -44,9 +45,57 @@ class Message:
         kwargs['request_id'] = data.pop('request_id', None)
         kwargs['channel'] = data.pop('channel', None)
         kwargs['channel_id'] = data.pop('channel_id', None)
+        kwargs['origin'] = data.pop('origin', None)
         return cls(t, data=message_data, **kwargs)
 
     def to_json(self):
+        return self.encode(codecs.json)
+
+    def encode(self, codec):
+        """
+        Encode message into the frame sent over the websocket. The result is
+        cached per codec so a message fanned out to many clients is encoded
+        only once for each codec in use.
+
+        :param adsocket.core.codecs.Codec codec: codec to use
+        :return str|bytes:
+        """
+        encoded = self._encoded
+        if encoded is None:
+            encoded = self._encoded = {}
+        frame = encoded.get(codec)
+        if frame is None:
+            frame = encoded[codec] = codec.encode(self.as_dict())
+        return frame
+
+    def deflated(self, codec, deflate):
+        """
+        Complete websocket frame for sockets sharing compression parameters,
+        built once per codec and parameters
+
+        :param adsocket.core.codecs.Codec codec: codec to use
+        :param adsocket.ws.compression.Deflate deflate: compression
+        :return adsocket.ws.compression.WireFrame:
+        """
+        key = (codec, deflate)
+        encoded = self._encoded
+        frame = encoded.get(key) if encoded is not None else None
+        if frame is None:
+            frame = deflate.frame(self.encode(codec), codec.binary)
+            self._encoded[key] = frame
+        return frame
+
+    def encoded_size(self) -> int:
+        """
+        Size of frames cached on the message so far
+
+        :return int:
+        """
+        if self._encoded is None:
+            return 0
+        return sum(len(frame) for frame in self._encoded.values())
+
+    def as_dict(self):
         data = {
             'type': self.type,
             'data': self._response_data or self.data
@@ -60,8 +109,10 @@ class Message:
             data['channel'] = self.channel
         if self.channel_id:
             data['channel_id'] = self.channel_id
+        if self.seq is not None:
+            data['seq'] = self.seq
 
-        return json.dumps(data)
+        return data
 
     def set_response(self, data):
         if not self.can_respond():
@@ -69,6 +120,16 @@ class Message:
 
         self._response_id = self.request_id
         self._response_data = data
+        self._encoded = None
+
+    def set_seq(self, seq):
+        """
+        Set sequence number given to the message by channel history
+
+        :param int seq: sequence number
+        """
+        self.seq = seq
+        self._encoded = None
 
     def __getitem__(self, key):
         return self.data[key]
@@ -0,0 +1,239 @@
+"""
+Cheap in-process metrics. Counters and gauges are plain numbers updated
+in place, nothing is computed until somebody asks for the values. Values
+are exposed in Prometheus text format by :func:`exposition`.
+"""
+import bisect
+import logging
+import math
+
+__all__ = [
+    'Counter',
+    'Gauge',
+    'Histogram',
+    'Registry',
+    'exposition',
+    'registry',
+]
+
+_logger = logging.getLogger(__name__)
+
+
+class _Value:
+
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramValue:
+
+    __slots__ = ('bounds', 'buckets', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metric:
+    """
+    Base metric. Metric with label names holds one value per combination
+    of label values, see :meth:`labels`.
+    """
+
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def labels(self, *values):
+        """
+        Return value for given label values. Keep the result around on hot
+        paths, the lookup is the only cost worth saving.
+
+        :param values: label values in order of label names
+        :return _Value:
+        """
+        value = self._values.get(values)
+        if value is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"Metric {self.name} expects labels "
+                                 f"{self.labelnames}")
+            value = self._values[values] = self._new_value()
+        return value
+
+    def _new_value(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def samples(self):
+        """
+        :return list: (suffix, labels dict, value) triples
+        """
+        return [('', dict(zip(self.labelnames, values)), v.value)
+                for values, v in self._values.items()]
+
+
+class Counter(Metric):
+
+    type = 'counter'
+
+
+class Gauge(Metric):
+    """
+    Gauge value is either set explicitly or computed by function given to
+    :meth:`set_function` when collected
+    """
+
+    type = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function = None
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def set_function(self, function):
+        self._function = function
+
+    def samples(self):
+        if self._function is not None:
+            return [('', {}, self._function())]
+        return super().samples()
+
+
+DEFAULT_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5,
+                   1, 2.5, 5, 10)
+
+
+class Histogram(Metric):
+    """
+    Observations are counted into buckets given by their upper bounds.
+    Observing is one bisect and three additions, cumulative counts are
+    computed only when collected.
+    """
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_value(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        result = []
+        for values, v in self._values.items():
+            labels = dict(zip(self.labelnames, values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), v.buckets):
+                cumulative += count
+                result.append(('_bucket', dict(labels, le=_format(bound)),
+                               cumulative))
+            result.append(('_sum', labels, v.sum))
+            result.append(('_count', labels, v.count))
+        return result
+
+
+class Registry:
+    """
+    Holds all metrics of the application
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _get_or_create(self, klazz, name, documentation, labelnames,
+                       **kwargs):
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = klazz(name, documentation,
+                                                 labelnames, **kwargs)
+        elif not isinstance(metric, klazz):
+            raise RuntimeError(f"Metric {name} is already registered "
+                               f"as {metric.type}")
+        return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(),
+                  buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation,
+                                   labelnames, buckets=buckets)
+
+    def __iter__(self):
+        return iter(list(self._metrics.values()))
+
+
+registry = Registry()
+
+
+def _format(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    return str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n') \
+        .replace('"', '\\"')
+
+
+def exposition(metrics=registry) -> str:
+    """
+    Render metrics in Prometheus text exposition format
+
+    :param Registry metrics: registry to render
+    :return str:
+    """
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for suffix, labels, value in metric.samples():
+            if labels:
+                pairs = ','.join(f'{k}="{_escape(v)}"'
+                                 for k, v in labels.items())
+                lines.append(f"{metric.name}{suffix}{{{pairs}}} "
+                             f"{_format(value)}")
+            else:
+                lines.append(f"{metric.name}{suffix} {_format(value)}")
+    lines.append('')
+    return '\n'.join(lines)
@@ -1,14 +1,51 @@
 import abc
+import logging
+
+from .cache import MISSING, TTLCache
+from .metrics import registry
+
+_logger = logging.getLogger(__name__)
+
+_lookups = registry.counter(
+    'adsocket_permission_cache_total',
+    "Permission cache lookups by result",
+    ('result',))
 
 
 class Permission(abc.ABC):
     """
     Base permission class. All other permission must instances of this class
+
+    Permission with `cacheable` set to True promises that its decision
+    depends only on the channel and the identity of the client, such
+    decisions are kept in :data:`permission_cache` for `cache_ttl` seconds
+    (cache default if None). Single instance of cacheable permission is
+    shared by all channels and checks, so it must not keep per-check state.
+    Other permissions get new instance for every check.
+
+    Permission asking a backend may implement :meth:`can_join_many` to
+    authorize all channels of one subscribe message in single call.
     """
 
+    cacheable = False
+    cache_ttl = None
+
     async def can_join(self, channel, client, message):
         pass
 
+    async def can_join_many(self, channels, client, message):
+        """
+        Decide about joining several channels at once
+
+        :param list channels: channel instances
+        :param client: client
+        :param message: subscribe message
+        :return list: decision for every channel in the same order, None for
+            channel which should be asked through :meth:`can_join`, or None
+            instead of the list to ask :meth:`can_join` for every channel
+        """
+        return None
+
     async def can_write(self, channel, client, message):
         pass
 
@@ -29,4 +66,122 @@ class IsAuthenticatedPermission(Permission):
     Check whether client is authenticated.. nothing else
     """
     async def can_join(self, channel, client, message):
-        return client.is_authenticated()
+        return await client.is_authenticated()
+
+
+class PermissionCache:
+    """
+    Cache of join decisions of cacheable permissions keyed by channel uid,
+    client identity and permission class
+    """
+
+    def __init__(self, max_size=100000, ttl=30.0):
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+        self._hits = _lookups.labels('hit')
+        self._misses = _lookups.labels('miss')
+
+    def configure(self, max_size, ttl):
+        self._cache.max_size = max_size
+        self._cache.ttl = ttl
+        self._cache.clear()
+
+    async def can_join(self, permission, channel, client, message) -> bool:
+        """
+        Ask permission unless there is cached decision
+
+        :param Permission permission: permission instance
+        :param Channel channel: channel client is joining
+        :param Client client: client
+        :param Message message: subscribe message
+        :return bool:
+        """
+        if not permission.cacheable:
+            return bool(await permission.can_join(channel, client, message))
+
+        key = (channel.uid, client.identity, permission.__class__)
+        result = self._cache.get(key)
+        if result is not MISSING:
+            self._hits.inc()
+            return result
+        self._misses.inc()
+        result = bool(await permission.can_join(channel, client, message))
+        self._cache.set(key, result, permission.cache_ttl)
+        return result
+
+    async def can_join_many(self, permission, channels, client,
+                            message) -> list:
+        """
+        Ask permission about all channels at once, cached decisions are not
+        asked again
+
+        :param Permission permission: permission instance
+        :param list channels: channels client is joining
+        :param Client client: client
+        :param Message message: subscribe message
+        :return list: True, False or None (not decided) for every channel
+        """
+        if type(permission).can_join_many is Permission.can_join_many:
+            return [None] * len(channels)
+        if not permission.cacheable:
+            return self._decisions(
+                await permission.can_join_many(channels, client, message),
+                len(channels))
+
+        results = []
+        missing = []
+        for channel in channels:
+            key = (channel.uid, client.identity, permission.__class__)
+            result = self._cache.get(key)
+            if result is MISSING:
+                self._misses.inc()
+                missing.append((len(results), key, channel))
+                result = None
+            else:
+                self._hits.inc()
+            results.append(result)
+        if not missing:
+            return results
+
+        decisions = self._decisions(
+            await permission.can_join_many(
+                [channel for _, _, channel in missing], client, message),
+            len(missing))
+        for (index, key, _), decision in zip(missing, decisions):
+            if decision is not None:
+                self._cache.set(key, decision, permission.cache_ttl)
+            results[index] = decision
+        return results
+
+    @staticmethod
+    def _decisions(results, count):
+        if results is None:
+            return [None] * count
+        return [None if result is None else bool(result)
+                for result in results]
+
+    def invalidate(self, channel=None, identity=None, permission=None):
+        """
+        Forget cached decisions. Without arguments everything is forgotten,
+        otherwise only decisions matching all given arguments.
+
+        :param str channel: channel uid
+        :param identity: client identity
+        :param type permission: permission class
+        :return int: number of forgotten decisions
+        """
+        if channel is None and identity is None and permission is None:
+            count = len(self._cache)
+            self._cache.clear()
+            return count
+
+        def matches(key):
+            return (channel is None or key[0] == channel) and \
+                   (identity is None or key[1] == identity) and \
+                   (permission is None or key[2] is permission)
+
+        count = self._cache.delete_matching(matches)
+        _logger.debug(f"{count} cached permission decisions invalidated")
+        return count
+
+
+permission_cache = PermissionCache()
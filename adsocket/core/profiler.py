@@ -0,0 +1,114 @@
+"""
+Sampling profiler which can be switched on and off in running process.
+
+Background thread looks at the stack of the event loop thread every
+`interval` seconds and counts how many times each stack was seen. Code
+blocking the loop shows up in many samples. Nothing is hooked into the
+interpreter, so the loop runs at full speed while profiler is off and
+nearly so while it's on.
+"""
+import collections
+import logging
+import sys
+import threading
+import time
+
+__all__ = [
+    'SamplingProfiler',
+    'profiler',
+]
+
+_logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stacks = collections.Counter()
+        self._samples = 0
+        self._thread = None
+        self._stop = None
+        self._started = None
+        self._stopped = None
+        self._interval = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self, thread_id=None, interval=0.005, max_depth=64):
+        """
+        Start sampling, previously collected samples are thrown away
+
+        :param int thread_id: thread to sample, current thread by default
+        :param float interval: seconds between samples
+        :param int max_depth: frames kept of the deepest stacks
+        """
+        if self.running:
+            raise RuntimeError("Profiler is already running")
+        if thread_id is None:
+            thread_id = threading.get_ident()
+        with self._lock:
+            self._stacks = collections.Counter()
+            self._samples = 0
+        self._stop = threading.Event()
+        self._started = time.monotonic()
+        self._stopped = None
+        self._interval = interval
+        self._thread = threading.Thread(
+            target=self._run, name='adsocket-profiler', daemon=True,
+            args=(thread_id, interval, max_depth, self._stop))
+        self._thread.start()
+        _logger.warning(f"Sampling profiler started, interval {interval}s")
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._stopped = time.monotonic()
+        _logger.warning(f"Sampling profiler stopped after "
+                        f"{self._samples} samples")
+
+    def _run(self, thread_id, interval, max_depth, stop):
+        while not stop.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < max_depth:
+                code = frame.f_code
+                module = frame.f_globals.get('__name__', '?')
+                stack.append(f"{module}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            stack.reverse()
+            with self._lock:
+                self._stacks[';'.join(stack)] += 1
+                self._samples += 1
+
+    def status(self) -> dict:
+        seconds = 0
+        if self._started is not None:
+            seconds = (self._stopped or time.monotonic()) - self._started
+        return {
+            'running': self.running,
+            'samples': self._samples,
+            'interval': self._interval,
+            'seconds': seconds,
+        }
+
+    def collapsed(self) -> str:
+        """
+        Samples in collapsed stack format (one `frame;frame;frame count`
+        line per stack), ready for flame graph tools
+
+        :return str:
+        """
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return ''.join(f"{stack} {count}\n" for stack, count in stacks)
+
+
+profiler = SamplingProfiler()
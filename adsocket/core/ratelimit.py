@@ -0,0 +1,177 @@
+"""
+Token bucket rate limiting of inbound websocket messages.
+
+Every connection gets bucket for messages, bucket for bytes and bucket for
+every command type having its own budget. Taking from the bucket never
+fails, bucket goes into debt instead and tells how long the connection has
+to wait until the debt is paid. Reading from the socket is paused meanwhile,
+so the client is throttled by TCP. Every throttled message is one violation
+no matter how many buckets it exceeded, connection with too many violations
+in a row is closed. Checking a message
+costs a few arithmetic operations no matter the number of connections.
+"""
+import time
+
+from .metrics import registry
+
+__all__ = [
+    'TokenBucket',
+    'RateLimitPolicy',
+    'RateLimiter',
+]
+
+_throttled = registry.counter(
+    'adsocket_rate_limited_total',
+    "Inbound messages delayed by rate limiting by bucket",
+    ('bucket',))
+_disconnects = registry.counter(
+    'adsocket_rate_limit_disconnects_total',
+    "Connections closed for exceeding allowed rate limit violations")
+
+
+class TokenBucket:
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, amount, now) -> float:
+        """
+        Take tokens out of the bucket
+
+        :param float amount: tokens to take
+        :param float now: monotonic time
+        :return float: seconds to wait until the bucket is out of debt
+        """
+        tokens = self.tokens + (now - self.updated) * self.rate
+        if tokens > self.burst:
+            tokens = self.burst
+        tokens -= amount
+        self.tokens = tokens
+        self.updated = now
+        if tokens >= 0:
+            return 0.0
+        return -tokens / self.rate
+
+
+class RateLimitPolicy:
+    """
+    Limits shared by all connections, see `RATE_LIMIT` setting
+    """
+
+    def __init__(self, enabled=True, messages=None, bytes=None,
+                 commands=None, max_message_size=4 * 1024 * 1024,
+                 max_violations=10):
+        self.enabled = enabled
+        self.max_message_size = max_message_size
+        self.messages = self._budget(messages)
+        self.bytes = self._budget(bytes)
+        self.commands = {name: self._budget(budget)
+                         for name, budget in (commands or {}).items()}
+        self.max_violations = max_violations
+
+    @staticmethod
+    def _budget(budget):
+        if not budget or not budget.get('rate'):
+            return None
+        return budget['rate'], budget.get('burst', budget['rate'])
+
+    def limiter(self):
+        """
+        Create limiter for new connection
+
+        :return RateLimiter:
+        """
+        return RateLimiter(self)
+
+
+class RateLimiter:
+    """
+    Buckets of single connection. Command buckets are created on first use
+    of the command, idle connection holds two buckets at most.
+    """
+
+    __slots__ = ('_policy', '_messages', '_bytes', '_commands', 'violations',
+                 '_throttled')
+
+    def __init__(self, policy: RateLimitPolicy):
+        now = time.monotonic()
+        self._policy = policy
+        self._messages = None
+        self._bytes = None
+        self._commands = None
+        self.violations = 0
+        self._throttled = False
+        if policy.messages is not None:
+            self._messages = TokenBucket(*policy.messages, now)
+        if policy.bytes is not None:
+            self._bytes = TokenBucket(*policy.bytes, now)
+
+    def frame(self, size) -> float:
+        """
+        Account for inbound frame before it's decoded, the frame starts new
+        message
+
+        :param int size: frame size in bytes
+        :return float: seconds the connection must wait
+        """
+        if not self._throttled:
+            # violations count only in a row
+            self.violations = 0
+        self._throttled = False
+        now = time.monotonic()
+        delay = 0.0
+        if self._messages is not None:
+            delay = self._messages.take(1, now)
+            if delay:
+                _throttled.labels('messages').inc()
+        if self._bytes is not None:
+            wait = self._bytes.take(size, now)
+            if wait:
+                _throttled.labels('bytes').inc()
+                delay = max(delay, wait)
+        if delay:
+            self._violation()
+        return delay
+
+    def command(self, name) -> float:
+        """
+        Account for command about to be executed
+
+        :param str name: command name
+        :return float: seconds the connection must wait
+        """
+        budget = self._policy.commands.get(name)
+        if budget is None:
+            return 0.0
+        now = time.monotonic()
+        if self._commands is None:
+            self._commands = {}
+        bucket = self._commands.get(name)
+        if bucket is None:
+            bucket = self._commands[name] = TokenBucket(*budget, now)
+        delay = bucket.take(1, now)
+        if delay:
+            _throttled.labels(f"command:{name}").inc()
+            self._violation()
+        return delay
+
+    def _violation(self):
+        if not self._throttled:
+            self._throttled = True
+            self.violations += 1
+
+    def exceeded(self) -> bool:
+        """
+        Did the connection exceed allowed violations
+
+        :return bool: True if connection should be closed
+        """
+        if self.violations > self._policy.max_violations:
+            _disconnects.inc()
+            return True
+        return False
@@ -32,6 +32,9 @@ class Signal:
         if lookup_key in self._receivers:
             self._receivers.remove(lookup_key)
 
+    def has_receivers(self):
+        return bool(self._receivers)
+
     async def send(self, sender=ANY, **kwargs):
         """
 
@@ -0,0 +1,131 @@
+"""
+Hashed timing wheel for coarse per-connection and per-channel deadlines.
+
+Sleeping task or `call_later` handle per deadline costs a heap entry in the
+event loop and O(log n) to schedule or cancel. Deadlines like "disconnect if
+not authenticated in 30s" or "remove empty channel in 12s" do not need to be
+precise, so they are put into buckets of a wheel instead. Scheduling and
+cancelling is O(1) and the loop knows about single handle ticking every
+`resolution` seconds. Timers fire up to one `resolution` late.
+"""
+import asyncio
+import logging
+import math
+
+__all__ = [
+    'Timer',
+    'TimerWheel',
+]
+
+_logger = logging.getLogger(__name__)
+
+
+class Timer:
+
+    __slots__ = ('callback', 'args', 'rounds', '_bucket')
+
+    def __init__(self, callback, args, rounds, bucket):
+        self.callback = callback
+        self.args = args
+        self.rounds = rounds
+        self._bucket = bucket
+
+    def cancel(self):
+        """
+        Cancel the timer, it's safe to cancel timer which already fired
+        """
+        if self._bucket is not None:
+            self._bucket.discard(self)
+            self._bucket = None
+
+    @property
+    def active(self) -> bool:
+        return self._bucket is not None
+
+
+class TimerWheel:
+    """
+    Wheel of `slots` buckets, cursor moves by one bucket every `resolution`
+    seconds and fires timers of the bucket which are due in this round.
+    Wheel stops ticking while it has no timers.
+
+    Callback may be coroutine function, the coroutine is then run as a task
+    once the timer fires.
+    """
+
+    def __init__(self, loop=None, resolution=1.0, slots=512):
+        self._loop = loop or asyncio.get_event_loop()
+        self._resolution = resolution
+        self._buckets = [set() for _ in range(slots)]
+        self._cursor = 0
+        self._next_tick = None
+        self._handle = None
+
+    def schedule(self, delay, callback, *args) -> Timer:
+        """
+        Call `callback(*args)` after `delay` seconds
+
+        :param float delay: seconds
+        :param callable callback: function or coroutine function
+        :return Timer: timer which can be cancelled
+        """
+        if self._handle is None:
+            self._next_tick = self._loop.time() + self._resolution
+            self._handle = self._loop.call_at(self._next_tick, self._tick)
+        due = self._loop.time() + delay - self._next_tick
+        ticks = max(0, math.ceil(due / self._resolution))
+        rounds, offset = divmod(ticks, len(self._buckets))
+        bucket = self._buckets[(self._cursor + offset) % len(self._buckets)]
+        timer = Timer(callback, args, rounds, bucket)
+        bucket.add(timer)
+        return timer
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets)
+
+    def _tick(self):
+        now = self._loop.time()
+        # catch up if the loop was busy for longer than one tick
+        while self._next_tick <= now:
+            self._next_tick += self._resolution
+            self._advance()
+        if any(self._buckets):
+            self._handle = self._loop.call_at(self._next_tick, self._tick)
+        else:
+            self._handle = None
+
+    def _advance(self):
+        bucket = self._buckets[self._cursor]
+        self._cursor = (self._cursor + 1) % len(self._buckets)
+        if not bucket:
+            return
+        due = []
+        for timer in bucket:
+            if timer.rounds:
+                timer.rounds -= 1
+            else:
+                due.append(timer)
+        for timer in due:
+            bucket.discard(timer)
+            timer._bucket = None
+            self._fire(timer)
+
+    def _fire(self, timer):
+        try:
+            result = timer.callback(*timer.args)
+            if asyncio.iscoroutine(result):
+                asyncio.ensure_future(result)
+        except Exception as e:
+            _logger.exception(e)
+
+    def close(self):
+        """
+        Stop ticking and forget all timers
+        """
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        for bucket in self._buckets:
+            for timer in bucket:
+                timer._bucket = None
+            bucket.clear()
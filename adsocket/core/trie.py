@@ -0,0 +1,85 @@
+"""
+Prefix trie matching channel ids against pattern subscriptions.
+
+Pattern `eu-*` is stored under key `eu-`. Looking up channel id walks the
+trie character by character and picks every pattern found on the way, so
+the cost depends on length of the id, not on number of patterns.
+"""
+
+__all__ = [
+    'PrefixTrie',
+]
+
+
+class _Node:
+
+    __slots__ = ('children', 'value')
+
+    def __init__(self):
+        self.children = {}
+        self.value = None
+
+
+class PrefixTrie:
+
+    def __init__(self):
+        self._root = _Node()
+        self._size = 0
+
+    def add(self, prefix: str, value):
+        node = self._root
+        for char in prefix:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _Node()
+            node = child
+        if node.value is None:
+            self._size += 1
+        node.value = value
+
+    def remove(self, prefix: str):
+        """
+        Remove value stored under prefix and nodes left without purpose
+
+        :param str prefix: prefix
+        :return: removed value or None
+        """
+        path = []
+        node = self._root
+        for char in prefix:
+            child = node.children.get(char)
+            if child is None:
+                return None
+            path.append((node, char))
+            node = child
+        value, node.value = node.value, None
+        if value is not None:
+            self._size -= 1
+        for parent, char in reversed(path):
+            child = parent.children[char]
+            if child.value is not None or child.children:
+                break
+            del parent.children[char]
+        return value
+
+    def match(self, key: str) -> list:
+        """
+        Values stored under all prefixes of the key, shortest prefix first
+
+        :param str key: e.g. channel id
+        :return list:
+        """
+        result = []
+        node = self._root
+        if node.value is not None:
+            result.append(node.value)
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                break
+            if node.value is not None:
+                result.append(node.value)
+        return result
+
+    def __len__(self):
+        return self._size
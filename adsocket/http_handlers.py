@@ -1,5 +1,11 @@
+import asyncio
+import hmac
+
 from aiohttp import web
 
+from adsocket.core.metrics import exposition
+from adsocket.core.profiler import profiler
+
 
 async def ping_handler(request, **kwargs):
     """
@@ -11,4 +17,79 @@ async def ping_handler(request, **kwargs):
     :return:
     :rtype:
     """
+    if request.app['draining']:
+        # let load balancer know it should not send anybody here
+        return web.Response(text='draining', status=503)
     return web.Response(text='pong')
+
+
+async def metrics_handler(request, **kwargs):
+    """
+    Metrics in Prometheus text format
+
+    :param aiohttp.web.Request request: request
+    :return aiohttp.web.Response:
+    """
+    return web.Response(text=exposition(),
+                        content_type='text/plain; version=0.0.4')
+
+
+def _is_admin(request) -> bool:
+    token = request.app['settings'].ADMIN_TOKEN
+    if not token:
+        return False
+    header = request.headers.get('Authorization', '')
+    return hmac.compare_digest(header.encode(), f"Bearer {token}".encode())
+
+
+async def profiler_handler(request, **kwargs):
+    """
+    Sampling profiler control. `POST` starts profiling of the event loop
+    thread (optional `interval` query parameter in seconds), `DELETE` stops
+    it and returns samples in collapsed stack format, `GET` returns status
+    or samples collected so far with `?format=collapsed`.
+
+    :param aiohttp.web.Request request: request
+    :return aiohttp.web.Response:
+    """
+    if not _is_admin(request):
+        raise web.HTTPForbidden()
+
+    if request.method == 'POST':
+        if profiler.running:
+            raise web.HTTPConflict(text="Profiler is already running")
+        try:
+            interval = float(request.query.get('interval', 0.005))
+        except ValueError:
+            raise web.HTTPBadRequest(text="Invalid interval")
+        profiler.start(interval=max(interval, 0.001))
+        return web.json_response(profiler.status())
+
+    if request.method == 'DELETE':
+        profiler.stop()
+        return web.Response(text=profiler.collapsed())
+
+    if request.query.get('format') == 'collapsed':
+        return web.Response(text=profiler.collapsed())
+    return web.json_response(profiler.status())
+
+
+async def drain_handler(request, **kwargs):
+    """
+    Switch node to drain mode: new websocket connections are refused,
+    `/_ping` answers 503 and connected clients are closed in background,
+    see `DRAIN` setting. Process keeps running.
+
+    :param aiohttp.web.Request request: request
+    :return aiohttp.web.Response:
+    """
+    if not _is_admin(request):
+        raise web.HTTPForbidden()
+    app = request.app
+    if app['draining']:
+        raise web.HTTPConflict(text="Already draining")
+    app['draining'] = True
+    asyncio.ensure_future(
+        app['client_pool'].drain(**app['settings'].DRAIN))
+    return web.json_response(
+        {'clients': await app['client_pool'].active_count()}, status=202)
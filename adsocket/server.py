@@ -1,22 +1,52 @@
+import argparse
+import asyncio
+import json
 import logging
 import os
+import time
 from aiohttp import web
 
 from adsocket.core import application, loop
 from adsocket.version import __version__
 from adsocket.core.utils import import_module
+from adsocket.supervisor import Supervisor, WORKER_ID_ENV, HEALTH_FD_ENV
 
 _logger = logging.getLogger('adsocket')
 
 
-def run_loop():
+def _parse_args(args=None):
+    parser = argparse.ArgumentParser(prog='adsocket')
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Number of worker processes sharing the port. "
+                             "Defaults to WORKERS setting")
+    return parser.parse_args(args)
+
+
+async def _report_health(app, fd, interval):
     """
-    Runs the main asyncio event loop. This will run forever till interrupted
+    Worker periodically tells supervisor how it's doing
+
+    :param aiohttp.web.Application app: Application instance
+    :param int fd: write end of the health pipe
+    :param float interval: seconds between reports
     """
-    hello_msg = "ADSocket {}".format(__version__)
+    while True:
+        report = {
+            'worker': os.getenv(WORKER_ID_ENV),
+            'pid': os.getpid(),
+            'clients': await app['client_pool'].active_count(),
+            'channels': len(app['channels']) if 'channels' in app else 0,
+            'ts': time.time(),
+        }
+        try:
+            os.write(fd, json.dumps(report).encode() + b'\n')
+        except OSError:
+            _logger.error("Supervisor is gone, stopping health reports")
+            return
+        await asyncio.sleep(interval)
 
-    _logger.info(hello_msg)
 
+def _create_app():
     if os.getenv('ADSOCKET_APPLICATION', None):
         factory = import_module(os.getenv('ADSOCKET_APPLICATION', None))
         app = factory(loop)
@@ -26,13 +56,46 @@ def run_loop():
             raise RuntimeError(msg)
     else:
         app = application.factory(loop)
+    return app
+
+
+def run_loop():
+    """
+    Runs the main asyncio event loop. This will run forever till interrupted.
+    With more than one worker, supervisor is started instead and each worker
+    runs its own loop in separate process.
+    """
+    hello_msg = "ADSocket {}".format(__version__)
+
+    _logger.info(hello_msg)
+
+    args = _parse_args()
+    worker = os.getenv(WORKER_ID_ENV, None)
+    if worker is None:
+        from adsocket.conf import app_settings
+        workers = args.workers or app_settings.WORKERS
+        if workers > 1:
+            _logger.info(f"Starting {workers} workers")
+            Supervisor(
+                workers,
+                health_timeout=app_settings.WORKER_HEALTH_TIMEOUT,
+            ).run()
+            return
+
+    app = _create_app()
     if not app:
         _logger.info("Shutdown")
         return
     port = app['settings'].PORT
     host = '0.0.0.0'
-    _logger.info(f"Listening on {host}:{port}")
-    web.run_app(app, host=host, port=port)
+    if worker is not None:
+        fd = int(os.environ[HEALTH_FD_ENV])
+        interval = app['settings'].WORKER_HEALTH_INTERVAL
+        loop.create_task(_report_health(app, fd, interval))
+        _logger.info(f"Worker {worker} listening on {host}:{port}")
+    else:
+        _logger.info(f"Listening on {host}:{port}")
+    web.run_app(app, host=host, port=port, reuse_port=worker is not None)
 
 
 if __name__ == '__main__':
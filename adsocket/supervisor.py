@@ -0,0 +1,170 @@
+"""
+Multi-process mode. Supervisor starts N worker processes which all listen on
+the same port (SO_REUSEPORT) and every one of them runs its own client pool,
+channel pool and broker. Workers report their health through a pipe, dead or
+silent workers are restarted.
+"""
+import json
+import logging
+import os
+import selectors
+import signal
+import subprocess
+import sys
+import time
+
+_logger = logging.getLogger('adsocket')
+
+WORKER_ID_ENV = 'ADSOCKET_WORKER_ID'
+HEALTH_FD_ENV = 'ADSOCKET_HEALTH_FD'
+
+
+class Worker:
+    """
+    Single worker process as seen by supervisor
+    """
+
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.process = None
+        self.health = {}
+        self.last_seen = None
+        self.started = None
+        self.restarts = 0
+        self._fd = None
+        self._buffer = b''
+
+    def start(self, selector):
+        read_fd, write_fd = os.pipe()
+        env = dict(os.environ)
+        env[WORKER_ID_ENV] = str(self.worker_id)
+        env[HEALTH_FD_ENV] = str(write_fd)
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'adsocket.server'],
+            env=env,
+            pass_fds=(write_fd,))
+        os.close(write_fd)
+        self._fd = read_fd
+        self._buffer = b''
+        self.health = {}
+        self.started = self.last_seen = time.monotonic()
+        selector.register(read_fd, selectors.EVENT_READ, self)
+        _logger.info(f"Worker {self.worker_id} started "
+                     f"(pid {self.process.pid})")
+
+    def read_health(self, selector):
+        try:
+            data = os.read(self._fd, 65536)
+        except OSError:
+            data = b''
+        if not data:
+            self.close_pipe(selector)
+            return
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b'\n')
+        for line in lines:
+            try:
+                self.health = json.loads(line)
+            except ValueError:
+                _logger.warning(f"Worker {self.worker_id} sent "
+                                f"malformed health report")
+                continue
+            self.last_seen = time.monotonic()
+
+    def close_pipe(self, selector):
+        if self._fd is None:
+            return
+        selector.unregister(self._fd)
+        os.close(self._fd)
+        self._fd = None
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def stop(self, sig=signal.SIGTERM):
+        if self.is_alive():
+            self.process.send_signal(sig)
+
+
+class Supervisor:
+    """
+    Starts and watches worker processes
+    """
+
+    def __init__(self, workers, health_timeout=30.0, report_interval=30.0,
+                 restart_delay=1.0):
+        self._workers = [Worker(i) for i in range(workers)]
+        self._health_timeout = health_timeout
+        self._report_interval = report_interval
+        self._restart_delay = restart_delay
+        self._selector = selectors.DefaultSelector()
+        self._running = False
+
+    def health(self) -> dict:
+        """
+        Aggregated health of all workers
+
+        :return dict:
+        """
+        result = {
+            'workers': len(self._workers),
+            'alive': 0,
+            'restarts': 0,
+            'clients': 0,
+            'channels': 0,
+        }
+        for worker in self._workers:
+            result['restarts'] += worker.restarts
+            if not worker.is_alive():
+                continue
+            result['alive'] += 1
+            result['clients'] += worker.health.get('clients', 0)
+            result['channels'] += worker.health.get('channels', 0)
+        return result
+
+    def _stop(self, signum, frame):
+        _logger.info(f"Received signal {signum}, stopping workers")
+        self._running = False
+
+    def _check(self, worker):
+        now = time.monotonic()
+        if worker.is_alive():
+            if now - worker.last_seen < self._health_timeout:
+                return
+            _logger.error(f"Worker {worker.worker_id} has not reported for "
+                          f"{self._health_timeout}s, killing it")
+            worker.stop(signal.SIGKILL)
+            worker.process.wait()
+
+        if now - worker.started < self._restart_delay:
+            # do not spin when worker dies right after start
+            return
+        _logger.error(f"Worker {worker.worker_id} died "
+                      f"(exit code {worker.process.returncode}), restarting")
+        worker.close_pipe(self._selector)
+        worker.restarts += 1
+        worker.start(self._selector)
+
+    def run(self):
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGTERM, self._stop)
+        self._running = True
+        for worker in self._workers:
+            worker.start(self._selector)
+
+        next_report = time.monotonic() + self._report_interval
+        while self._running:
+            for key, _ in self._selector.select(timeout=1.0):
+                key.data.read_health(self._selector)
+            for worker in self._workers:
+                self._check(worker)
+            if time.monotonic() >= next_report:
+                _logger.info(f"Workers health: {json.dumps(self.health())}")
+                next_report += self._report_interval
+
+        for worker in self._workers:
+            worker.stop()
+        for worker in self._workers:
+            worker.process.wait()
+            worker.close_pipe(self._selector)
+        _logger.info("All workers stopped")
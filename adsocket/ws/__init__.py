@@ -1,17 +1,90 @@
+import asyncio
 import logging
-from aiohttp import web
-import json
+import time
+
 import aiohttp
+from aiohttp import web
 
+from ..core.codecs import codecs
 from ..core.message import Message
+from ..core.metrics import registry
 from .client import Client
+from . import compression
 
 _logger = logging.getLogger(__name__)
 
+_clients_by_codec = registry.gauge(
+    'adsocket_codec_clients',
+    "Connected clients by negotiated codec",
+    ('codec',))
+_command_seconds = registry.histogram(
+    'adsocket_command_seconds',
+    "Command execution time by command",
+    ('command',))
+_stage_seconds = registry.histogram(
+    'adsocket_ws_stage_seconds',
+    "Time of handling incoming websocket message by stage",
+    ('stage',))
+_slow_commands = registry.counter(
+    'adsocket_slow_commands_total',
+    "Commands running longer than SLOW_COMMAND_THRESHOLD",
+    ('command',))
+_decode_seconds = _stage_seconds.labels('decode')
+_dispatch_seconds = _stage_seconds.labels('dispatch')
+
+
+def _observe_command(name, command, elapsed, slow_threshold):
+    """
+    Record command execution time, commands slower than threshold are
+    logged since they are the usual suspects of blocking the loop
+
+    :param str name: command name
+    :param AbstractCommand command: command instance
+    :param float elapsed: execution time in seconds
+    :param float slow_threshold: seconds or None
+    """
+    _command_seconds.labels(name).observe(elapsed)
+    if slow_threshold is not None and elapsed > slow_threshold:
+        _slow_commands.labels(name).inc()
+        _logger.warning(f"Slow command {name} "
+                        f"({command.__class__.__name__}) took "
+                        f"{elapsed * 1000:.1f}ms")
+
+
+async def _throttle(client, limiter, delay):
+    """
+    Stop reading from the client for a while, client which keeps exceeding
+    its limits is disconnected
+
+    :param Client client: client
+    :param adsocket.core.ratelimit.RateLimiter limiter: client's limiter
+    :param float delay: seconds to wait
+    :return bool: False if client was disconnected
+    """
+    if limiter.exceeded():
+        _logger.warning(f"Client {client} keeps exceeding rate limit, "
+                        f"disconnecting")
+        await client.disconnect(aiohttp.WSCloseCode.POLICY_VIOLATION)
+        return False
+    await asyncio.sleep(delay)
+    return True
+
 
 async def ws_handler(request, **kwargs):
-    
-    ws = web.WebSocketResponse(autoping=True, heartbeat=5.0)
+
+    if request.app['draining']:
+        raise web.HTTPServiceUnavailable(text="Draining")
+
+    deflate = request.app['settings'].WEBSOCKET_COMPRESSION
+    rate_limit = request.app['rate_limit']
+    # pings are sent and answered by client pool heartbeat, see
+    # `HEARTBEAT_INTERVAL`
+    ws = compression.DeflateWebSocketResponse(
+        autoping=False,
+        protocols=codecs.subprotocols,
+        compress=deflate['enabled'],
+        no_context_takeover=deflate['no_context_takeover'],
+        max_msg_size=rate_limit.max_message_size)
     try:
 
         await ws.prepare(request)
@@ -19,29 +92,69 @@ async def ws_handler(request, **kwargs):
         _logger.exception(str(e))
         return ws
 
-    c = Client(ws=ws)
+    send_queue = request.app['settings'].CLIENT_SEND_QUEUE
+    codec = codecs.for_subprotocol(ws.ws_protocol)
+    c = Client(ws=ws,
+               send_queue_size=send_queue['size'],
+               slow_consumer_policy=send_queue['policy'],
+               codec=codec,
+               deflate=compression.for_socket(
+                   ws, deflate['level'], deflate['threshold']))
     await request.app['client_pool'].append(c)
+    clients_gauge = _clients_by_codec.labels(codec.name)
+    clients_gauge.inc()
+    slow_threshold = request.app['settings'].SLOW_COMMAND_THRESHOLD
+    limiter = rate_limit.limiter() if rate_limit.enabled else None
 
     try:
         async for msg in ws:
-            if msg.type == aiohttp.WSMsgType.TEXT:
+            # any frame proves the peer is alive
+            c.pong()
+            if msg.type == aiohttp.WSMsgType.PING:
+                await ws.pong(msg.data)
+            elif msg.type == aiohttp.WSMsgType.PONG:
+                pass
+            elif msg.type in (aiohttp.WSMsgType.TEXT,
+                              aiohttp.WSMsgType.BINARY):
+                if limiter is not None:
+                    delay = limiter.frame(len(msg.data))
+                    if delay and not await _throttle(c, limiter, delay):
+                        break
                 # TODO: this is really hack - get rid of it
                 if msg.data == 'ping':
-                    await ws.send_str('pong')
+                    c.send('pong')
                     continue
 
+                if msg.type == aiohttp.WSMsgType.BINARY:
+                    decoder = codec
+                else:
+                    decoder = codecs.json
+                started = time.perf_counter()
                 try:
-                    data = json.loads(msg.data)
+                    data = decoder.decode(msg.data)
                 except Exception as e:
-                    await ws.send_json({"error": "decode_error"})
+                    c.send(codec.encode({"error": "decode_error"}))
                     continue
                 message = Message.from_json(data)
+                decoded = time.perf_counter()
+                _decode_seconds.observe(decoded - started)
+                if limiter is not None:
+                    delay = limiter.command(message.type)
+                    if delay:
+                        if not await _throttle(c, limiter, delay):
+                            break
+                        decoded = time.perf_counter()
                 command = request.app['commander'].get(message.type)
+                dispatched = time.perf_counter()
+                _dispatch_seconds.observe(dispatched - decoded)
                 try:
                     await command.execute(c, message)
                 except Exception as e:
                     _logger.error(f"Error handling command {command}")
                     _logger.exception(str(e))
+                _observe_command(message.type, command,
+                                 time.perf_counter() - dispatched,
+                                 slow_threshold)
 
             elif msg.type == aiohttp.WSMsgType.ERROR:
                 # print('ws connection closed with exception %s' %
@@ -53,6 +166,9 @@ async def ws_handler(request, **kwargs):
     except Exception as e:
         _logger.error(str(e))
     finally:
+        clients_gauge.dec()
+        # stops client's writer, nothing can be sent to closed socket anyway
+        await request.app['client_pool'].remove(c)
         return ws
 
 
@@ -1,47 +1,224 @@
 import logging
 
 from aiohttp.web_ws import WebSocketResponse
-from aiohttp import WSCloseCode
+from aiohttp import WSCloseCode, WSMsgType
 import uuid
 import asyncio
-import weakref
+import collections
+import time
 
+from ..core.codecs import codecs
 from ..core.exceptions import ClientException
 from ..core.message import Message
+from ..core.metrics import registry
+from .compression import WireFrame, build_frame
 
 KICKOUT_CMD = "system.kickout"
 _logger = logging.getLogger(__name__)
 
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+DISCONNECT = 'disconnect'
 
-class Client:
+SLOW_CONSUMER_POLICIES = (DROP_OLDEST, DROP_NEWEST, DISCONNECT)
+
+_NO_CHANNELS = frozenset()
+_PING = WireFrame(build_frame(b'', WSMsgType.PING))
+
+_bytes_out = registry.counter(
+    'adsocket_bytes_out_total',
+    "Bytes of frames written to websockets (characters for text frames "
+    "sent without shared compression)").labels()
+_connections = registry.gauge(
+    'adsocket_connections',
+    "Connected clients")
+_broadcasts = registry.gauge(
+    'adsocket_broadcasts_in_progress',
+    "Server-wide broadcasts being delivered").labels()
+_broadcast_seconds = registry.histogram(
+    'adsocket_broadcast_seconds',
+    "Time of delivering server-wide broadcast to all clients",
+    buckets=(.01, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)).labels()
 
-    _ws = None
-    _request = None
-    _history = []
 
-    _channels = None
+class Client:
+    """
+    Single websocket connection.
+
+    Outgoing frames are not written to the socket directly. They are put into
+    bounded send queue which is drained by client's own writer task, so
+    publishing to the client never waits for the network. Once the queue
+    reaches its size (high-water mark) slow consumer policy applies.
 
-    _client_id = None
-    _profile = {}
-    _authenticated = False
+    Node may hold lots of mostly idle clients, so client has no instance
+    dict and containers (send queue, channels, state, profile) are created
+    only once they are needed.
+    """
 
-    def __init__(self, ws: WebSocketResponse, client_id=None, profile=None):
-        self._ws = weakref.ref(ws)
-        self._channels = weakref.WeakSet()
+    __slots__ = ('_ws', '_channels', '_client_id', '_state', '_profile',
+                 '_authenticated', '_queue', '_queue_size', '_policy',
+                 '_writer', '_waiter', '_drain_waiters', '_dropped',
+                 '_auth_timer', '_heartbeat_timer', '_pong_pending',
+                 '_closing', 'codec', 'deflate')
+
+    def __init__(self, ws: WebSocketResponse, client_id=None, profile=None,
+                 send_queue_size=1000, slow_consumer_policy=DROP_OLDEST,
+                 codec=None, deflate=None):
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ClientException(
+                f"Unknown slow consumer policy {slow_consumer_policy}")
+        self._ws = ws
+        self._channels = None
         self._client_id = client_id or uuid.uuid4()
-        self._state = {}
-        self._profile = profile or {}
+        self._state = None
+        self._profile = profile
         self._authenticated = False
+        self._queue = None
+        self._queue_size = send_queue_size
+        self._policy = slow_consumer_policy
+        self._writer = None
+        self._waiter = None
+        self._drain_waiters = None
+        self._dropped = 0
+        self._auth_timer = None
+        self._heartbeat_timer = None
+        self._pong_pending = False
+        self._closing = False
+        self.codec = codec or codecs.json
+        self.deflate = deflate
 
     @property
     def client_id(self):
         return self._client_id
 
-    async def message(self, msg: Message) -> None:
+    async def message(self, msg: Message) -> bool:
+        return self.deliver(msg)
+
+    def deliver(self, msg: Message) -> bool:
+        """
+        Enqueue message encoded (and compressed) the way the client needs.
+        Encoded frames are cached on the message, so fan-out to many clients
+        encodes and compresses it once.
+
+        :param Message msg: message instance
+        :return bool: False if frame was not accepted
+        """
+        if self.deflate is not None:
+            return self.send(msg.deflated(self.codec, self.deflate))
+        return self.send(msg.encode(self.codec))
+
+    def send(self, frame: str) -> bool:
+        """
+        Enqueue already encoded frame for the client. Frames are shared
+        between all clients a message is fanned out to.
+
+        :param str|bytes|WireFrame frame: message encoded by client's codec
+        :return bool: False if frame was not accepted
+        """
+        if self._ws is None or self._closing:
+            return False
+
+        queue = self._queue
+        if queue is None:
+            queue = self._queue = collections.deque()
+        elif len(queue) >= self._queue_size:
+            if not self._handle_overflow():
+                return False
+
+        queue.append(frame)
+        if self._writer is None:
+            self._writer = asyncio.ensure_future(self._write())
+        elif self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+        return True
+
+    def _handle_overflow(self) -> bool:
+        """
+        Apply slow consumer policy on full queue
+
+        :return bool: True if there is a room for new frame
+        """
+        self._dropped += 1
+        if self._dropped == 1:
+            _logger.warning(f"{self} is not keeping up, "
+                            f"applying '{self._policy}' policy")
+        if self._policy == DROP_OLDEST:
+            self._queue.popleft()
+            return True
+        if self._policy == DISCONNECT:
+            # nothing is accepted until the close is done
+            self._closing = True
+            self._queue.clear()
+            asyncio.ensure_future(
+                self.disconnect(code=WSCloseCode.TRY_AGAIN_LATER))
+        return False
+
+    async def _write(self):
+        """
+        Writer task draining the send queue into the websocket
+        """
+        queue = self._queue
         try:
-            return await self.ws.send_str(msg.to_json())
-        except Exception as e:
-            _logger.exception(e)
+            while True:
+                if not queue:
+                    self._notify_drained()
+                    self._waiter = asyncio.get_event_loop().create_future()
+                    await self._waiter
+                    continue
+
+                ws = self.ws
+                if ws is None or ws.closed:
+                    break
+                frame = queue.popleft()
+                try:
+                    if isinstance(frame, WireFrame):
+                        await frame.write(ws)
+                    elif isinstance(frame, bytes):
+                        await ws.send_bytes(frame)
+                    else:
+                        await ws.send_str(frame)
+                    _bytes_out.inc(len(frame))
+                except Exception as e:
+                    _logger.exception(e)
+        finally:
+            queue.clear()
+            self._notify_drained()
+
+    def _notify_drained(self):
+        waiters, self._drain_waiters = self._drain_waiters, None
+        for waiter in waiters or ():
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def flush(self):
+        """
+        Wait until all enqueued frames are written to the socket
+        """
+        if self._writer is None or self._writer.done():
+            return
+        waiter = self._waiter
+        if not self._queue and waiter is not None and not waiter.done():
+            # writer waits for frames, nothing is being written
+            return
+        waiter = asyncio.get_event_loop().create_future()
+        if self._drain_waiters is None:
+            self._drain_waiters = []
+        self._drain_waiters.append(waiter)
+        await waiter
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of frames waiting in the send queue
+        """
+        return len(self._queue) if self._queue is not None else 0
+
+    @property
+    def dropped(self) -> int:
+        """
+        Number of frames which hit the high-water mark
+        """
+        return self._dropped
 
     async def set_authenticated(self):
         """
@@ -49,55 +226,138 @@ class Client:
         :return void:
         """
         self._authenticated = True
+        if self._auth_timer is not None:
+            self._auth_timer.cancel()
+            self._auth_timer = None
 
     async def is_authenticated(self):
         return bool(self._authenticated)
 
+    def watch_authentication(self, timer):
+        """
+        Keep timer disconnecting the client, it's cancelled once client
+        authenticates
+
+        :param adsocket.core.timers.Timer timer: timer
+        """
+        self._auth_timer = timer
+
+    def watch_heartbeat(self, timer):
+        """
+        Keep timer of the next heartbeat, it's cancelled on disconnect
+
+        :param adsocket.core.timers.Timer timer: timer
+        """
+        self._heartbeat_timer = timer
+
+    def ping(self) -> bool:
+        """
+        Enqueue ping frame unless the previous ping is still unanswered
+
+        :return bool: False if peer did not answer the previous ping
+        """
+        if self._pong_pending:
+            return False
+        self._pong_pending = True
+        if self._queue:
+            # behind frames already waiting
+            self.send(_PING)
+        elif self._ws is not None:
+            # idle client does not need writer task just for ping
+            _PING.write_nowait(self._ws)
+        return True
+
+    def pong(self):
+        """
+        Peer answered the ping (or proved it's alive otherwise)
+        """
+        self._pong_pending = False
+
     @property
     def profile(self):
+        if self._profile is None:
+            self._profile = {}
         return self._profile
 
+    @property
+    def identity(self):
+        """
+        Who is behind the connection. Profile `id` given by authenticator
+        when there is one (it's the same for every connection of the user),
+        otherwise the client id.
+        """
+        if isinstance(self._profile, dict):
+            identity = self._profile.get('id')
+            if identity is not None:
+                return identity
+        return self._client_id
+
     @profile.setter
     def profile(self, data):
         self._profile = data
 
-    async def disconnect(self):
+    async def disconnect(self, code=WSCloseCode.GOING_AWAY):
         """
-        :return:
-        :rtype:
+        Close the websocket and stop the writer. Frames still waiting in the
+        send queue are discarded, call :meth:`flush` first to deliver them.
+
+        :param int code: websocket close code
+        :return void:
         """
-        if not self.ws.closed:
-            await self.ws.close(code=WSCloseCode)
+        ws = self.ws
+        for timer in (self._auth_timer, self._heartbeat_timer):
+            if timer is not None:
+                timer.cancel()
+        self._auth_timer = self._heartbeat_timer = None
+        if self._writer is not None:
+            self._writer.cancel()
+        if ws is not None and not ws.closed:
+            await ws.close(code=code)
         # reset websocket reference
         self._ws = None
 
     @property
     def ws(self):
-        return self._ws()
+        return self._ws
 
     @property
     def channels(self):
-        return self._channels
+        """
+        Channels the client is member of
+        """
+        return self._channels or _NO_CHANNELS
 
     def join_channel(self, channel):
-        if channel in self._channels:
-            return
+        if self._channels is None:
+            self._channels = set()
         self._channels.add(channel)
 
     async def channel_joined(self, channel):
-        self._channels.add(channel)
+        self.join_channel(channel)
+
+    def leave_channel(self, channel):
+        if self._channels is not None:
+            self._channels.discard(channel)
+            if not self._channels:
+                self._channels = None
 
     def __setitem__(self, key, value):
+        if self._state is None:
+            self._state = {}
         self._state[key] = value
 
     def __getitem__(self, key):
+        if self._state is None:
+            raise KeyError(key)
         return self._state[key]
 
     def __delitem__(self, key):
+        if self._state is None:
+            raise KeyError(key)
         del self._state[key]
 
     def __iter__(self):
-        return iter(self._state)
+        return iter(self._state or ())
 
     def __str__(self):
         if self.client_id:
@@ -111,57 +371,76 @@ class ClientPool:
     """
 
     def __init__(self, app):
-        self._clients = weakref.WeakSet()
+        self._clients = set()
         self._app = app
         self._kickout_message = Message(
             type=KICKOUT_CMD,
             data={'reason': "You've not authenticated yourself yet"}
         )
         self._active_count = 0
-        self._app.loop.create_task(self._report())
+        self._heartbeat_interval = app['settings'].HEARTBEAT_INTERVAL
+        broadcast = app['settings'].BROADCAST
+        self._broadcast_chunk = broadcast['chunk_size']
+        self._broadcast_semaphore = asyncio.Semaphore(
+            broadcast['concurrency'])
+        _connections.set_function(lambda: self._active_count)
+
+    @property
+    def _timers(self):
+        return self._app['timers']
 
-    async def _schedule_for_disconnect(self, client: Client):
+    async def _disconnect_unauthenticated(self, client: Client):
         """
         Unauthenticated users should be disconnected after while
 
         :param client:
         :return:
         """
-        await asyncio.sleep(self._app['settings'].DISCONNECT_UNAUTHENTICATED)
         if not await client.is_authenticated():
             await self.kickout(client)
 
-    async def _report(self):
-        while True:
-            await asyncio.sleep(30)
-            _logger.info("Client pool size: {}".format(len(self._clients)))
-
-    def _client_disconnected(self, client: Client):
-        asyncio.ensure_future(self._app['channels'].client_disconnected(client))
+    def _heartbeat(self, client: Client):
+        """
+        Ping the client, client which did not answer the previous ping
+        within the interval is disconnected
+        """
+        if client.ws is None or client.ws.closed:
+            return
+        if not client.ping():
+            _logger.info(f"{client} did not answer ping, disconnecting")
+            return client.disconnect()
+        client.watch_heartbeat(self._timers.schedule(
+            self._heartbeat_interval, self._heartbeat, client))
 
     async def append(self, client: Client):
         if self.is_client(client):
             raise ClientException(f"Client is already member: {client}")
         self._clients.add(client)
-        if self._app['settings'].DISCONNECT_UNAUTHENTICATED:
-            asyncio.ensure_future(self._schedule_for_disconnect(client))
+        delay = self._app['settings'].DISCONNECT_UNAUTHENTICATED
+        if delay:
+            client.watch_authentication(self._timers.schedule(
+                delay, self._disconnect_unauthenticated, client))
+        if self._heartbeat_interval:
+            client.watch_heartbeat(self._timers.schedule(
+                self._heartbeat_interval, self._heartbeat, client))
         self._active_count += 1
-        # This is actually hack.. I don't know why but finalize
-        # for client instance doesn't work
-        weakref.finalize(client.ws, self._client_disconnected, client)
         return True
 
     async def remove(self, client: Client):
         """
-        Remove client from pool
+        Remove client from pool, disconnect it and let it leave all its
+        channels
 
         :param client:
         :return:
         """
-
-        await client.disconnect()
+        if client not in self._clients:
+            return
         self._clients.discard(client)
         self._active_count -= 1
+        await client.disconnect()
+        if 'channels' in self._app:
+            await self._app['channels'].client_disconnected(client)
 
     def is_client(self, client: Client) -> bool:
         """
@@ -179,10 +458,42 @@ class ClientPool:
         """
         return self._active_count
 
-    async def broadcast(self, message: Message):
-        for client in self._clients:
-            client.message(message)
-        return True
+    async def broadcast(self, message: Message, progress=None) -> dict:
+        """
+        Deliver message to every connected client. Message is encoded once
+        per codec, clients are visited in chunks and the loop gets control
+        back after every chunk, so big node keeps serving meanwhile. Number
+        of broadcasts running at once is bounded, others wait for their turn.
+
+        :param Message message: message to deliver
+        :param callable progress: called with number of visited clients and
+            number of all clients after every chunk
+        :return dict: number of clients, clients message was enqueued to
+            and seconds it took
+        """
+        async with self._broadcast_semaphore:
+            _broadcasts.inc()
+            started = time.monotonic()
+            clients = list(self._clients)
+            total = len(clients)
+            delivered = 0
+            try:
+                for start in range(0, total, self._broadcast_chunk):
+                    for client in clients[start:start +
+                                          self._broadcast_chunk]:
+                        if client.deliver(message):
+                            delivered += 1
+                    if progress is not None:
+                        progress(min(start + self._broadcast_chunk, total),
+                                 total)
+                    await asyncio.sleep(0)
+            finally:
+                _broadcasts.dec()
+            elapsed = time.monotonic() - started
+            _broadcast_seconds.observe(elapsed)
+        _logger.info(f"Broadcast {message.type} delivered to {delivered} of "
+                     f"{total} clients in {elapsed:.3f}s")
+        return {'clients': total, 'delivered': delivered, 'seconds': elapsed}
 
     async def kickout(self, client: Client):
         """
@@ -191,14 +502,66 @@ class ClientPool:
         :return:
         """
         await client.message(self._kickout_message)
+        await client.flush()
         asyncio.ensure_future(client.disconnect())
 
+    async def drain(self, timeout=30, concurrency=500,
+                    report_interval=1.0) -> dict:
+        """
+        Deliver what's waiting in send queues and close all connections,
+        `concurrency` of them at once. Clients which are not closed until
+        `timeout` seconds are left to the server to cut off.
+
+        :param float timeout: deadline in seconds
+        :param int concurrency: connections being closed at once
+        :param float report_interval: seconds between progress reports
+        :return dict: number of clients, closed clients and seconds it took
+        """
+        clients = list(self._clients)
+        total = len(clients)
+        pending = iter(clients)
+        closed = 0
+
+        async def close():
+            nonlocal closed
+            # workers share the iterator, every client is taken once
+            for client in pending:
+                try:
+                    await client.flush()
+                    await client.disconnect()
+                except Exception as e:
+                    _logger.exception(e)
+                closed += 1
+
+        _logger.info(f"Draining {total} clients")
+        started = time.monotonic()
+        deadline = started + timeout
+        workers = [asyncio.ensure_future(close())
+                   for _ in range(min(concurrency, total))]
+        while workers:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            _, workers = await asyncio.wait(
+                workers, timeout=min(report_interval, remaining))
+            _logger.info(f"Drained {closed} of {total} clients")
+        for worker in workers:
+            worker.cancel()
+
+        elapsed = time.monotonic() - started
+        if closed < total:
+            _logger.warning(f"{total - closed} clients were not closed "
+                            f"within {timeout}s")
+        _logger.info(f"Drained {closed} of {total} clients in "
+                     f"{elapsed:.3f}s")
+        return {'clients': total, 'closed': closed, 'seconds': elapsed}
+
     async def shutdown(self, app):
         """
-        Kick all connected
+        Stop accepting clients and drain the connected ones
 
         :param app:
-        :return:
+        :return dict: drain result
         """
-        for client in self._clients:
-            await client.disconnect()
+        app['draining'] = True
+        return await self.drain(**app['settings'].DRAIN)
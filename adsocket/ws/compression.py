@@ -0,0 +1,164 @@
+"""
+permessage-deflate done once per fan-out.
+
+aiohttp compresses every frame for every socket separately. With no context
+takeover a compressed message does not depend on anything sent before, so
+for clients which negotiated the same window size the complete websocket
+frame (header included, server frames are not masked) is built once and the
+very same bytes are written to each of them.
+"""
+import struct
+import zlib
+
+from aiohttp import hdrs, web
+from aiohttp.http_websocket import WSMsgType, ws_ext_gen
+
+__all__ = [
+    'Deflate',
+    'DeflateWebSocketResponse',
+    'WireFrame',
+    'build_frame',
+    'for_socket',
+]
+
+_DEFLATE_TRAILING = b'\x00\x00\xff\xff'
+_RSV1 = 0x40
+_FIN = 0x80
+
+
+def build_frame(payload: bytes, opcode: int, compressed=False) -> bytes:
+    """
+    Build complete unmasked websocket frame
+
+    :param bytes payload: frame payload
+    :param int opcode: websocket opcode
+    :param bool compressed: whether payload is deflated
+    :return bytes:
+    """
+    first = _FIN | opcode
+    if compressed:
+        first |= _RSV1
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', first, length)
+    elif length < (1 << 16):
+        header = struct.pack('!BBH', first, 126, length)
+    else:
+        header = struct.pack('!BBQ', first, 127, length)
+    return header + payload
+
+
+class WireFrame:
+    """
+    Websocket frame ready to be written to the transport as it is
+    """
+
+    __slots__ = ('data',)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    async def write(self, ws):
+        """
+        Write frame to the socket respecting aiohttp flow control
+
+        :param aiohttp.web.WebSocketResponse ws: websocket
+        """
+        writer = ws._writer
+        writer.transport.write(self.data)
+        writer._output_size += len(self.data)
+        if writer._output_size > writer._limit:
+            writer._output_size = 0
+            await writer.protocol._drain_helper()
+
+    def write_nowait(self, ws):
+        """
+        Write small frame (e.g. ping) right away ignoring flow control
+
+        :param aiohttp.web.WebSocketResponse ws: websocket
+        """
+        transport = ws._writer.transport
+        if transport is not None and not transport.is_closing():
+            transport.write(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+class Deflate:
+    """
+    Compression parameters shared by sockets which negotiated the same
+    window size. Frames are cached per instance, so instances are shared
+    too, see :func:`for_socket`.
+    """
+
+    __slots__ = ('wbits', 'level', 'threshold')
+
+    def __init__(self, wbits, level, threshold):
+        self.wbits = wbits
+        self.level = level
+        self.threshold = threshold
+
+    def frame(self, payload, binary=False) -> WireFrame:
+        """
+        Build frame for encoded message, deflated if it's big enough
+
+        :param str|bytes payload: encoded message
+        :param bool binary: send as binary frame
+        :return WireFrame:
+        """
+        opcode = WSMsgType.BINARY if binary else WSMsgType.TEXT
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        if len(payload) < self.threshold:
+            return WireFrame(build_frame(payload, opcode))
+
+        compressobj = zlib.compressobj(self.level, zlib.DEFLATED, -self.wbits)
+        payload = compressobj.compress(payload) + \
+            compressobj.flush(zlib.Z_SYNC_FLUSH)
+        if payload.endswith(_DEFLATE_TRAILING):
+            payload = payload[:-4]
+        return WireFrame(build_frame(payload, opcode, compressed=True))
+
+
+_deflates = {}
+
+
+def for_socket(ws, level, threshold):
+    """
+    Return shared :class:`Deflate` for the socket or None if frames can not
+    be shared with the socket (compression off or context takeover on)
+
+    :param aiohttp.web.WebSocketResponse ws: prepared websocket
+    :param int level: zlib compression level
+    :param int threshold: smaller payloads are not compressed
+    :return Deflate:
+    """
+    writer = ws._writer
+    if writer is None or not writer.compress or not writer.notakeover:
+        return None
+    key = (writer.compress, level, threshold)
+    deflate = _deflates.get(key)
+    if deflate is None:
+        deflate = _deflates[key] = Deflate(*key)
+    return deflate
+
+
+class DeflateWebSocketResponse(web.WebSocketResponse):
+    """
+    Websocket response which answers permessage-deflate offer with
+    `server_no_context_takeover` even if client did not ask for it
+    (RFC 7692, 7.1.1.1), so its frames can be shared.
+    """
+
+    def __init__(self, *args, no_context_takeover=True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._force_notakeover = no_context_takeover
+
+    def _handshake(self, request):
+        headers, protocol, compress, notakeover = super()._handshake(request)
+        if compress and self._force_notakeover and not notakeover:
+            notakeover = True
+            headers[hdrs.SEC_WEBSOCKET_EXTENSIONS] = ws_ext_gen(
+                compress=compress, isserver=True, server_notakeover=True)
+        return headers, protocol, compress, notakeover
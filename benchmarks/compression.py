@@ -0,0 +1,82 @@
+"""
+Compression fan-out benchmark.
+
+Compares permessage-deflate done by every socket on its own (aiohttp
+default, context takeover) with the frame deflated once per message and
+shared by all subscribers (no context takeover). Reports CPU and egress
+bytes for publishing the same messages to a channel.
+
+    python -m benchmarks.compression --members 100 1000 10000
+"""
+import argparse
+import json
+import time
+import zlib
+
+from adsocket.ws.compression import Deflate, build_frame
+
+TEXT = 0x1
+
+
+def _messages(count):
+    return [json.dumps({
+        'type': 'message',
+        'channel': 'orders:eu',
+        'data': {'id': i, 'status': 'filled', 'items': [
+            {'sku': f"sku-{n}", 'qty': n, 'price': n * 1.25}
+            for n in range(30)]},
+    }) for i in range(count)]
+
+
+def per_socket(messages, members, level):
+    compressors = [zlib.compressobj(level, zlib.DEFLATED, -15)
+                   for _ in range(members)]
+    egress = 0
+    started = time.process_time()
+    for payload in messages:
+        payload = payload.encode()
+        for compressor in compressors:
+            data = compressor.compress(payload) + \
+                compressor.flush(zlib.Z_SYNC_FLUSH)
+            egress += len(build_frame(data[:-4], TEXT, compressed=True))
+    return time.process_time() - started, egress
+
+
+def shared(messages, members, level, threshold):
+    deflate = Deflate(15, level, threshold)
+    egress = 0
+    started = time.process_time()
+    for payload in messages:
+        frame = deflate.frame(payload)
+        egress += len(frame) * members
+    return time.process_time() - started, egress
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--members', type=int, nargs='+',
+                        default=[100, 1000, 10000])
+    parser.add_argument('--messages', type=int, default=50)
+    parser.add_argument('--level', type=int, default=6)
+    parser.add_argument('--threshold', type=int, default=256)
+    args = parser.parse_args()
+
+    messages = _messages(args.messages)
+    raw = sum(len(m.encode()) for m in messages)
+    results = []
+    for members in args.members:
+        socket_cpu, socket_bytes = per_socket(messages, members, args.level)
+        shared_cpu, shared_bytes = shared(messages, members, args.level,
+                                          args.threshold)
+        results.append({
+            'members': members,
+            'messages': args.messages,
+            'uncompressed_bytes': raw * members,
+            'per_socket': {'cpu_s': socket_cpu, 'egress_bytes': socket_bytes},
+            'shared': {'cpu_s': shared_cpu, 'egress_bytes': shared_bytes},
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
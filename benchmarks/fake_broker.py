@@ -0,0 +1,82 @@
+"""
+In-process broker stand-in for benchmarks.
+
+Nothing leaves the process. Payloads handed to :meth:`FakeBroker.publish`
+take exactly the same way as payloads read from redis - through ventilation
+queues, decoding and channel fan-out - so the numbers stay comparable.
+"""
+import asyncio
+import logging
+import time
+
+from adsocket.core.broker import Broker
+from adsocket.core.codecs import codecs
+
+_logger = logging.getLogger(__name__)
+
+
+class FakeBroker(Broker):
+
+    loop = None
+    app = None
+
+    def __init__(self, loop, app, codec='json', **kwargs):
+        self.loop = loop
+        self.app = app
+        self.codec = codecs.get(codec)
+        self._queue = asyncio.Queue()
+        self.published = 0
+
+    def publish(self, channel, data):
+        """
+        Queue message for the reader as if it arrived from the broker
+
+        :param str channel: channel uid
+        :param dict data: message data
+        """
+        payload = self.codec.encode(
+            {'type': 'message', 'channel': channel, 'data': data})
+        self._queue.put_nowait((channel, payload))
+        self.published += 1
+
+    async def generate(self, channels, rate, duration, size=0):
+        """
+        Publish `rate` messages per second round robin into `channels` for
+        `duration` seconds. Every message carries wall clock time of its
+        publishing in `ts`, so receivers on the same box can tell the
+        fan-out latency.
+
+        :param list channels: channel uids
+        :param float rate: messages per second
+        :param float duration: seconds
+        :param int size: padding added to every message
+        """
+        padding = 'x' * size
+        interval = 1.0 / rate
+        started = time.monotonic()
+        sent = 0
+        while True:
+            now = time.monotonic()
+            if now - started >= duration:
+                break
+            # catch up in bursts when the loop was busy
+            due = int((now - started) / interval) + 1
+            while sent < due:
+                channel = channels[sent % len(channels)]
+                self.publish(channel, {'ts': time.time(), 'seq': sent,
+                                       'padding': padding})
+                sent += 1
+            await asyncio.sleep(interval)
+        _logger.info(f"Generated {sent} messages")
+        return sent
+
+    async def read(self):
+        while True:
+            key, payload = await self._queue.get()
+            await self.feed(key, payload)
+
+    async def write(self, message):
+        pass
+
+    async def close(self, app):
+        self.stop_ingestion()
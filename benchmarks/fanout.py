@@ -0,0 +1,83 @@
+"""
+Channel fan-out benchmark.
+
+Publishes a message into channels of growing size and reports how much CPU
+a single publish costs. The message is encoded once per publish, so the
+encode cost stays flat and only the per-member send cost grows.
+
+    python -m benchmarks.fanout --members 100 1000 10000 20000
+"""
+import argparse
+import json
+import time
+
+from adsocket.core import loop
+from adsocket.core.channels import Channel
+from adsocket.core.message import Message
+from adsocket.ws.client import Client
+
+
+class NullSocket:
+    """
+    Websocket stand-in which throws away everything it is asked to send
+    """
+    closed = False
+
+    async def send_str(self, data):
+        pass
+
+
+class CountingMessage(Message):
+
+    encodes = 0
+
+    def as_dict(self):
+        CountingMessage.encodes += 1
+        return super().as_dict()
+
+
+def _payload():
+    return {
+        'id': 42,
+        'items': [{'sku': f"sku-{i}", 'qty': i, 'price': i * 1.5}
+                  for i in range(20)],
+    }
+
+
+def run(members, publishes):
+    sockets = [NullSocket() for _ in range(members)]
+    clients = [Client(ws=ws) for ws in sockets]
+    channel = Channel('bench', '1')
+    for client in clients:
+        channel.clients.add(client)
+
+    CountingMessage.encodes = 0
+    started = time.process_time()
+    for _ in range(publishes):
+        msg = CountingMessage('message', _payload(), channel=channel.uid)
+        loop.run_until_complete(channel.publish(msg))
+    elapsed = time.process_time() - started
+
+    per_publish = elapsed / publishes
+    return {
+        'members': members,
+        'publishes': publishes,
+        'encodes_per_publish': CountingMessage.encodes / publishes,
+        'cpu_per_publish_ms': per_publish * 1000,
+        'cpu_per_member_us': per_publish / members * 1000000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--members', type=int, nargs='+',
+                        default=[100, 1000, 10000, 20000])
+    parser.add_argument('--publishes', type=int, default=20)
+    args = parser.parse_args()
+
+    results = [run(members, args.publishes) for members in args.members]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+"""
+End-to-end load test.
+
+Starts adsocket with the in-process fake broker (no redis or any other
+external service is needed), opens N websocket clients spread over M
+channels from several processes, publishes at given rate and reports fan-out
+latency percentiles, delivered messages per second and server CPU and memory
+per connection. Results are printed (and optionally written) as JSON, so
+they can be compared between releases.
+
+    python -m benchmarks.loadtest --clients 5000 --channels 50 --rate 200 \\
+        --duration 30 --output loadtest.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import aiohttp
+from aiohttp import web
+
+from adsocket.version import __version__
+
+CHANNEL_TYPE = 'bench'
+PERCENTILES = (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('p999', 0.999))
+
+
+def _channel(index, channels):
+    return f"{CHANNEL_TYPE}:{index % channels}"
+
+
+def _rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize()
+
+
+def _cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+# Server side, runs in separate process with benchmark settings
+
+async def _stats_handler(request):
+    app = request.app
+    return web.json_response({
+        'cpu': _cpu(),
+        'rss': _rss(),
+        'clients': await app['client_pool'].active_count(),
+        'channels': len(app['channels']) if 'channels' in app else 0,
+    })
+
+
+async def _generate_handler(request):
+    params = await request.json()
+    generated = await request.app['broker'].generate(**params)
+    return web.json_response({'generated': generated})
+
+
+def serve(port):
+    os.environ.setdefault('ADSOCKET_SETTINGS', 'benchmarks.settings')
+    from adsocket.core import loop
+    from adsocket.core import application
+
+    app = application.factory(loop)
+    app.router.add_get('/_bench/stats', _stats_handler)
+    app.router.add_post('/_bench/generate', _generate_handler)
+    web.run_app(app, host='127.0.0.1', port=port,
+                access_log=None, print=None)
+
+
+# Client side
+
+async def _client(session, url, channel, latencies, connected):
+    ws = await session.ws_connect(url)
+    await ws.send_str(json.dumps({
+        'type': 'subscribe', 'data': 'subscribe',
+        'channel': channel, 'request_id': 1}))
+    response = await ws.receive_json()
+    subscribed = response.get('data', {}).get('result', {}).get(channel)
+    connected.append(subscribed is True)
+
+    async def receive():
+        async for msg in ws:
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue
+            received = time.time()
+            data = json.loads(msg.data).get('data')
+            if isinstance(data, dict) and 'ts' in data:
+                latencies.append(received - data['ts'])
+
+    return ws, asyncio.ensure_future(receive())
+
+
+async def _clients(url, indexes, channels, concurrency, results, stop):
+    latencies = []
+    connected = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def connect(index):
+        async with semaphore:
+            return await _client(session, url, _channel(index, channels),
+                                 latencies, connected)
+
+    timeout = aiohttp.ClientTimeout(total=None)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        started = time.monotonic()
+        sockets = await asyncio.gather(*[connect(i) for i in indexes])
+        results.put(('ready', {
+            'connect_seconds': time.monotonic() - started,
+            'subscribed': sum(connected),
+        }))
+        await asyncio.get_event_loop().run_in_executor(None, stop.wait)
+        for ws, receiver in sockets:
+            receiver.cancel()
+            await ws.close()
+    results.put(('done', latencies))
+
+
+def _client_process(url, indexes, channels, concurrency, results, stop):
+    asyncio.run(_clients(url, indexes, channels, concurrency, results, stop))
+
+
+# Orchestration
+
+def _request(url, data=None, timeout=10):
+    body = None
+    if data is not None:
+        body = json.dumps(data).encode()
+    request = urllib.request.Request(
+        url, data=body, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def _wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not start listening on {port}")
+
+
+def _collect(results, processes, kind):
+    collected = []
+    while len(collected) < processes:
+        got, value = results.get()
+        if got != kind:
+            raise RuntimeError(f"Expected {kind} from client, got {got}")
+        collected.append(value)
+    return collected
+
+
+def _expected_deliveries(published, clients, channels):
+    """
+    Messages are published round robin, clients are spread round robin,
+    so channel `i` got `published // channels` messages (one more for the
+    first `published % channels` channels) and has the same number of
+    members
+    """
+    expected = 0
+    for i in range(channels):
+        messages = published // channels + (i < published % channels)
+        members = clients // channels + (i < clients % channels)
+        expected += messages * members
+    return expected
+
+
+def _percentiles(latencies):
+    if not latencies:
+        return {}
+    latencies.sort()
+    count = len(latencies)
+    result = {name: latencies[min(count - 1, int(q * count))] * 1000
+              for name, q in PERCENTILES}
+    result['max'] = latencies[-1] * 1000
+    result['mean'] = sum(latencies) / count * 1000
+    return result
+
+
+def run(args):
+    base = f"http://127.0.0.1:{args.port}"
+    url = f"ws://127.0.0.1:{args.port}/"
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.loadtest',
+         '--serve', '--port', str(args.port)],
+        env=dict(os.environ, ADSOCKET_SETTINGS=args.settings))
+    try:
+        _wait_for_port(args.port)
+        idle = _request(f"{base}/_bench/stats")
+
+        results = multiprocessing.Queue()
+        stop = multiprocessing.Event()
+        workers = []
+        for p in range(args.processes):
+            indexes = range(p, args.clients, args.processes)
+            worker = multiprocessing.Process(
+                target=_client_process,
+                args=(url, indexes, args.channels, args.concurrency,
+                      results, stop))
+            worker.start()
+            workers.append(worker)
+
+        ready = _collect(results, args.processes, 'ready')
+        loaded = _request(f"{base}/_bench/stats")
+
+        started = time.monotonic()
+        published = _request(
+            f"{base}/_bench/generate",
+            {'channels': [_channel(i, args.channels)
+                          for i in range(args.channels)],
+             'rate': args.rate, 'duration': args.duration,
+             'size': args.size},
+            timeout=args.duration + 30)['generated']
+        time.sleep(args.grace)
+        elapsed = time.monotonic() - started
+        finished = _request(f"{base}/_bench/stats")
+
+        stop.set()
+        latencies = []
+        for chunk in _collect(results, args.processes, 'done'):
+            latencies.extend(chunk)
+        for worker in workers:
+            worker.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    cpu = finished['cpu'] - loaded['cpu']
+    expected = _expected_deliveries(published, args.clients, args.channels)
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'config': {
+            'clients': args.clients,
+            'channels': args.channels,
+            'rate': args.rate,
+            'duration': args.duration,
+            'size': args.size,
+            'processes': args.processes,
+        },
+        'connect_seconds': max(r['connect_seconds'] for r in ready),
+        'subscribed': sum(r['subscribed'] for r in ready),
+        'published': published,
+        'expected_deliveries': expected,
+        'delivered': len(latencies),
+        'messages_per_second': len(latencies) / elapsed,
+        'latency_ms': _percentiles(latencies),
+        'server': {
+            'clients': loaded['clients'],
+            'cpu_seconds': cpu,
+            'cpu_percent': cpu / elapsed * 100,
+            'cpu_per_connection_ms': cpu / args.clients * 1000,
+            'rss_bytes': finished['rss'],
+            'rss_per_connection_bytes':
+                (loaded['rss'] - idle['rss']) / args.clients,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--channels', type=int, default=10)
+    parser.add_argument('--rate', type=float, default=100,
+                        help="Published messages per second")
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--size', type=int, default=0,
+                        help="Bytes of padding in every message")
+    parser.add_argument('--grace', type=float, default=2,
+                        help="Seconds to wait for late deliveries")
+    parser.add_argument('--processes', type=int,
+                        default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Client processes")
+    parser.add_argument('--concurrency', type=int, default=200,
+                        help="Concurrent connects per client process")
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--settings', default='benchmarks.settings')
+    parser.add_argument('--output', help="Write results to this file too")
+    parser.add_argument('--serve', action='store_true',
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    result = json.dumps(run(args), indent=2)
+    print(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(result + '\n')
+
+
+if __name__ == '__main__':
+    main()
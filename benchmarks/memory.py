@@ -0,0 +1,136 @@
+"""
+Memory footprint benchmark.
+
+Measures with tracemalloc how many bytes adsocket itself allocates per idle
+connection (client registered in client pool), per channel membership and
+per channel. Websocket is replaced by a stand-in, so memory held by aiohttp
+and by the transport is not included.
+
+    python -m benchmarks.memory --clients 100000 --channels 1000
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+import types
+
+from adsocket.conf import app_settings
+from adsocket.core import loop
+from adsocket.core.channels import Channel, ChannelPool
+from adsocket.core.message import Message
+from adsocket.core.timers import TimerWheel
+from adsocket.version import __version__
+from adsocket.ws.client import Client, ClientPool
+
+
+class NullTransport:
+
+    def write(self, data):
+        pass
+
+    def is_closing(self):
+        return False
+
+
+class NullWriter:
+    transport = NullTransport()
+
+
+class NullSocket:
+    """
+    Websocket stand-in, the smallest object a client can point to
+    """
+    __slots__ = ()
+    closed = False
+    _writer = NullWriter()
+
+
+class NullBroker:
+
+    async def channel_created(self, channel):
+        pass
+
+    async def channel_removed(self, channel):
+        pass
+
+
+class App(dict):
+    loop = loop
+
+
+def _measure(fn):
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0] - before, result
+
+
+def _settings():
+    """
+    Timers of client pool would fire while clients are connected and
+    their tasks would be measured too, only idle connections count
+    """
+    settings = {key: value for key, value in vars(app_settings).items()
+                if key.isupper()}
+    settings.update(HEARTBEAT_INTERVAL=None, DISCONNECT_UNAUTHENTICATED=False)
+    return types.SimpleNamespace(**settings)
+
+
+def run(clients, channels):
+    settings = _settings()
+    app = App(settings=settings, broker=NullBroker(),
+              timers=TimerWheel(loop, **settings.TIMER_WHEEL))
+    app['channels'] = pool = ChannelPool(channel_types={'bench': Channel},
+                                         app=app)
+    client_pool = ClientPool(app)
+    message = Message('subscribe', 'subscribe')
+
+    tracemalloc.start()
+
+    def connect():
+        result = [Client(ws=NullSocket()) for _ in range(clients)]
+        for client in result:
+            loop.run_until_complete(client_pool.append(client))
+        return result
+
+    def create_channels():
+        for i in range(channels):
+            loop.run_until_complete(pool.join_channel(
+                f"bench:{i}", connected[i], message))
+
+    def join():
+        for i, client in enumerate(connected[channels:]):
+            loop.run_until_complete(pool.join_channel(
+                f"bench:{i % channels}", client, message))
+
+    connections_size, connected = _measure(connect)
+    channels_size, _ = _measure(create_channels)
+    memberships = clients - channels
+    memberships_size, _ = _measure(join)
+    tracemalloc.stop()
+
+    return {
+        'version': __version__,
+        'clients': clients,
+        'channels': channels,
+        'bytes_per_connection': connections_size / clients,
+        # first member of each channel is included
+        'bytes_per_channel': channels_size / channels,
+        'bytes_per_membership': memberships_size / memberships,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--clients', type=int, default=100000)
+    parser.add_argument('--channels', type=int, default=1000)
+    args = parser.parse_args()
+    if args.channels >= args.clients:
+        parser.error("There must be more clients than channels")
+
+    print(json.dumps(run(args.clients, args.channels), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Settings used by benchmark servers, see `benchmarks/loadtest.py`. Only the
+overrides are here, the rest comes from the defaults.
+"""
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': True,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        }
+    },
+    'loggers': {
+        'adsocket': {
+            'level': 'WARNING',
+            'handlers': ['console'],
+        },
+    },
+}
+
+CHANNELS = {
+    'bench': {
+        'driver': 'adsocket.core.channels.Channel',
+        'create_on_startup': False,
+    },
+}
+
+BROKER = {
+    'driver': 'benchmarks.fake_broker.FakeBroker',
+    'codec': 'json',
+}
+
+CLIENT_SEND_QUEUE = {
+    'size': 10000,
+    'policy': 'drop_oldest',
+}
@@ -0,0 +1,103 @@
+"""
+Worker scaling benchmark.
+
+Starts `adsocket --workers N` for every requested N and measures how many
+websocket connections per second it accepts and how many ping commands per
+second it answers. Load is generated from several processes so the client
+side does not become the bottleneck. Redis must be reachable as configured
+in settings.
+
+    python -m benchmarks.workers --workers 1 2 4 8 --connections 2000
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import socket
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+
+def _wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server did not start listening on {port}")
+
+
+async def _load(url, connections, pings):
+    async with aiohttp.ClientSession() as session:
+        started = time.monotonic()
+        sockets = await asyncio.gather(
+            *[session.ws_connect(url) for _ in range(connections)])
+        connect_time = time.monotonic() - started
+
+        async def ping(ws):
+            for i in range(pings):
+                await ws.send_str(json.dumps(
+                    {'type': 'ping', 'data': 'ping', 'request_id': i}))
+                await ws.receive()
+
+        started = time.monotonic()
+        await asyncio.gather(*[ping(ws) for ws in sockets])
+        ping_time = time.monotonic() - started
+        await asyncio.gather(*[ws.close() for ws in sockets])
+    return connect_time, ping_time
+
+
+def _client_process(args):
+    url, connections, pings = args
+    return asyncio.new_event_loop().run_until_complete(
+        _load(url, connections, pings))
+
+
+def run(workers, port, connections, pings, client_procs):
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'adsocket.server', '--workers', str(workers)])
+    try:
+        _wait_for_port(port)
+        # give every worker time to bind
+        time.sleep(1 + workers * 0.2)
+        per_proc = connections // client_procs
+        jobs = [(f"ws://127.0.0.1:{port}/", per_proc, pings)] * client_procs
+        with multiprocessing.Pool(client_procs) as pool:
+            results = pool.map(_client_process, jobs)
+    finally:
+        server.terminate()
+        server.wait()
+
+    total = per_proc * client_procs
+    connect_time = max(r[0] for r in results)
+    ping_time = max(r[1] for r in results)
+    return {
+        'workers': workers,
+        'connections': total,
+        'connections_per_s': total / connect_time,
+        'messages_per_s': total * pings / ping_time,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--port', type=int, default=5005)
+    parser.add_argument('--connections', type=int, default=2000)
+    parser.add_argument('--pings', type=int, default=50)
+    parser.add_argument('--client-procs', type=int,
+                        default=max(1, multiprocessing.cpu_count() // 2))
+    args = parser.parse_args()
+
+    results = [run(n, args.port, args.connections, args.pings,
+                   args.client_procs) for n in args.workers]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -57,6 +57,10 @@ setup(
         'tc_version': TeamCityVersionCommand
     },
     install_requires=reqs,
+    extras_require={
+        'orjson': ['orjson'],
+        'msgpack': ['msgpack'],
+    },
     dependency_links=deps,
     packages=find_packages(),
     zip_safe=True,
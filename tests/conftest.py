@@ -0,0 +1,60 @@
+import pytest
+
+from adsocket.conf import app_settings
+from adsocket.core import loop as adsocket_loop
+from adsocket.core.timers import TimerWheel
+
+
+class FakeSocket:
+    """
+    Websocket stand-in, remembers what was sent and how it was closed
+    """
+
+    def __init__(self):
+        self.closed = False
+        self.close_code = None
+        self.sent = []
+
+    async def send_str(self, data):
+        self.sent.append(data)
+
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+    async def close(self, code=None):
+        self.closed = True
+        self.close_code = code
+
+
+class RecordingBroker:
+    """
+    Broker stand-in recording what channel pool tells it
+    """
+
+    def __init__(self):
+        self.created = []
+        self.removed = []
+
+    async def channel_created(self, channel):
+        self.created.append(channel.uid)
+
+    async def channel_removed(self, channel):
+        self.removed.append(channel.uid)
+
+
+class App(dict):
+    loop = adsocket_loop
+
+
+@pytest.fixture
+def loop():
+    return adsocket_loop
+
+
+@pytest.fixture
+def app(loop):
+    app = App(settings=app_settings, loop=loop, broker=RecordingBroker(),
+              timers=TimerWheel(loop, resolution=0.01, slots=64),
+              node_id='test-node', draining=False)
+    yield app
+    app['timers'].close()
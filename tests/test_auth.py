@@ -0,0 +1,64 @@
+import types
+
+from adsocket.core.auth import AbstractAuth
+from adsocket.core.commands.commands import AuthenticateCommand
+from adsocket.core.message import Message
+from adsocket.ws.client import Client
+
+from conftest import FakeSocket
+
+
+class PasswordAuth(AbstractAuth):
+    calls = 0
+
+    async def authenticate(self, client, message):
+        PasswordAuth.calls += 1
+        if message.data.get('password') != 'secret':
+            return False, None
+        client['role'] = 'admin'
+        return True, {'id': message.data['username']}
+
+
+def _command(app, enabled):
+    app['settings'] = types.SimpleNamespace(AUTHENTICATION_CACHE={
+        'enabled': enabled, 'ttl': 60, 'negative_ttl': 5, 'max_size': 10})
+    app['authenticators'] = [PasswordAuth(app)]
+    PasswordAuth.calls = 0
+    return AuthenticateCommand(app)
+
+
+def _authenticate(loop, command, **data):
+    client = Client(ws=FakeSocket())
+    result = loop.run_until_complete(
+        command.execute(client, Message('authenticate', data)))
+    return client, result[0]
+
+
+def test_cache_is_off_by_default(app, loop):
+    command = _command(app, enabled=False)
+    _authenticate(loop, command, username='joe', password='secret')
+    _authenticate(loop, command, username='joe', password='secret')
+    assert PasswordAuth.calls == 2
+
+
+def test_cache_key_covers_all_credentials(app, loop):
+    command = _command(app, enabled=True)
+    _, ok = _authenticate(loop, command, token='t', username='joe',
+                          password='secret')
+    assert ok
+    _, ok = _authenticate(loop, command, token='t', username='joe',
+                          password='wrong')
+    assert not ok
+    assert PasswordAuth.calls == 2
+
+
+def test_hit_restores_client_state(app, loop):
+    command = _command(app, enabled=True)
+    _authenticate(loop, command, username='joe', password='secret')
+    client, ok = _authenticate(loop, command, username='joe',
+                               password='secret')
+    assert ok
+    assert PasswordAuth.calls == 1
+    assert client['role'] == 'admin'
+    assert client.identity == 'joe'
+    assert loop.run_until_complete(client.is_authenticated())
@@ -0,0 +1,88 @@
+from adsocket.core import cache
+from adsocket.core.cache import MISSING, TTLCache
+from adsocket.core.permissions import Permission, PermissionCache
+from adsocket.ws.client import Client
+
+from conftest import FakeSocket
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'monotonic', clock)
+    ttl_cache = TTLCache(ttl=10)
+    ttl_cache.set('a', 1)
+    ttl_cache.set('b', 2, ttl=30)
+
+    clock.now += 20
+    assert ttl_cache.get('a') is MISSING
+    assert ttl_cache.get('a', None) is None
+    assert ttl_cache.get('b') == 2
+    assert 'a' not in ttl_cache
+    assert len(ttl_cache) == 1
+
+
+def test_least_recently_used_is_evicted():
+    ttl_cache = TTLCache(max_size=2)
+    ttl_cache.set('a', 1)
+    ttl_cache.set('b', 2)
+    ttl_cache.get('a')
+    ttl_cache.set('c', 3)
+
+    assert 'a' in ttl_cache
+    assert 'b' not in ttl_cache
+    assert 'c' in ttl_cache
+
+
+def test_delete_matching():
+    ttl_cache = TTLCache()
+    for key in ('chat:1', 'chat:2', 'order:1'):
+        ttl_cache.set(key, True)
+    assert ttl_cache.delete_matching(lambda key: key.startswith('chat')) == 2
+    assert len(ttl_cache) == 1
+    ttl_cache.delete('order:1')
+    assert len(ttl_cache) == 0
+
+
+class CountingPermission(Permission):
+    cacheable = True
+    calls = 0
+
+    async def can_join(self, channel, client, message):
+        CountingPermission.calls += 1
+        return channel.uid != 'chat:denied'
+
+
+class FakeChannel:
+
+    def __init__(self, uid):
+        self.uid = uid
+
+
+def test_permission_decisions_are_cached(loop):
+    CountingPermission.calls = 0
+    permissions = PermissionCache()
+    permission = CountingPermission()
+    client = Client(ws=FakeSocket())
+
+    def can_join(uid):
+        return loop.run_until_complete(permissions.can_join(
+            permission, FakeChannel(uid), client, None))
+
+    assert can_join('chat:1') is True
+    assert can_join('chat:1') is True
+    assert can_join('chat:denied') is False
+    assert CountingPermission.calls == 2
+
+    assert permissions.invalidate(channel='chat:1') == 1
+    assert can_join('chat:1') is True
+    assert CountingPermission.calls == 3
+    assert permissions.invalidate() == 2
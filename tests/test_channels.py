@@ -0,0 +1,157 @@
+import asyncio
+
+import pytest
+
+from adsocket.core.channels import Channel, ChannelPool
+from adsocket.core.exceptions import PermissionDeniedException
+from adsocket.core.message import Message
+from adsocket.core.permissions import Permission
+from adsocket.ws.client import Client
+
+from conftest import FakeSocket
+
+
+class GatePermission(Permission):
+    """
+    Holds the join until the test opens the gate
+    """
+    gate = None
+
+    async def can_join(self, channel, client, message):
+        await self.gate.wait()
+        return True
+
+
+class GatedChannel(Channel):
+    permissions = [GatePermission]
+
+
+def _subscribe():
+    return Message('subscribe', 'subscribe')
+
+
+def test_disconnect_while_joining(app, loop):
+    GatePermission.gate = asyncio.Event()
+    pool = app['channels'] = ChannelPool(
+        channel_types={'gated': GatedChannel}, app=app)
+    client = Client(ws=FakeSocket())
+
+    join = loop.create_task(pool.join_channel('gated:1', client, _subscribe()))
+    loop.run_until_complete(asyncio.sleep(0))
+    loop.run_until_complete(client.disconnect())
+    GatePermission.gate.set()
+
+    assert loop.run_until_complete(join) is False
+    channel = pool._get_channel('gated', '1')
+    assert not channel.has_client(client)
+    assert not client.channels
+    assert channel.uid in pool._removals
+
+
+def test_join(app, loop):
+    GatePermission.gate = asyncio.Event()
+    GatePermission.gate.set()
+    pool = app['channels'] = ChannelPool(
+        channel_types={'gated': GatedChannel}, app=app)
+    client = Client(ws=FakeSocket())
+
+    assert loop.run_until_complete(
+        pool.join_channel('gated:1', client, _subscribe())) is True
+    channel = pool._get_channel('gated', '1')
+    assert channel.has_client(client)
+    assert channel in client.channels
+    assert app['broker'].created == ['gated:1']
+
+
+class DenyPermission(Permission):
+
+    async def can_join(self, channel, client, message):
+        return False
+
+
+class DeniedChannel(Channel):
+    permissions = [DenyPermission]
+
+
+def test_denied_join_creates_nothing(app, loop):
+    pool = app['channels'] = ChannelPool(
+        channel_types={'denied': DeniedChannel}, app=app)
+    client = Client(ws=FakeSocket())
+
+    with pytest.raises(PermissionDeniedException):
+        loop.run_until_complete(
+            pool.join_channel('denied:1', client, _subscribe()))
+    assert len(pool) == 0
+    assert app['broker'].created == []
+    assert pool._removals == {}
+
+def test_unknown_channel_option_fails_early(app):
+    with pytest.raises(RuntimeError):
+        ChannelPool(channel_types={'history': Channel},
+                    channel_options={'history': {'history_sise': 10}},
+                    app=app)
+    ChannelPool(channel_types={'history': Channel},
+                channel_options={'history': {'history_size': 10}}, app=app)
+
+
+class CachedPermission(Permission):
+    cacheable = True
+
+
+class SharedChannel(Channel):
+    permissions = [GatePermission, CachedPermission]
+
+
+def test_only_cacheable_permissions_are_shared():
+    one = SharedChannel('shared', '1')
+    two = SharedChannel('shared', '2')
+    first, cached = one.get_permissions()
+    second, shared = two.get_permissions()
+    assert first is not second
+    assert cached is shared
+
+
+class CountingChannel(Channel):
+    permissions = [GatePermission]
+    created = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        CountingChannel.created += 1
+
+
+class BatchPermission(Permission):
+    batches = []
+
+    async def can_join_many(self, channels, client, message):
+        BatchPermission.batches.append([c.uid for c in channels])
+        return [c.channel_id != 'secret' for c in channels]
+
+
+class BatchChannel(CountingChannel):
+    permissions = [BatchPermission]
+
+
+def test_decide_joins_without_batch_permission_builds_nothing(app, loop):
+    CountingChannel.created = 0
+    pool = ChannelPool(channel_types={'counted': CountingChannel}, app=app)
+    client = Client(ws=FakeSocket())
+    decisions = loop.run_until_complete(pool.decide_joins(
+        ['counted:1', 'counted:2'], client, _subscribe()))
+    assert decisions == {}
+    assert CountingChannel.created == 0
+
+
+def test_decide_joins_asks_batch_permission_once(app, loop):
+    CountingChannel.created = 0
+    BatchPermission.batches = []
+    pool = ChannelPool(channel_types={'batch': BatchChannel}, app=app)
+    client = Client(ws=FakeSocket())
+    decisions = loop.run_until_complete(pool.decide_joins(
+        ['batch:1', 'batch:secret'], client, _subscribe()))
+    assert decisions == {'batch:1': {BatchPermission: True},
+                         'batch:secret': {BatchPermission: False}}
+    assert BatchPermission.batches == [['batch:1', 'batch:secret']]
+    # temporary channels are not built through the constructor
+    assert CountingChannel.created == 0
+    assert len(pool) == 0
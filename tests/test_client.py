@@ -0,0 +1,142 @@
+import asyncio
+import types
+
+from aiohttp import WSCloseCode
+
+from adsocket.core.message import Message
+from adsocket.ws.client import Client, ClientPool, DISCONNECT, DROP_NEWEST, \
+    DROP_OLDEST
+
+from conftest import FakeSocket
+
+
+def _fill(client, count=6):
+    return [client.send(f'frame-{i}') for i in range(count)]
+
+
+def test_drop_oldest_keeps_newest_frames(loop):
+    ws = FakeSocket()
+    client = Client(ws=ws, send_queue_size=3,
+                    slow_consumer_policy=DROP_OLDEST)
+    assert _fill(client) == [True] * 6
+    assert client.dropped == 3
+
+    loop.run_until_complete(client.flush())
+    assert ws.sent == ['frame-3', 'frame-4', 'frame-5']
+
+
+def test_drop_newest_refuses_new_frames(loop):
+    ws = FakeSocket()
+    client = Client(ws=ws, send_queue_size=3,
+                    slow_consumer_policy=DROP_NEWEST)
+    assert _fill(client) == [True] * 3 + [False] * 3
+    assert client.dropped == 3
+
+    loop.run_until_complete(client.flush())
+    assert ws.sent == ['frame-0', 'frame-1', 'frame-2']
+
+
+def test_disconnect_refuses_frames_until_closed(loop):
+    ws = FakeSocket()
+    client = Client(ws=ws, send_queue_size=3,
+                    slow_consumer_policy=DISCONNECT)
+    assert _fill(client) == [True] * 3 + [False] * 3
+    assert client.pending == 0
+
+    loop.run_until_complete(asyncio.sleep(0))
+    assert ws.closed
+    assert ws.close_code == WSCloseCode.TRY_AGAIN_LATER
+    assert client.ws is None
+    assert ws.sent == []
+
+
+class SlowSocket(FakeSocket):
+
+    async def send_str(self, data):
+        await asyncio.sleep(0.01)
+        await super().send_str(data)
+
+
+def test_flush_waits_for_frame_being_written(loop):
+    ws = SlowSocket()
+    client = Client(ws=ws)
+    client.send('frame')
+    loop.run_until_complete(asyncio.sleep(0))
+    assert client.pending == 0
+
+    loop.run_until_complete(client.flush())
+    assert ws.sent == ['frame']
+    loop.run_until_complete(client.flush())
+    loop.run_until_complete(client.disconnect())
+
+
+class StuckSocket(FakeSocket):
+    """
+    Peer which never reads, every write waits forever
+    """
+
+    async def send_str(self, data):
+        await asyncio.Event().wait()
+
+
+def _pool(app, chunk_size=1000):
+    app['settings'] = types.SimpleNamespace(
+        HEARTBEAT_INTERVAL=None, DISCONNECT_UNAUTHENTICATED=False,
+        BROADCAST={'channel': '_system:broadcast', 'chunk_size': chunk_size,
+                   'concurrency': 1})
+    return ClientPool(app)
+
+
+def _connect(loop, pool, sockets):
+    clients = [Client(ws=ws) for ws in sockets]
+    for client in clients:
+        loop.run_until_complete(pool.append(client))
+    return clients
+
+
+def test_drain_flushes_queues_before_closing(app, loop):
+    pool = _pool(app)
+    sockets = [FakeSocket() for _ in range(5)]
+    for client in _connect(loop, pool, sockets):
+        client.send('bye-1')
+        client.send('bye-2')
+
+    result = loop.run_until_complete(pool.drain(timeout=1, concurrency=2))
+    assert result['clients'] == result['closed'] == 5
+    for ws in sockets:
+        assert ws.sent == ['bye-1', 'bye-2']
+        assert ws.closed
+
+
+def test_drain_gives_up_at_deadline(app, loop):
+    pool = _pool(app)
+    stuck = StuckSocket()
+    clients = _connect(loop, pool, [FakeSocket(), stuck])
+    for client in clients:
+        client.send('bye')
+
+    result = loop.run_until_complete(
+        pool.drain(timeout=0.05, concurrency=2, report_interval=0.01))
+    assert result['clients'] == 2
+    assert result['closed'] == 1
+    assert result['seconds'] < 1
+    assert not stuck.closed
+    loop.run_until_complete(clients[1].disconnect())
+
+
+def test_broadcast_visits_clients_in_chunks(app, loop):
+    pool = _pool(app, chunk_size=2)
+    sockets = [FakeSocket() for _ in range(5)]
+    clients = _connect(loop, pool, sockets)
+    loop.run_until_complete(clients[0].disconnect())
+
+    progress = []
+    message = Message('message', {'a': 1}, channel='_system:broadcast')
+    result = loop.run_until_complete(pool.broadcast(
+        message, lambda done, total: progress.append((done, total))))
+    loop.run_until_complete(asyncio.sleep(0))
+
+    assert progress == [(2, 5), (4, 5), (5, 5)]
+    assert result['clients'] == 5
+    assert result['delivered'] == 4
+    assert [len(ws.sent) for ws in sockets] == [0, 1, 1, 1, 1]
@@ -0,0 +1,104 @@
+import types
+
+from aiohttp.http_websocket import WebSocketReader, WebSocketWriter, \
+    WSMsgType
+
+from adsocket.ws import compression
+from adsocket.ws.compression import Deflate
+
+
+class Messages:
+    """
+    Queue websocket reader hands parsed messages to
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def feed_data(self, message, size):
+        self.messages.append(message)
+
+    def set_exception(self, exc):
+        raise exc
+
+
+def _parse(data):
+    messages = Messages()
+    reader = WebSocketReader(messages, max_msg_size=0, compress=True)
+    reader.feed_data(data)
+    return messages.messages
+
+
+def test_small_payload_is_sent_uncompressed():
+    frame = Deflate(15, 6, threshold=64).frame('{"type": "message"}')
+    assert not frame.data[0] & 0x40
+    message, = _parse(frame.data)
+    assert message.type == WSMsgType.TEXT
+    assert message.data == '{"type": "message"}'
+
+
+def test_big_payload_is_deflated():
+    payload = '{"data": "%s"}' % ('x' * 1000)
+    frame = Deflate(15, 6, threshold=64).frame(payload)
+    assert frame.data[0] & 0x40
+    assert len(frame) < len(payload)
+    message, = _parse(frame.data)
+    assert message.type == WSMsgType.TEXT
+    assert message.data == payload
+
+
+def test_binary_frame():
+    payload = bytes(range(256)) * 4
+    frame = Deflate(15, 6, threshold=64).frame(payload, binary=True)
+    message, = _parse(frame.data)
+    assert message.type == WSMsgType.BINARY
+    assert message.data == payload
+
+
+class Transport:
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+    def is_closing(self):
+        return False
+
+
+class Protocol:
+    drained = 0
+
+    async def _drain_helper(self):
+        self.drained += 1
+
+
+def test_frame_is_written_with_flow_control(loop):
+    transport, protocol = Transport(), Protocol()
+    ws = types.SimpleNamespace(
+        _writer=WebSocketWriter(protocol, transport, limit=100))
+    frame = Deflate(15, 6, threshold=1000).frame('x' * 60)
+
+    loop.run_until_complete(frame.write(ws))
+    assert protocol.drained == 0
+    loop.run_until_complete(frame.write(ws))
+    assert protocol.drained == 1
+    assert transport.written == [frame.data, frame.data]
+
+    frame.write_nowait(ws)
+    assert len(transport.written) == 3
+
+
+def _socket(compress, notakeover):
+    writer = WebSocketWriter(Protocol(), Transport(), compress=compress,
+                             notakeover=notakeover)
+    return types.SimpleNamespace(_writer=writer)
+
+
+def test_frames_are_shared_only_without_context_takeover():
+    assert compression.for_socket(_socket(15, False), 6, 64) is None
+    assert compression.for_socket(_socket(0, True), 6, 64) is None
+    deflate = compression.for_socket(_socket(15, True), 6, 64)
+    assert deflate is compression.for_socket(_socket(15, True), 6, 64)
+    assert compression.for_socket(_socket(12, True), 6, 64) is not deflate
@@ -0,0 +1,66 @@
+import asyncio
+
+from adsocket.core.channels import Channel
+from adsocket.core.message import Message
+
+
+class RecordingClient:
+
+    def __init__(self):
+        self.received = []
+
+    def deliver(self, msg):
+        self.received.append((msg.data, msg.seq))
+        return True
+
+
+def _channel(**options):
+    channel = Channel('prices', '1', conflate_key='symbol',
+                      conflate_interval=0.01, **options)
+    client = RecordingClient()
+    channel._clients.add(client)
+    return channel, client
+
+
+def _publish(loop, channel, *data):
+    for item in data:
+        loop.run_until_complete(
+            channel.publish(Message('message', item, channel='prices:1')))
+
+
+def _flush(loop):
+    loop.run_until_complete(asyncio.sleep(0.03))
+
+
+def test_newest_value_per_key_wins(loop):
+    channel, client = _channel()
+    _publish(loop, channel, {'symbol': 'A', 'price': 1},
+             {'symbol': 'B', 'price': 1}, {'symbol': 'A', 'price': 2})
+    assert client.received == []
+
+    _flush(loop)
+    assert [data for data, _ in client.received] == [
+        {'symbol': 'A', 'price': 2}, {'symbol': 'B', 'price': 1}]
+
+
+def test_messages_without_key_are_not_merged(loop):
+    channel, client = _channel()
+    _publish(loop, channel, {'price': 1}, {'price': 2}, 'text', 'text',
+             {'symbol': ['not', 'hashable'], 'price': 3})
+    _flush(loop)
+    assert [data for data, _ in client.received] == [
+        {'price': 1}, {'price': 2}, 'text', 'text',
+        {'symbol': ['not', 'hashable'], 'price': 3}]
+
+
+def test_conflated_messages_get_sequence_numbers(loop):
+    channel, client = _channel(history_size=10)
+    _publish(loop, channel, {'symbol': 'A', 'price': 1},
+             {'symbol': 'A', 'price': 2}, {'symbol': 'B', 'price': 1})
+    _flush(loop)
+    assert [seq for _, seq in client.received] == [1, 2]
+    assert channel.seq == 2
+
+    replayed = RecordingClient()
+    channel.replay(replayed, 0, channel.epoch)
+    assert replayed.received == client.received
@@ -0,0 +1,81 @@
+from adsocket.core.channels import Channel
+from adsocket.core.codecs import codecs
+from adsocket.core.message import Message
+
+
+class RecordingClient:
+
+    codec = codecs.json
+    deflate = None
+
+    def __init__(self):
+        self.received = []
+
+    def deliver(self, msg):
+        self.received.append(msg.seq)
+        msg.encode(self.codec)
+        return True
+
+
+def _publish(loop, channel, count):
+    for i in range(count):
+        message = Message('message', {'i': i}, channel=str(channel))
+        loop.run_until_complete(channel.publish(message))
+
+
+def _channel(loop, **options):
+    channel = Channel('history', '1', **options)
+    channel._clients.add(RecordingClient())
+    return channel
+
+
+def test_replay_missed(loop):
+    channel = _channel(loop, history_size=10)
+    _publish(loop, channel, 5)
+    client = RecordingClient()
+    result = channel.replay(client, 3, channel.epoch)
+    assert client.received == [4, 5]
+    assert result == {'seq': 5, 'epoch': channel.epoch, 'replayed': 2,
+                      'complete': True}
+
+
+def test_replay_beyond_history_is_incomplete(loop):
+    channel = _channel(loop, history_size=3)
+    _publish(loop, channel, 6)
+    result = channel.replay(RecordingClient(), 1, channel.epoch)
+    assert result['replayed'] == 3
+    assert not result['complete']
+
+
+def test_replay_from_recreated_channel_is_incomplete(loop):
+    old = _channel(loop, history_size=10)
+    _publish(loop, old, 8)
+    channel = _channel(loop, history_size=10)
+    _publish(loop, channel, 2)
+
+    client = RecordingClient()
+    result = channel.replay(client, 8, old.epoch)
+    assert client.received == [1, 2]
+    assert not result['complete']
+
+    # sequence ahead of the channel can not be trusted either
+    result = channel.replay(RecordingClient(), 8, channel.epoch)
+    assert not result['complete']
+
+    result = channel.replay(RecordingClient(), 1, None)
+    assert not result['complete']
+
+
+def test_history_max_bytes_counts_built_frames(loop):
+    channel = _channel(loop, history_size=100, history_max_bytes=200)
+    _publish(loop, channel, 20)
+    sizes = [size for _, _, size in channel._history]
+    assert sizes and all(size > 0 for size in sizes)
+    assert channel._history_bytes == sum(sizes) <= 200
+
+
+def test_without_members_nothing_is_encoded(loop):
+    channel = Channel('history', '1', history_size=10,
+                      history_max_bytes=200)
+    _publish(loop, channel, 3)
+    assert [msg._encoded for _, msg, _ in channel._history] == [None] * 3
@@ -0,0 +1,69 @@
+import asyncio
+import json
+
+from adsocket.core.broker.local import LocalBroker, frame
+
+
+class RecordingLocalBroker(LocalBroker):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dispatched = []
+
+    async def dispatch(self, message):
+        self.dispatched.append((message.channel, message.data))
+
+
+def _payload(channel, data):
+    return json.dumps({'type': 'message', 'channel': channel,
+                       'data': data}).encode()
+
+
+def _broker(app, loop, tmp_path):
+    broker = RecordingLocalBroker(loop, app,
+                                  socket_path=str(tmp_path / 'ingest.sock'),
+                                  max_frame_size=1024)
+    loop.run_until_complete(broker.read())
+    return broker
+
+
+async def _write(path, *frames):
+    reader, writer = await asyncio.open_unix_connection(path)
+    for data in frames:
+        writer.write(data)
+    await writer.drain()
+    return reader, writer
+
+
+def test_socket_ingest(app, loop, tmp_path):
+    broker = _broker(app, loop, tmp_path)
+    frames = [frame(_payload('chat:1', i)) for i in range(3)]
+    # frames may arrive split anywhere
+    data = b''.join(frames)
+    reader, writer = loop.run_until_complete(
+        _write(broker._socket_path, data[:3], data[3:20], data[20:]))
+    loop.run_until_complete(asyncio.sleep(0.05))
+    writer.close()
+    loop.run_until_complete(broker.close(app))
+
+    assert broker.dispatched == [('chat:1', 0), ('chat:1', 1),
+                                 ('chat:1', 2)]
+    assert not (tmp_path / 'ingest.sock').exists()
+
+
+def test_oversize_frame_closes_connection(app, loop, tmp_path):
+    broker = _broker(app, loop, tmp_path)
+    reader, writer = loop.run_until_complete(_write(
+        broker._socket_path, frame(_payload('chat:1', 'x' * 2000)),
+        frame(_payload('chat:1', 1))))
+    assert loop.run_until_complete(asyncio.wait_for(reader.read(), 1)) == b''
+    writer.close()
+    loop.run_until_complete(broker.close(app))
+    assert broker.dispatched == []
+
+
+def test_publish_skips_codec(app, loop):
+    broker = RecordingLocalBroker(loop, app)
+    loop.run_until_complete(broker.publish(
+        {'type': 'message', 'channel': 'chat:1', 'data': {'a': 1}}))
+    assert broker.dispatched == [('chat:1', {'a': 1})]
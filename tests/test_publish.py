@@ -0,0 +1,77 @@
+import types
+
+from adsocket.core.broker import Broker
+from adsocket.core.channels import Channel, ChannelPool
+from adsocket.core.codecs import codecs
+from adsocket.core.commands.commands import PublishCommand
+from adsocket.core.message import Message
+from adsocket.core.permissions import DummyPermission
+from adsocket.ws.client import Client
+
+from conftest import FakeSocket
+
+
+class WritableChannel(Channel):
+    permissions = [DummyPermission]
+
+
+class WritingBroker(Broker):
+
+    def __init__(self, app):
+        self.app = app
+        self.codec = codecs.json
+        self.written = []
+
+    async def channel_created(self, channel):
+        pass
+
+    async def read(self):
+        pass
+
+    async def write(self, msg):
+        self.written.append(self.encode(msg))
+
+    async def close(self, app):
+        pass
+
+
+class RecordingClient(Client):
+    __slots__ = ('responses',)
+
+    async def message(self, message):
+        self.responses.append(message.as_dict()['data']['result'])
+
+
+def _publish(app, loop, channel):
+    app['settings'] = types.SimpleNamespace(
+        BROADCAST={'channel': '_system:broadcast'}, CHANNEL_REMOVAL_DELAY=1)
+    app['broker'] = WritingBroker(app)
+    app['channels'] = ChannelPool(
+        channel_types={'chat': WritableChannel, 'news': Channel}, app=app)
+    client = RecordingClient(ws=FakeSocket())
+    client.responses = []
+    loop.run_until_complete(PublishCommand(app).execute(
+        client, Message('publish', {'text': 'hi'}, request_id=1,
+                        channel=channel)))
+    return client.responses[0], app['broker'].written
+
+
+def test_publish_writes_to_broker_with_origin(app, loop):
+    result, written = _publish(app, loop, 'chat:1')
+    assert result is True
+    message = app['broker'].decode(written[0])
+    assert message.channel == 'chat:1'
+    assert message.kwargs['origin'] == app['node_id']
+
+
+def test_read_only_channel(app, loop):
+    result, written = _publish(app, loop, 'news:1')
+    assert result == "Permission denied"
+    assert not written
+
+
+def test_unknown_type_and_broadcast_get_error_response(app, loop):
+    for channel in ('unknown:1', '_system:broadcast', 'chat', 'chat:*'):
+        result, written = _publish(app, loop, channel)
+        assert isinstance(result, str)
+        assert not written
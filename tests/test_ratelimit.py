@@ -0,0 +1,76 @@
+import types
+
+import pytest
+
+from adsocket.core import ratelimit
+from adsocket.core.ratelimit import RateLimitPolicy, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=100.0)
+    monkeypatch.setattr(ratelimit, 'time',
+                        types.SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_bucket_allows_burst_then_goes_into_debt():
+    bucket = TokenBucket(rate=10, burst=3, now=0.0)
+    assert [bucket.take(1, 0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take(1, 0.0) == pytest.approx(0.1)
+    assert bucket.take(1, 0.0) == pytest.approx(0.2)
+    # debt is paid by waiting
+    assert bucket.take(1, 0.3) == 0.0
+
+
+def test_bucket_does_not_refill_over_burst():
+    bucket = TokenBucket(rate=10, burst=2, now=0.0)
+    assert bucket.take(2, 1000.0) == 0.0
+    assert bucket.take(1, 1000.0) > 0
+
+
+def test_disabled_budgets():
+    policy = RateLimitPolicy(messages=None, bytes={'rate': 0},
+                             commands={'ping': None})
+    limiter = policy.limiter()
+    assert all(limiter.frame(10 ** 9) == 0 for _ in range(1000))
+    assert limiter.command('ping') == 0
+
+
+def test_command_budget(clock):
+    policy = RateLimitPolicy(commands={'subscribe': {'rate': 1, 'burst': 2}})
+    limiter = policy.limiter()
+    assert limiter.command('subscribe') == 0
+    assert limiter.command('subscribe') == 0
+    assert limiter.command('subscribe') == pytest.approx(1.0)
+    assert limiter.command('publish') == 0
+
+
+def test_message_over_several_buckets_is_one_violation(clock):
+    policy = RateLimitPolicy(
+        messages={'rate': 1, 'burst': 1}, bytes={'rate': 1, 'burst': 1},
+        commands={'subscribe': {'rate': 1, 'burst': 1}}, max_violations=3)
+    limiter = policy.limiter()
+    limiter.frame(1)
+    limiter.command('subscribe')
+    for violations in (1, 2, 3):
+        assert limiter.frame(100)
+        assert limiter.command('subscribe')
+        assert limiter.violations == violations
+        assert not limiter.exceeded()
+    limiter.frame(100)
+    assert limiter.exceeded()
+
+
+def test_violations_count_in_a_row(clock):
+    policy = RateLimitPolicy(messages={'rate': 1, 'burst': 1},
+                             max_violations=1)
+    limiter = policy.limiter()
+    limiter.frame(1)
+    assert limiter.frame(1)
+    assert limiter.violations == 1
+    clock.now += 10
+    assert not limiter.frame(1)
+    assert not limiter.exceeded()
+    assert limiter.frame(1)
+    assert limiter.violations == 1
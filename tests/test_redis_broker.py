@@ -0,0 +1,133 @@
+import pytest
+
+from adsocket.core.channels import Channel
+from adsocket.core.trie import PrefixTrie
+
+from conftest import App
+
+pytest.importorskip('aioredis')
+
+from adsocket.core.broker.redis import CHANNEL, STATIC, TYPE, \
+    RedisBroker  # noqa
+
+
+class FakeRedis:
+    """
+    Redis connection recording (un)subscriptions
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    async def subscribe(self, name):
+        self.calls.append(('subscribe', name))
+
+    async def psubscribe(self, name):
+        self.calls.append(('psubscribe', name))
+
+    async def unsubscribe(self, name):
+        self.calls.append(('unsubscribe', name))
+
+    async def punsubscribe(self, name):
+        self.calls.append(('punsubscribe', name))
+
+
+class FakeReceiver:
+
+    def channel(self, name):
+        return name
+
+    def pattern(self, name):
+        return name
+
+
+class FakePool:
+
+    def __init__(self, uids=(), patterns=()):
+        self._uids = set(uids)
+        self._patterns = PrefixTrie()
+        for uid in patterns:
+            channel_type, channel_id = uid.split(':')
+            self._patterns.add(channel_id[:-1],
+                               Channel(channel_type, channel_id))
+
+    def has_uid(self, uid):
+        return uid in self._uids
+
+    def match_patterns(self, uid):
+        return self._patterns.match(uid.split(':')[1])
+
+
+def _broker(subscription, loop, pool=None):
+    app = App(channels=pool or FakePool())
+    broker = RedisBroker('redis://localhost', 0, loop, app,
+                         channels=('adsocket',), subscription=subscription,
+                         prefix='ws:')
+    broker._redis = FakeRedis()
+    broker._subscribe = FakeReceiver()
+    return broker
+
+
+def test_static_mode_ignores_channels(loop):
+    broker = _broker(STATIC, loop)
+    loop.run_until_complete(broker.channel_created(Channel('chat', '1')))
+    loop.run_until_complete(broker.channel_removed(Channel('chat', '1')))
+    assert broker._redis.calls == []
+    assert broker._channel_from_name(b'adsocket') is None
+    assert broker.decode(b'{"type": "message", "data": 1}',
+                         b'adsocket').channel is None
+
+
+def test_channel_mode_subscribes_every_channel(loop):
+    broker = _broker(CHANNEL, loop)
+    chat, pattern = Channel('chat', '1'), Channel('order', 'eu-*')
+    for channel in (chat, pattern):
+        loop.run_until_complete(broker.channel_created(channel))
+    for channel in (chat, pattern):
+        loop.run_until_complete(broker.channel_removed(channel))
+
+    assert broker._redis.calls == [
+        ('subscribe', 'ws:chat:1'),
+        ('psubscribe', 'ws:order:eu-*'),
+        ('unsubscribe', 'ws:chat:1'),
+        ('punsubscribe', 'ws:order:eu-*'),
+    ]
+    msg = broker.decode(b'{"type": "message", "data": 1}', b'ws:chat:1')
+    assert msg.channel == 'chat:1'
+
+
+def test_type_mode_subscribes_once_per_type(loop):
+    broker = _broker(TYPE, loop)
+    one, two = Channel('chat', '1'), Channel('chat', '2')
+    for channel in (one, two, Channel('order', '1')):
+        loop.run_until_complete(broker.channel_created(channel))
+    loop.run_until_complete(broker.channel_removed(one))
+    assert broker._redis.calls == [
+        ('psubscribe', 'ws:chat:*'),
+        ('psubscribe', 'ws:order:*'),
+    ]
+
+    loop.run_until_complete(broker.channel_removed(two))
+    assert broker._redis.calls[-1] == ('punsubscribe', 'ws:chat:*')
+    assert broker._type_refs == {'order': 1}
+
+
+def test_pattern_copy_is_taken_once(loop):
+    pool = FakePool(uids={'order:eu-1'},
+                    patterns=('order:eu-*', 'order:eu-cz*'))
+    broker = _broker(CHANNEL, loop, pool)
+
+    # channel itself is subscribed, its own copy is enough
+    assert not broker._accept_pattern_message(b'ws:order:eu-*',
+                                              b'ws:order:eu-1')
+    # only the longest matching pattern takes the message
+    assert broker._accept_pattern_message(b'ws:order:eu-cz*',
+                                          b'ws:order:eu-cz-1')
+    assert not broker._accept_pattern_message(b'ws:order:eu-*',
+                                              b'ws:order:eu-cz-1')
+    assert not broker._accept_pattern_message(b'ws:order:us-*',
+                                              b'ws:order:us-1')
+
+    type_broker = _broker(TYPE, loop, pool)
+    assert type_broker._accept_pattern_message(b'ws:order:*',
+                                               b'ws:order:eu-1')
@@ -0,0 +1,64 @@
+import pytest
+
+from conftest import App
+
+pytest.importorskip('aioredis')
+
+from adsocket.core.broker.redis_streams import RedisStreamsBroker  # noqa
+
+
+class FakeStreams:
+    """
+    Redis connection serving stream entries once and remembering offsets
+    """
+
+    def __init__(self, broker, entries):
+        self._broker = broker
+        self._entries = entries
+        self.stored = {}
+
+    async def xread(self, streams, timeout, count, latest_ids):
+        if not self._entries:
+            self._broker._closing = True
+        batch, self._entries = self._entries, []
+        return batch
+
+    async def hmset(self, key, *pairs):
+        self.stored.update(zip(pairs[::2], pairs[1::2]))
+
+
+def _entry(entry_id, data):
+    payload = (b'{"type": "message", "channel": "chat:1", "data": %d}'
+               % data)
+    return b'adsocket', entry_id.encode(), {b'message': payload}
+
+
+def test_offset_moves_only_after_dispatch(loop):
+    app = App()
+    broker = RedisStreamsBroker('redis://localhost', 0, loop, app,
+                                start_id='0-0', offset_key='offsets')
+    broker._positions = dict(broker._offsets)
+    done = []
+
+    async def feed(key, payload, callback):
+        done.append(callback)
+        return True
+
+    broker.feed = feed
+    redis = FakeStreams(broker, [_entry('1-0', 1), _entry('2-0', 2),
+                                 _entry('3-0', 3)])
+    loop.run_until_complete(broker._consume(redis))
+
+    assert broker._positions == {'adsocket': '3-0'}
+    assert broker._offsets == {'adsocket': '0-0'}
+    assert redis.stored == {}
+
+    done[1]()
+    assert broker._offsets == {'adsocket': '0-0'}
+    done[0]()
+    assert broker._offsets == {'adsocket': '2-0'}
+    done[2]()
+    assert broker._offsets == {'adsocket': '3-0'}
+
+    loop.run_until_complete(broker._commit(redis))
+    assert redis.stored == {'adsocket': '3-0'}
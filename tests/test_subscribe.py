@@ -0,0 +1,54 @@
+import types
+
+from adsocket.core.channels import Channel, ChannelPool
+from adsocket.core.commands.commands import SubscribeCommand
+from adsocket.core.message import Message
+from adsocket.core.permissions import Permission
+from adsocket.ws.client import Client
+
+from conftest import FakeSocket
+
+
+class BrokenBatchPermission(Permission):
+
+    async def can_join(self, channel, client, message):
+        return channel.channel_id != 'secret'
+
+    async def can_join_many(self, channels, client, message):
+        raise ConnectionError("backend is down")
+
+
+class BatchChannel(Channel):
+    permissions = [BrokenBatchPermission]
+
+
+class RecordingClient(Client):
+    __slots__ = ('responses',)
+
+    async def message(self, message):
+        self.responses.append(message.as_dict())
+
+
+def _subscribe(app, loop, channels):
+    app['settings'] = types.SimpleNamespace(
+        SUBSCRIBE={'concurrency': 4, 'max_channels': 10},
+        CHANNEL_REMOVAL_DELAY=1)
+    app['channels'] = ChannelPool(channel_types={'batch': BatchChannel},
+                                  app=app)
+    client = RecordingClient(ws=FakeSocket())
+    client.responses = []
+    loop.run_until_complete(SubscribeCommand(app).execute(
+        client, Message('subscribe', {}, request_id=1, channel=channels)))
+    return client.responses
+
+
+def test_failing_batch_permission_falls_back_to_single_checks(app, loop):
+    responses = _subscribe(
+        app, loop, ['batch:1', 'batch:secret', 'unknown:1', 'batch:2'])
+    assert len(responses) == 1
+    assert responses[0]['data']['result'] == {
+        'batch:1': True,
+        'batch:secret': "Permission denied",
+        'unknown:1': "Channel not found",
+        'batch:2': True,
+    }
@@ -0,0 +1,103 @@
+import asyncio
+
+from adsocket.core.timers import TimerWheel
+
+
+class FakeClock:
+    """
+    Loop stand-in whose time moves only when the test says so
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.handle = None
+
+    def time(self):
+        return self.now
+
+    def call_at(self, when, callback):
+        self.handle = asyncio.Handle(callback, (), asyncio.get_event_loop())
+        return self.handle
+
+    def advance(self, seconds):
+        self.now += seconds
+        handle, self.handle = self.handle, None
+        if handle is not None and not handle.cancelled():
+            handle._run()
+
+
+def test_timer_fires_after_delay():
+    clock = FakeClock()
+    wheel = TimerWheel(clock, resolution=1.0, slots=8)
+    fired = []
+    wheel.schedule(3, fired.append, 'a')
+
+    for _ in range(2):
+        clock.advance(1.0)
+    assert fired == []
+    clock.advance(1.0)
+    assert fired == ['a']
+    assert len(wheel) == 0
+    assert clock.handle is None
+
+
+def test_cancelled_timer_does_not_fire():
+    clock = FakeClock()
+    wheel = TimerWheel(clock, resolution=1.0, slots=8)
+    fired = []
+    timer = wheel.schedule(1, fired.append, 'a')
+    assert timer.active
+    timer.cancel()
+    timer.cancel()
+    assert not timer.active
+
+    for _ in range(4):
+        clock.advance(1.0)
+    assert fired == []
+
+
+def test_delay_longer_than_wheel_takes_rounds():
+    clock = FakeClock()
+    wheel = TimerWheel(clock, resolution=1.0, slots=4)
+    fired = []
+    wheel.schedule(10, fired.append, 'late')
+    wheel.schedule(2, fired.append, 'early')
+
+    for second in range(1, 12):
+        clock.advance(1.0)
+        if second == 3:
+            assert fired == ['early']
+    assert fired == ['early', 'late']
+
+
+def test_busy_loop_catches_up():
+    clock = FakeClock()
+    wheel = TimerWheel(clock, resolution=1.0, slots=8)
+    fired = []
+    wheel.schedule(2, fired.append, 'a')
+    wheel.schedule(5, fired.append, 'b')
+
+    clock.advance(7.0)
+    assert sorted(fired) == ['a', 'b']
+
+
+def test_coroutine_callback_runs_as_task(loop):
+    wheel = TimerWheel(loop, resolution=0.01, slots=8)
+    fired = asyncio.Event()
+
+    async def callback():
+        fired.set()
+
+    wheel.schedule(0.01, callback)
+    loop.run_until_complete(asyncio.wait_for(fired.wait(), 1))
+    wheel.close()
+
+
+def test_close_forgets_timers():
+    clock = FakeClock()
+    wheel = TimerWheel(clock, resolution=1.0, slots=8)
+    timer = wheel.schedule(1, print)
+    wheel.close()
+    assert not timer.active
+    assert len(wheel) == 0
+    assert clock.handle.cancelled()
@@ -0,0 +1,46 @@
+from adsocket.core.trie import PrefixTrie
+
+
+def test_match_returns_shortest_prefix_first():
+    trie = PrefixTrie()
+    trie.add('eu-', 'eu')
+    trie.add('eu-cz', 'cz')
+    trie.add('us-', 'us')
+    trie.add('', 'all')
+
+    assert trie.match('eu-cz-1') == ['all', 'eu', 'cz']
+    assert trie.match('us-1') == ['all', 'us']
+    assert trie.match('asia') == ['all']
+    assert len(trie) == 4
+
+
+def test_add_replaces_value():
+    trie = PrefixTrie()
+    trie.add('eu-', 1)
+    trie.add('eu-', 2)
+    assert trie.match('eu-1') == [2]
+    assert len(trie) == 1
+
+
+def test_remove_prunes_empty_nodes():
+    trie = PrefixTrie()
+    trie.add('eu-', 'eu')
+    trie.add('eu-cz', 'cz')
+
+    assert trie.remove('eu-cz') == 'cz'
+    assert trie.match('eu-cz') == ['eu']
+    assert 'c' not in trie._root.children['e'].children['u'] \
+        .children['-'].children
+
+    assert trie.remove('eu-') == 'eu'
+    assert trie._root.children == {}
+    assert len(trie) == 0
+
+
+def test_remove_missing_prefix():
+    trie = PrefixTrie()
+    trie.add('eu-cz', 'cz')
+    assert trie.remove('us-') is None
+    assert trie.remove('eu-') is None
+    assert trie.match('eu-cz') == ['cz']
+    assert len(trie) == 1
@@ -0,0 +1,80 @@
+import asyncio
+
+from adsocket.core.broker import Broker
+from adsocket.core.broker.ventilator import Ventilator
+from adsocket.core.codecs import codecs
+
+
+class ListBroker(Broker):
+    """
+    Broker remembering which messages it dispatched
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.codec = codecs.json
+        self.dispatched = []
+
+    async def dispatch(self, message):
+        self.dispatched.append((message.channel, message.data))
+
+    async def read(self):
+        pass
+
+    async def write(self, msg):
+        pass
+
+    async def close(self, app):
+        pass
+
+
+def _payload(channel, data):
+    return codecs.json.encode({'type': 'message', 'channel': channel,
+                               'data': data})
+
+
+def test_single_broker_channel_is_spread_over_workers(app, loop):
+    broker = ListBroker(app)
+    ventilator = Ventilator(broker, workers=4)
+    for i in range(40):
+        loop.run_until_complete(
+            ventilator.put(b'adsocket', _payload(f'chat:{i % 8}', i)))
+    used = [queue for queue in ventilator._queues if queue.qsize()]
+    assert len(used) > 1
+
+
+def test_order_within_channel_is_kept(app, loop):
+    broker = ListBroker(app)
+    ventilator = Ventilator(broker, workers=4, batch_size=3)
+    ventilator.start()
+    for i in range(40):
+        loop.run_until_complete(
+            ventilator.put(b'adsocket', _payload(f'chat:{i % 8}', i)))
+    loop.run_until_complete(asyncio.sleep(0.01))
+    ventilator.stop()
+
+    assert len(broker.dispatched) == 40
+    for channel in {channel for channel, _ in broker.dispatched}:
+        data = [d for c, d in broker.dispatched if c == channel]
+        assert data == sorted(data)
+
+
+def test_done_is_called_after_dispatch(app, loop):
+    broker = ListBroker(app)
+    ventilator = Ventilator(broker, workers=2)
+    done = []
+
+    def callback(i):
+        return lambda: done.append((i, (f'chat:{i}', i) in broker.dispatched))
+
+    for i in range(4):
+        loop.run_until_complete(
+            ventilator.put(b'adsocket', _payload(f'chat:{i}', i), callback(i)))
+    loop.run_until_complete(
+        ventilator.put(b'adsocket', b'not json', callback('bad')))
+    assert done == [('bad', False)]
+
+    ventilator.start()
+    loop.run_until_complete(asyncio.sleep(0.01))
+    ventilator.stop()
+    assert sorted(done[1:]) == [(i, True) for i in range(4)]